@@ -1,57 +1,77 @@
-import os
 import logging
+import importlib
 from dotenv import load_dotenv
-from utils import utils
+from utils import scheduler, tracing
 from models import Video
-import torch
-
-from tools.animation_artist import AnimationArtistTool
-from tools.music_composer import MusicComposerTool
-from tools.producer import ProducerTool
-from tools.researcher import ResearcherTool
-from tools.script_writer import ScriptWriterTool
-from tools.sound_engineer import SoundEngineerTool
-from tools.storyboard_artist import StoryBoardArtistTool
-from tools.thumbnail_artist import ThumbnailArtistTool
-from tools.voiceover_artist import VoiceOverArtistTool
-from tools.youtube_distributor import YoutubeDistributorTool
 
 logger = logging.getLogger(__name__)
 
+# All the production steps, in the order used by --step.
+# The tools pull in torch, bark, diffusers ... so they are only imported when
+# their step runs, see get_tool.
+TOOLS = {
+    "researcher": "tools.researcher.ResearcherTool",
+    "scriptwriter": "tools.script_writer.ScriptWriterTool",
+    "voiceoverartist": "tools.voiceover_artist.VoiceOverArtistTool",
+    "storyboardartist": "tools.storyboard_artist.StoryBoardArtistTool",
+    "animationartist": "tools.animation_artist.AnimationArtistTool",
+    "musiccomposer": "tools.music_composer.MusicComposerTool",
+    "soundengineer": "tools.sound_engineer.SoundEngineerTool",
+    "producer": "tools.producer.ProducerTool",
+    "thumbnailartist": "tools.thumbnail_artist.ThumbnailArtistTool",
+    "youtubedistributor": "tools.youtube_distributor.YoutubeDistributorTool",
+}
 
-def make_video(video: Video, step: str, single_step: bool = False):
-    prompt = video.prompt
-    working_dir = video.output_dir
-    os.makedirs(working_dir, exist_ok=True)
-    utils.set_prefix(working_dir)
+
+def get_tool(name: str):
+    """Import and return the tool class of a step."""
+    module_name, class_name = TOOLS[name].rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def normalize_step(step: str) -> str:
+    """Turn a step label (e.g. "Script Writer") into a tool name."""
+    return step.lower().replace(" ", "")
+
+
+def get_tools(video: Video, step: str, single_step: bool = False):
+    """Set up the output dir and create the tools from step onwards."""
+    video.workspace.create()
     load_dotenv()
 
-    all_tools = [
-        ResearcherTool(video=video),
-        ScriptWriterTool(video=video),
-        VoiceOverArtistTool(video=video),
-        StoryBoardArtistTool(video=video),
-        AnimationArtistTool(video=video),
-        MusicComposerTool(video=video),
-        SoundEngineerTool(video=video),
-        ProducerTool(video=video),
-        ThumbnailArtistTool(video=video),
-        YoutubeDistributorTool(video=video),
-    ]
-
-    # create tools only from step onwards
-    tools = []
-    for _, tool in enumerate(all_tools):
-        if tool.name == step.lower().replace(" ", ""):
-            tools.append(tool)
-        elif len(tools) > 0:
-            tools.append(tool)
+    names = list(TOOLS.keys())
+    start = names.index(normalize_step(step))
+    names = names[start : start + 1] if single_step else names[start:]
+    tools = [get_tool(name)(video=video) for name in names]
 
     logger.info("Starting at tool %s", tools[0].name)
-    for t in tools:
-        t.run(prompt)
-        torch.cuda.empty_cache()
-        if single_step:
-            logger.info("Single step mode, stopping after %s", t.name)
-            return "Single step mode, stopped at %s" % t.name
+    return tools
+
+
+def make_video(video: Video, step: str, single_step: bool = False):
+    tools = get_tools(video, step, single_step)
+    with tracing.trace() as trace:
+        try:
+            with tracing.span("make_video", category="video", step=step):
+                scheduler.run_tools(tools, video.prompt)
+        finally:
+            trace.write(video.output_dir)
+    if single_step:
+        logger.info("Single step mode, stopping after %s", tools[0].name)
+        return "Single step mode, stopped at %s" % tools[0].name
+    return "Done all steps"
+
+
+async def amake_video(video: Video, step: str, single_step: bool = False):
+    """Async version of make_video, the tools run on the current event loop."""
+    tools = get_tools(video, step, single_step)
+    with tracing.trace() as trace:
+        try:
+            with tracing.span("make_video", category="video", step=step):
+                await scheduler.arun_tools(tools, video.prompt)
+        finally:
+            trace.write(video.output_dir)
+    if single_step:
+        logger.info("Single step mode, stopping after %s", tools[0].name)
+        return "Single step mode, stopped at %s" % tools[0].name
     return "Done all steps"
@@ -0,0 +1,4 @@
+"""Benchmarks of the production code, run from the repository root.
+
+python -m benchmarks.micro    # CPU only micro benchmarks of the hot paths
+"""
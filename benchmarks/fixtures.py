@@ -0,0 +1,191 @@
+"""Synthetic production files for the benchmarks, no models needed.
+
+`make_project` lays out an output dir the way the tools leave it (script.yaml,
+voiceover sentence jsons and wavs, storyboard pngs, music chunks), so the code
+reading them can be timed without running the production.
+"""
+import os
+import json
+import wave
+import random
+
+import numpy as np
+import yaml
+
+from benchmarks.harness import ROOT
+
+SAMPLE_RATE = 48000
+
+
+def get_actor_names() -> list[str]:
+    """The actors of the repository cast, the script references them by name."""
+    actors_path = os.path.join(ROOT, "cast", "actors")
+    return sorted(
+        f.split(".")[0] for f in os.listdir(actors_path) if f.endswith(".yaml")
+    )
+
+
+def write_wav(path: str, audio: np.ndarray, sample_rate: int = SAMPLE_RATE):
+    """Write a mono float [-1, 1] array as a 16 bit wav."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+def speech_like(duration: float, sample_rate: int = SAMPLE_RATE, seed: int = 0):
+    """Bursts of modulated noise separated by pauses, roughly like a voiceover."""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+    audio = rng.normal(0, 0.2, n) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t))
+    # Pauses of half a second every ~2 seconds
+    envelope = (t % 2.5) < 2.0
+    return (audio * envelope).astype(np.float32)
+
+
+def music_like(duration: float, sample_rate: int = SAMPLE_RATE, seed: int = 0):
+    """A few detuned sines, like a sustained chord."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    audio = sum(
+        np.sin(2 * np.pi * frequency * t) for frequency in rng.uniform(110, 880, size=4)
+    )
+    return (0.2 * audio).astype(np.float32)
+
+
+def make_script(num_scenes: int, lines_per_scene: int, seed: int = 0) -> list:
+    """A script.yaml structure with the given number of scenes and lines."""
+    rng = random.Random(seed)
+    actors = get_actor_names()
+    script = []
+    for scene_index in range(num_scenes):
+        characters = [
+            {"name": f"Character {i}", "actor": actor}
+            for i, actor in enumerate(rng.sample(actors, min(3, len(actors))))
+        ]
+        script.append(
+            {
+                "title": f"Scene {scene_index}",
+                "description": "A description of the scene " * 5,
+                "characters": characters,
+                "dialogue": [
+                    {
+                        "character": rng.choice(characters)["name"],
+                        "content": "This is a line. It has sentences. Three of them.",
+                    }
+                    for _ in range(lines_per_scene)
+                ],
+            }
+        )
+    return script
+
+
+def make_project(
+    output_dir: str,
+    num_scenes: int = 20,
+    lines_per_scene: int = 5,
+    sentences_per_line: int = 3,
+    takes_per_sentence: int = 2,
+    image_size: tuple[int, int] = (768, 512),
+    num_music_chunks: int = 4,
+    seed: int = 0,
+) -> dict:
+    """Write a synthetic project into output_dir, returns what was written."""
+    from utils import utils, timeline
+    from utils.workspace import Workspace
+
+    workspace = Workspace(output_dir)
+    workspace.create()
+    rng = random.Random(seed)
+
+    script = make_script(num_scenes, lines_per_scene, seed)
+    with open(workspace.script, "w") as f:
+        yaml.dump(script, f)
+
+    # Voiceover sentences, with the take files the tools also leave around and
+    # the timeline index
+    sentence_wavs = []
+    start = 0.0
+    for scene_index, scene in enumerate(script):
+        actors = {c["name"]: c["actor"] for c in scene["characters"]}
+        for line_index, line in enumerate(scene["dialogue"]):
+            for sentence_index in range(sentences_per_line):
+                name = (
+                    f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}"
+                )
+                result = {
+                    "sentence": "This is a line.",
+                    "duration": round(rng.uniform(1.0, 4.0), 3),
+                    "actor": actors[line["character"]],
+                }
+                with open(
+                    os.path.join(workspace.voiceover_path, f"{name}.json"), "w"
+                ) as f:
+                    json.dump(result, f)
+                timeline.append(
+                    workspace,
+                    scene_index,
+                    line_index,
+                    sentence_index,
+                    start=start,
+                    wav=os.path.join(utils.VOICEOVER_PATH, f"{name}.wav"),
+                    **result,
+                )
+                start += result["duration"]
+                for take in range(takes_per_sentence):
+                    take_file = os.path.join(
+                        workspace.voiceover_path, f"{name}-take_{take}.json"
+                    )
+                    with open(take_file, "w") as f:
+                        json.dump(result, f)
+                sentence_wavs.append(
+                    os.path.join(workspace.voiceover_path, f"{name}.wav")
+                )
+
+    # Only a handful of sentence wavs are written, the readers only list the jsons
+    for i, path in enumerate(sentence_wavs[:10]):
+        write_wav(path, speech_like(3.0, seed=i))
+
+    voiceover = speech_like(60.0, seed=seed)
+    write_wav(workspace.voiceover_wav_file, voiceover)
+
+    music_chunks = []
+    for i in range(num_music_chunks):
+        path = os.path.join(workspace.music_path, f"music-0-{i}.wav")
+        write_wav(path, music_like(15.0, seed=i))
+        music_chunks.append(path)
+    music_file = os.path.join(workspace.music_path, "music.wav")
+    write_wav(music_file, music_like(60.0, seed=seed))
+
+    images = []
+    try:
+        import cv2
+
+        np_rng = np.random.default_rng(seed)
+        width, height = image_size
+        for scene_index in range(num_scenes):
+            # Noise with a few bright blobs so ORB finds keypoints
+            image = (np_rng.random((height, width, 3)) * 64).astype(np.uint8)
+            for _ in range(10):
+                center = (int(np_rng.integers(width)), int(np_rng.integers(height)))
+                radius = int(np_rng.integers(10, 60))
+                cv2.circle(image, center, radius, (255, 255, 255), -1)
+            path = os.path.join(workspace.storyboard_path, f"{scene_index:03}_00.png")
+            cv2.imwrite(path, image)
+            images.append(path)
+    except ImportError:
+        pass
+
+    return {
+        "output_dir": output_dir,
+        "workspace": workspace,
+        "num_scenes": num_scenes,
+        "num_sentences": len(sentence_wavs),
+        "voiceover_file": workspace.voiceover_wav_file,
+        "voiceover": voiceover,
+        "music_file": music_file,
+        "music_chunks": music_chunks,
+        "images": images,
+    }
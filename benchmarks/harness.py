@@ -0,0 +1,123 @@
+"""Time benchmarks and report the results as JSON."""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Result:
+    """The timings of a benchmark, in seconds per call."""
+
+    name: str
+    rounds: int = 0
+    min_s: Optional[float] = None
+    median_s: Optional[float] = None
+    mean_s: Optional[float] = None
+    stdev_s: Optional[float] = None
+    params: dict = field(default_factory=dict)
+    skipped: Optional[str] = None
+
+
+def measure(
+    name: str, fn: Callable[[], object], rounds: int = 5, params: dict = None
+) -> Result:
+    """Call fn once to warm up, then `rounds` times, timing every call."""
+    fn()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(name, timings, params)
+
+
+def summarize(name: str, timings: list[float], params: dict = None) -> Result:
+    """Make a result out of timings measured elsewhere."""
+    rounds = len(timings)
+    return Result(
+        name=name,
+        rounds=rounds,
+        min_s=min(timings),
+        median_s=statistics.median(timings),
+        mean_s=statistics.mean(timings),
+        stdev_s=statistics.stdev(timings) if rounds > 1 else 0.0,
+        params=params or {},
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results: list[Result], output: Optional[str] = None) -> dict:
+    """Print a table of the results and write them as JSON to `output` (or stdout)."""
+    for result in results:
+        if result.skipped:
+            print(f"{result.name:<52} skipped: {result.skipped}", file=sys.stderr)
+        else:
+            print(
+                f"{result.name:<52} median {result.median_s * 1000:>10.3f} ms"
+                f"  min {result.min_s * 1000:>10.3f} ms",
+                file=sys.stderr,
+            )
+
+    data = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": time.time(),
+        },
+        "benchmarks": [asdict(result) for result in results],
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(data, f, indent=2)
+    else:
+        json.dump(data, sys.stdout, indent=2)
+        print()
+    return data
+
+
+def compare(data: dict, baseline_path: str, tolerance: float = 0.1) -> bool:
+    """Print the change of every median against a baseline report.
+
+    Returns False if any benchmark got slower by more than `tolerance`.
+    """
+    with open(baseline_path) as f:
+        baseline = {
+            result["name"]: result
+            for result in json.load(f)["benchmarks"]
+            if result.get("median_s")
+        }
+
+    ok = True
+    for result in data["benchmarks"]:
+        before = baseline.get(result["name"])
+        if before is None or not result.get("median_s"):
+            continue
+        ratio = result["median_s"] / before["median_s"]
+        regressed = ratio > 1 + tolerance
+        ok = ok and not regressed
+        print(
+            f"{result['name']:<52} {ratio:>6.2f}x{'  REGRESSION' if regressed else ''}",
+            file=sys.stderr,
+        )
+    return ok
@@ -0,0 +1,193 @@
+"""CPU only micro benchmarks of the hot paths that don't run a model.
+
+Usage: python -m benchmarks.micro [--output results.json] [--baseline old.json]
+
+Every benchmark runs against a synthetic project (see benchmarks.fixtures),
+the ones whose dependencies are not installed are reported as skipped.
+"""
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+from benchmarks.harness import ROOT, Result, measure, report, compare
+from benchmarks import fixtures
+
+
+def bench_get_scenes(project):
+    from utils import parsers
+
+    params = {"scenes": project["num_scenes"], "sentences": project["num_sentences"]}
+    return lambda: parsers.get_scenes(project["workspace"]), params
+
+
+def bench_get_scenes_cold(project):
+    from utils import parsers
+
+    params = {"scenes": project["num_scenes"], "sentences": project["num_sentences"]}
+
+    def run():
+        # Parse everything again, as after a tool wrote to the project
+        parsers.invalidate(project["workspace"])
+        parsers.get_scenes(project["workspace"])
+
+    return run, params
+
+
+def bench_get_voiceover_lines(project):
+    from utils import parsers
+
+    params = {"sentences": project["num_sentences"]}
+    return lambda: parsers.get_voiceover_lines(project["workspace"]), params
+
+
+def bench_timeline_long_form(project):
+    from utils.timeline import Timeline
+
+    # A long form script, many times the sentences of the fixture project
+    num_scenes, num_sentences = 200, 5000
+    entries = [
+        {
+            "scene_index": i * num_scenes // num_sentences,
+            "line_index": i,
+            "sentence_index": 0,
+            "actor": "derek",
+            "sentence": "A sentence.",
+            "duration": 2.5,
+        }
+        for i in range(num_sentences)
+    ]
+
+    def run():
+        timeline = Timeline.from_entries(entries)
+        timeline.scene_durations(num_scenes)
+        timeline.scene_starts(num_scenes)
+        timeline.find(timeline.starts + 1.0)
+
+    return run, {"scenes": num_scenes, "sentences": num_sentences}
+
+
+def bench_compute_snr(project):
+    from utils import voice_gen
+
+    take = fixtures.speech_like(5.0, seed=1)
+    params = {"seconds": 5.0, "sample_rate": fixtures.SAMPLE_RATE}
+    return lambda: voice_gen.compute_snr(take), params
+
+
+def bench_non_silence(project):
+    from utils import voice_gen
+
+    take = fixtures.speech_like(5.0, seed=1)
+    params = {"seconds": 5.0, "sample_rate": fixtures.SAMPLE_RATE}
+
+    def run():
+        voice_gen.non_silence_in_last_duration_audio(take, fixtures.SAMPLE_RATE)
+
+    return run, params
+
+
+def bench_find_interest_points(project):
+    from tools.animation_artist import AnimationArtistTool
+
+    if not project["images"]:
+        raise ImportError("No storyboard images, opencv is needed to write them")
+    image = project["images"][0]
+
+    def run():
+        # The method doesn't use the tool instance
+        AnimationArtistTool.find_interest_points_by_thirds(None, image)
+
+    return run, {"image": os.path.basename(image)}
+
+
+def bench_duck(project):
+    from tools.sound_engineer import duck
+
+    output = os.path.join(project["output_dir"], "ducked.wav")
+
+    def run():
+        duck(project["voiceover_file"], project["music_file"], output)
+
+    return run, {"seconds": 60.0}
+
+
+def bench_combine_music_with_crossfade(project):
+    from tools.sound_engineer import combine_music_with_crossfade
+
+    output = os.path.join(project["output_dir"], "crossfaded.wav")
+
+    def run():
+        # ffmpeg is not run with -y, it would wait on the overwrite prompt
+        if os.path.exists(output):
+            os.remove(output)
+        combine_music_with_crossfade(project["music_chunks"], output)
+
+    return run, {"chunks": len(project["music_chunks"])}
+
+
+def bench_numpy_to_audiosegment(project):
+    from utils import audio_utils
+
+    audio = project["voiceover"][: 30 * fixtures.SAMPLE_RATE]
+
+    def run():
+        audio_utils.numpy_to_audiosegment(audio, fixtures.SAMPLE_RATE)
+
+    return run, {"seconds": 30.0}
+
+
+# name -> function returning the call to time and the params to report
+BENCHMARKS = {
+    "parsers.get_scenes": bench_get_scenes,
+    "parsers.get_scenes.cold": bench_get_scenes_cold,
+    "parsers.get_voiceover_lines": bench_get_voiceover_lines,
+    "timeline.long_form": bench_timeline_long_form,
+    "voice_gen.compute_snr": bench_compute_snr,
+    "voice_gen.non_silence_in_last_duration_audio": bench_non_silence,
+    "AnimationArtistTool.find_interest_points_by_thirds": bench_find_interest_points,
+    "sound_engineer.duck": bench_duck,
+    "sound_engineer.combine_music_with_crossfade": bench_combine_music_with_crossfade,
+    "audio_utils.numpy_to_audiosegment": bench_numpy_to_audiosegment,
+}
+
+
+def run(rounds: int = 5, only: str = None, **project_params) -> list[Result]:
+    """Run the benchmarks (those with `only` in their name) on a fresh project."""
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        project = fixtures.make_project(output_dir, **project_params)
+        for name, benchmark in BENCHMARKS.items():
+            if only and only not in name:
+                continue
+            try:
+                fn, params = benchmark(project)
+                results.append(measure(name, fn, rounds, params))
+            except ImportError as e:
+                results.append(Result(name=name, skipped=f"missing dependency: {e}"))
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rounds", type=int, default=5, help="Timed calls per benchmark"
+    )
+    parser.add_argument(
+        "--only", help="Only run the benchmarks with this in their name"
+    )
+    parser.add_argument("--scenes", type=int, default=20, help="Scenes in the script")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    args = parser.parse_args()
+
+    # The cast and programs are looked up relative to the repository root
+    os.chdir(ROOT)
+    results = run(rounds=args.rounds, only=args.only, num_scenes=args.scenes)
+    data = report(results, args.output)
+    if args.baseline and not compare(data, args.baseline):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
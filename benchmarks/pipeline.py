@@ -0,0 +1,93 @@
+"""End to end benchmark of make_video with the fake model backend.
+
+Usage: python -m benchmarks.pipeline [--rounds 3] [--output results.json]
+
+Every round makes a video from scratch in a fresh output dir (cold) and then
+makes it again in the same dir (warm, everything is memoized), with the
+stand-in models of utils.fake_backend. The time per step comes from the trace
+spans, the trace and summary of the last round are kept in --keep if given.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from benchmarks.harness import ROOT, Result, summarize, report, compare
+
+
+def make_video(working_dir: str, args) -> dict[str, float]:
+    """Make a video with the fake backend, returns the seconds spent per step."""
+    import main
+    from aicp import make_video
+    from utils import tracing
+
+    video = main.build_video(
+        prompt=args.prompt,
+        program=args.program,
+        director=args.director,
+        actors=args.actors,
+        config=args.production_config,
+        working_dir=working_dir,
+    )
+    make_video(video, "researcher")
+
+    # The spans of the video, as make_video wrote them
+    with open(os.path.join(video.output_dir, tracing.TRACE_FILE)) as f:
+        events = json.load(f)["traceEvents"]
+    durations = {}
+    for event in events:
+        if event.get("cat") in ("tool", "video"):
+            durations[event["name"]] = event["dur"] / 1e6
+    return durations
+
+
+def run(args) -> list[Result]:
+    from utils import fake_backend
+
+    fake_backend.set_backend("fake")
+    timings = defaultdict(list)
+    params = {
+        "director": args.director,
+        "program": args.program,
+        "production_config": args.production_config,
+        "actors": args.actors,
+    }
+    for _ in range(args.rounds):
+        working_dir = tempfile.mkdtemp(prefix="aicp-benchmark-")
+        try:
+            for phase in ("cold", "warm"):
+                for name, duration in make_video(working_dir, args).items():
+                    timings[f"pipeline.{phase}.{name}"].append(duration)
+            if args.keep:
+                shutil.copytree(working_dir, args.keep, dirs_exist_ok=True)
+        finally:
+            shutil.rmtree(working_dir, ignore_errors=True)
+
+    return [summarize(name, values, params) for name, values in timings.items()]
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=3, help="Videos to make")
+    parser.add_argument("--prompt", default="The history of the paperclip")
+    parser.add_argument("--director", default="improved_director")
+    parser.add_argument("--program", default="one_minute_facts")
+    parser.add_argument("--production-config", default="fast_youtube_shorts_vo_based")
+    parser.add_argument("--actors", nargs="+", default=["derek"])
+    parser.add_argument("--keep", help="Copy the last video's output dir here")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare against a previous JSON result")
+    args = parser.parse_args()
+
+    # The cast and programs are looked up relative to the repository root
+    os.chdir(ROOT)
+    data = report(run(args), args.output)
+    if args.baseline and not compare(data, args.baseline):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
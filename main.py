@@ -1,29 +1,28 @@
 import os
 import logging
 
-from utils import utils
-from aicp import make_video
+from utils import utils, job_queue, fake_backend
+from aicp import make_video, amake_video, normalize_step, TOOLS
 from models import Director, ProductionConfig, Video, Program, Actor
 from argparse import ArgumentParser
-from ui.ui import make_ui
 
 logging.basicConfig(
     level=logging.DEBUG,
 )
 
+logger = logging.getLogger(__name__)
 
-def prep_video_params(
+
+def build_video(
     prompt,
     program: str,
     director: str,
-    actors: str,
+    actors: list[str],
     config: str,
     working_dir,
-    step: str,
-    single_step: bool,
 ):
-    """Prepare the video parameters for the make_video function"""
-    video = Video(
+    """Build the video from the names of its program, director, actors and config"""
+    return Video(
         prompt=prompt,
         director=Director.from_yaml(
             os.path.join(utils.DIRECTOR_PATH, director + ".yaml")
@@ -37,9 +36,51 @@ def prep_video_params(
         ),
         output_dir=working_dir,
     )
+
+
+def prep_video_params(
+    prompt,
+    program: str,
+    director: str,
+    actors: str,
+    config: str,
+    working_dir,
+    step: str,
+    single_step: bool,
+):
+    """Prepare the video parameters for the make_video function"""
+    video = build_video(prompt, program, director, actors, config, working_dir)
     return make_video(video, step, single_step)
 
 
+async def aprep_video_params(
+    prompt,
+    program: str,
+    director: str,
+    actors: str,
+    config: str,
+    working_dir,
+    step: str,
+    single_step: bool,
+):
+    """Async version of prep_video_params, used by the UI"""
+    video = build_video(prompt, program, director, actors, config, working_dir)
+    return await amake_video(video, step, single_step)
+
+
+def run_job_step(job: job_queue.Job, step: str):
+    """Run a single step of a queued job"""
+    video = build_video(
+        job.prompt,
+        job.program,
+        job.director,
+        job.actors,
+        job.config,
+        job.working_dir,
+    )
+    return make_video(video, step, single_step=True)
+
+
 parser = ArgumentParser()
 parser.add_argument("--ui", action="store_true", help="Launch the UI")
 parser.add_argument("--prompt", help="The prompt to use for the video")
@@ -52,16 +93,107 @@ parser.add_argument("--program", help="The program aka show to use for the video
 parser.add_argument("--output", help="The output directory to write to")
 parser.add_argument("--step", help="The step to start at", default="Researcher")
 parser.add_argument("--single-step", action="store_true", help="Run a single step")
+parser.add_argument(
+    "--enqueue", action="store_true", help="Queue the video instead of making it"
+)
+parser.add_argument(
+    "--enqueue-file",
+    help="Queue every line of a file (prompt | program | director | config | output | actors)",
+)
+parser.add_argument(
+    "--worker", action="store_true", help="Make the queued videos, step by step"
+)
+parser.add_argument(
+    "--drain",
+    action="store_true",
+    help="Stop the worker once the queue is empty instead of waiting for jobs",
+)
+parser.add_argument(
+    "--jobs-db", help="The job queue database", default=job_queue.JOBS_DB
+)
+parser.add_argument(
+    "--backend",
+    choices=fake_backend.BACKENDS,
+    default=fake_backend.BACKEND,
+    help="The model backend, fake runs the production offline with stand-in models",
+)
+
 
+def __getattr__(name):
+    """Build the UI on first access of `main.demo` (e.g. by `gradio main.py`).
+
+    Building it imports gradio and the voice models, which is slow, so CLI
+    runs don't pay for it.
+    """
+    if name == "demo":
+        from ui.ui import make_ui
+
+        globals()["demo"] = make_ui(aprep_video_params)
+        return globals()["demo"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-demo = make_ui(prep_video_params)
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    fake_backend.set_backend(args.backend)
     if args.ui:
         # Launch the UI
+        from ui.ui import make_ui
+
+        demo = make_ui(aprep_video_params)
         demo.launch(server_name="0.0.0.0")
 
+    elif args.worker:
+        # Work through the job queue
+        job_queue.run_worker(
+            run_job_step, list(TOOLS.keys()), db_path=args.jobs_db, drain=args.drain
+        )
+
+    elif args.enqueue_file:
+        # Queue every video of the inputs file, none if any line is invalid
+        all_params = []
+        errors = []
+        with open(args.enqueue_file, "r") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    params = job_queue.parse_inputs_line(line)
+                except ValueError as e:
+                    errors.append(f"{args.enqueue_file}:{line_number}: {e}")
+                    continue
+                if params is not None:
+                    all_params.append(params)
+        if errors:
+            parser.error("invalid inputs file\n" + "\n".join(errors))
+        conn = job_queue.connect(args.jobs_db)
+        for params in all_params:
+            job_id = job_queue.enqueue(conn, step=normalize_step(args.step), **params)
+            print(f"Queued job {job_id}: {params['prompt']}")
+
+    elif args.prompt and args.director and args.actors and args.enqueue:
+        # Queue the video, the worker needs all its params
+        missing = [
+            option
+            for option, value in [
+                ("--program", args.program),
+                ("--production-config", args.production_config),
+                ("--output", args.output),
+            ]
+            if not value
+        ]
+        if missing:
+            parser.error(f"--enqueue needs {', '.join(missing)}")
+        job_id = job_queue.enqueue(
+            job_queue.connect(args.jobs_db),
+            prompt=args.prompt,
+            program=args.program,
+            director=args.director,
+            actors=args.actors,
+            config=args.production_config,
+            working_dir=args.output,
+            step=normalize_step(args.step),
+        )
+        print(f"Queued job {job_id}")
+
     elif args.prompt and args.director and args.actors:
         # Make the video
         retries = 3
@@ -1,4 +1,5 @@
 import os
+import dataclasses
 from pydantic.dataclasses import dataclass
 from typing import Optional
 from dacite import from_dict
@@ -15,6 +16,8 @@ from utils.utils import (
     YOUTUBE_DISTRIBUTOR_PATH,
     PRODUCTION_CONFIG_PATH,
 )
+from utils.workspace import Workspace
+from utils import cast, memo
 
 
 @dataclass
@@ -24,6 +27,9 @@ class CastMember:
     name: str
     model: str
     prompt: str
+    # Reuse the LLM's responses to the same prompts (see utils.llm_cache),
+    # keyword only so the subclasses can add required fields
+    llm_cache: bool = dataclasses.field(default=True, kw_only=True)
 
 
 @dataclass
@@ -94,6 +100,8 @@ class ProductionConfig:
     subtitles_fontname: str = "DejaVu Sans"
     subtitles_fontsize: int = 26
     voiceline_synced_storyboard: bool = False
+    # Seed of the images, music and voiceover takes, None for random ones
+    seed: Optional[int] = None
 
     @property
     def storyboard_format(self):
@@ -108,6 +116,15 @@ class ProductionConfig:
         # return the contents of the file
         return open(prompt_file, "r").read()
 
+    def seed_for(self, *parts) -> Optional[int]:
+        """The seed of a unit of work (e.g. the images of a scene), None if unseeded.
+
+        Every unit gets its own seed, derived from `seed` and its parts.
+        """
+        if self.seed is None:
+            return None
+        return int(memo.digest(self.seed, *parts)[:8], 16)
+
     @classmethod
     def from_yaml(cls, yaml_file: str):
         """Read the output configuration from a yaml file."""
@@ -150,36 +167,21 @@ class Director:
 
     def get_researcher(self):
         """Get the researcher."""
-        return from_dict(
-            data_class=Researcher,
-            data=yaml.load(
-                open(os.path.join(RESEARCHER_PATH, f"{self.researcher}.yaml")),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            Researcher, os.path.join(RESEARCHER_PATH, f"{self.researcher}.yaml")
         )
 
     def get_script_writer(self):
         """Get the script writer."""
-        return from_dict(
-            data_class=ScriptWriter,
-            data=yaml.load(
-                open(os.path.join(SCRIPT_WRITER_PATH, f"{self.script_writer}.yaml")),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            ScriptWriter, os.path.join(SCRIPT_WRITER_PATH, f"{self.script_writer}.yaml")
         )
 
     def get_storyboard_artist(self):
         """Get the storyboard artist."""
-        return from_dict(
-            data_class=StoryboardArtist,
-            data=yaml.load(
-                open(
-                    os.path.join(
-                        STORYBOARD_ARTIST_PATH, f"{self.storyboard_artist}.yaml"
-                    )
-                ),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            StoryboardArtist,
+            os.path.join(STORYBOARD_ARTIST_PATH, f"{self.storyboard_artist}.yaml"),
         )
 
     def get_thumbnail_artist(self):
@@ -187,14 +189,9 @@ class Director:
         if self.thumbnail_artist == "None":
             return None
 
-        return from_dict(
-            data_class=ThumbnailArtist,
-            data=yaml.load(
-                open(
-                    os.path.join(THUMBNAIL_ARTIST_PATH, f"{self.thumbnail_artist}.yaml")
-                ),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            ThumbnailArtist,
+            os.path.join(THUMBNAIL_ARTIST_PATH, f"{self.thumbnail_artist}.yaml"),
         )
 
     def get_animation_artist(self):
@@ -202,50 +199,30 @@ class Director:
         if self.animation_artist == "None":
             return None
 
-        return from_dict(
-            data_class=AnimationArtist,
-            data=yaml.load(
-                open(
-                    os.path.join(ANIMATION_ARTIST_PATH, f"{self.animation_artist}.yaml")
-                ),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            AnimationArtist,
+            os.path.join(ANIMATION_ARTIST_PATH, f"{self.animation_artist}.yaml"),
         )
 
     def get_voiceover_artist(self):
         """Get the voiceover artist."""
-        return from_dict(
-            data_class=VoiceoverArtist,
-            data=yaml.load(
-                open(
-                    os.path.join(VOICEOVER_ARTIST_PATH, f"{self.voiceover_artist}.yaml")
-                ),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            VoiceoverArtist,
+            os.path.join(VOICEOVER_ARTIST_PATH, f"{self.voiceover_artist}.yaml"),
         )
 
     def get_music_composer(self):
         """Get the music composer."""
-        return from_dict(
-            data_class=MusicComposer,
-            data=yaml.load(
-                open(os.path.join(MUSIC_COMPOSER_PATH, f"{self.music_composer}.yaml")),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            MusicComposer,
+            os.path.join(MUSIC_COMPOSER_PATH, f"{self.music_composer}.yaml"),
         )
 
     def get_youtube_distributor(self):
         """Get the youtube distributor."""
-        return from_dict(
-            data_class=YouTubeDistributor,
-            data=yaml.load(
-                open(
-                    os.path.join(
-                        YOUTUBE_DISTRIBUTOR_PATH, f"{self.youtube_distributor}.yaml"
-                    )
-                ),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            YouTubeDistributor,
+            os.path.join(YOUTUBE_DISTRIBUTOR_PATH, f"{self.youtube_distributor}.yaml"),
         )
 
 
@@ -275,12 +252,8 @@ class Actor:
     @classmethod
     def from_name(cls, name: str):
         """Read the actor from a name."""
-        return from_dict(
-            data_class=Actor,
-            data=yaml.load(
-                open(os.path.join(ACTOR_PATH, f"{name.strip().lower()}.yaml")),
-                Loader=yaml.FullLoader,
-            ),
+        return cast.load(
+            Actor, os.path.join(ACTOR_PATH, f"{name.strip().lower()}.yaml")
         )
 
 
@@ -294,6 +267,8 @@ class VOLine:
     scene_index: int
     line_index: int
     sentence_index: int
+    # Offset of the line in the voiceover, in seconds
+    start_time: Optional[float] = None
 
 
 @dataclass
@@ -349,3 +324,8 @@ class Video:
     director: Director
     production_config: ProductionConfig
     actors: list[Actor]
+
+    @property
+    def workspace(self) -> Workspace:
+        """The paths of the artifacts of this video."""
+        return Workspace(self.output_dir)
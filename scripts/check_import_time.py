@@ -0,0 +1,66 @@
+"""Check that starting the CLI stays fast.
+
+Imports main.py in a fresh interpreter and fails if it takes longer than the
+budget, or if it pulls in any of the heavy libraries only the tools need.
+
+Usage: python scripts/check_import_time.py [budget in seconds]
+"""
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_S = float(os.environ.get("AICP_IMPORT_BUDGET_S", 1.0))
+
+# Libraries that must only be imported when a step (or the UI) needs them
+HEAVY_MODULES = [
+    "torch",
+    "bark",
+    "audiocraft",
+    "diffusers",
+    "whisper",
+    "librosa",
+    "demucs",
+    "sentence_transformers",
+    "gradio",
+    "langchain",
+]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET_S
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    failed = False
+    print(f"import main: {result['elapsed']:.3f}s (budget {budget:.3f}s)")
+    if result["elapsed"] > budget:
+        print("Importing main.py is over budget")
+        failed = True
+
+    imported = {module.split(".")[0] for module in result["modules"]}
+    for module in HEAVY_MODULES:
+        if module in imported:
+            print(f"main.py imports {module} at startup")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
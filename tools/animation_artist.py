@@ -8,17 +8,14 @@ import logging
 import numpy as np
 import cv2
 
-from langchain.callbacks.manager import (
-    AsyncCallbackManagerForToolRun,
-    CallbackManagerForToolRun,
-)
+from langchain.callbacks.manager import CallbackManagerForToolRun
 
 from PIL import Image
 from math import sqrt
 from skimage.color import rgb2gray
 from skimage.feature import ORB
 from typing import Optional
-from utils import utils, parsers
+from utils import utils, parsers, memo
 
 from .base import AICPBaseTool
 
@@ -31,6 +28,9 @@ class AnimationArtistTool(AICPBaseTool):
     name = "animationartist"
     description = "Useful when you need to turn still images into videos"
 
+    inputs = ["storyboard", "voiceover"]
+    outputs = ["animation"]
+
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
@@ -44,7 +44,7 @@ class AnimationArtistTool(AICPBaseTool):
         zoom_factor = cast_member.zoom_factor
         fps = cast_member.fps
 
-        scenes = parsers.get_scenes()
+        scenes = parsers.get_scenes(self.workspace)
         images = self.get_scene_images(scenes)
 
         # animate images
@@ -53,9 +53,13 @@ class AnimationArtistTool(AICPBaseTool):
             duration = images[img]
             video_file = img.replace("png", "mp4")
 
-            # Skip if video file already exists
-            if os.path.exists(video_file):
+            # Skip if the video file was made from the same image and duration,
+            # the zoom direction is random so it is not part of the inputs
+            video_key = memo.digest(cast_member, memo.file_digest(img), duration)
+            if memo.is_fresh(self.workspace, video_file, video_key):
                 continue
+            if os.path.exists(video_file):
+                os.remove(video_file)
 
             # Get points of interest from image
             start_point, end_point = self.find_interest_points_by_thirds(img)
@@ -72,44 +76,42 @@ class AnimationArtistTool(AICPBaseTool):
             cmd = self.generate_animation_ffmpeg_command(
                 img, video_file, start_point, end_point, zoom_factor, duration
             )
-            os.system(cmd)
+            utils.run_command(cmd, image=os.path.basename(img), duration=duration)
+            memo.record(self.workspace, video_file, video_key)
 
         # concat animations
         cmd = self.generate_concat_ffmpeg_command(
-            os.path.dirname(list(images.keys())[0]), utils.ANIMATION_VIDEO_FILE
+            os.path.dirname(list(images.keys())[0]), self.workspace.animation_video_file
         )
-        os.system(cmd)
+        utils.run_command(cmd)
 
         return "Done generating animation"
 
-    def _arun(
-        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        raise NotImplementedError("Async not implemented")
-
     def get_scene_images(self, scenes):
         images_dict = {}
+        timeline = parsers.get_snapshot(self.workspace).timeline
 
-        image_path = utils.STORYBOARD_PATH
+        image_path = self.workspace.storyboard_path
 
-        if os.path.exists(os.path.join(utils.STORYBOARD_PATH, "img2img")):
+        if os.path.exists(os.path.join(self.workspace.storyboard_path, "img2img")):
             # use img2img upscaled images if they exist
-            image_path = os.path.join(utils.STORYBOARD_PATH, "img2img")
+            image_path = os.path.join(self.workspace.storyboard_path, "img2img")
 
         if self.video.production_config.voiceline_synced_storyboard:
             # Use voiceline synced storyboard images
-            vo_lines = parsers.get_voiceover_lines()
-            for i, vo_line in enumerate(vo_lines, start=1):
+            for i, duration in enumerate(timeline.durations.tolist(), start=1):
                 image = os.path.join(image_path, f"scene_{i:02}_01.png")
-                images_dict[image] = vo_line.duration
+                images_dict[image] = duration
         else:
             # use default storyboard images
-            for i, scene in enumerate(scenes):
+            scene_durations = timeline.scene_durations(len(scenes)).tolist()
+            for i, scene_duration in enumerate(scene_durations):
                 scene_images = glob.glob(
-                    os.path.join(utils.STORYBOARD_PATH, f"scene_{i+1:02}_*.png")
+                    os.path.join(
+                        self.workspace.storyboard_path, f"scene_{i+1:02}_*.png"
+                    )
                 )
-                duration_per_image = scene.duration / len(scene_images)
+                duration_per_image = scene_duration / len(scene_images)
 
                 for img in scene_images:
                     image = os.path.join(image_path, os.path.basename(img))
@@ -370,10 +372,11 @@ class AnimationArtistTool(AICPBaseTool):
         # get list of all video filenames in the directory
         video_files = self._sorted(glob.glob(f"{video_dir}/scene_*_*.mp4"))
 
-        video_list = os.path.join(utils.PATH_PREFIX, "concat.txt")
+        video_list = self.workspace.path("concat.txt")
         with open(video_list, "w") as f:
             for video_file in video_files:
-                file = video_file.replace(f"{utils.PATH_PREFIX}/", "")
+                # Relative to the list file
+                file = os.path.relpath(video_file, self.workspace.root or ".")
                 f.write(f"file '{file}'\n")
 
         command = f"ffmpeg -f concat -safe 0 -i {video_list} -c copy {output_file}"
@@ -1,6 +1,30 @@
+from typing import Optional
+from langchain.callbacks.manager import AsyncCallbackManagerForToolRun
 from langchain.tools import BaseTool
 from models import Video, Director, ProductionConfig, Actor
+from utils import scheduler
+from utils.workspace import Workspace
 
 
 class AICPBaseTool(BaseTool):
     video: Video
+
+    # Artifacts this tool needs before it can run, and the ones it produces,
+    # used by utils.scheduler to decide which tools can run at the same time
+    inputs: list[str] = []
+    outputs: list[str] = []
+
+    def get_inputs(self) -> list[str]:
+        """Return the artifacts needed to run this tool for the current video."""
+        return self.inputs
+
+    async def _arun(
+        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
+    ) -> str:
+        """Use the tool, by default the sync version runs in an executor thread."""
+        return await scheduler.run_blocking(self._run, query)
+
+    @property
+    def workspace(self) -> Workspace:
+        """The paths of the artifacts of the video."""
+        return self.video.workspace
@@ -1,7 +1,10 @@
 import os
+import glob
 import math
 import yaml
 import logging
+import contextlib
+import torch
 
 from audiocraft.models import MusicGen
 from audiocraft.data.audio import audio_write
@@ -11,7 +14,15 @@ from langchain.callbacks.manager import (
 )
 from typing import Optional
 from utils.parsers import get_scenes
-from utils import utils, llms, parsers
+from utils import (
+    llms,
+    parsers,
+    scheduler,
+    memo,
+    model_registry,
+    fake_backend,
+    schemas,
+)
 from .base import AICPBaseTool
 
 logger = logging.getLogger(__name__)
@@ -21,6 +32,10 @@ class MusicComposerTool(AICPBaseTool):
     name = "musiccomposer"
     description = "Useful when you need to generate a music score for the script"
 
+    # Only the scene durations are needed from the voiceover
+    inputs = ["script", "voiceover"]
+    outputs = ["music"]
+
     scene_prompts = []
 
     def initialize_agent(self):
@@ -28,21 +43,11 @@ class MusicComposerTool(AICPBaseTool):
         self.load_prompts()
 
     def load_prompts(self):
-        # load voiceover artist prompts if they exist or create them
-        prompts_file = os.path.join(utils.PATH_PREFIX, "music_prompts.yaml")
-        if os.path.exists(prompts_file):
-            with open(prompts_file) as prompts:
-                print("Loading existing music prompts: music_prompts.yaml")
-                self.scene_prompts = yaml.load(
-                    prompts.read().strip(), Loader=yaml.Loader
-                )
-        else:
-            print("Generating new music prompts...")
-            self.scene_prompts = self.ego()
+        # load music composer prompts if they are up to date or create them
+        self.scene_prompts = self.ego()
 
-    def ego(self):
+    def get_params(self) -> dict:
         cast_member = self.video.director.get_music_composer()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
         prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
         # This is in addition to the input (Human param)
         # Resolve params from existing config/director/program
@@ -51,49 +56,120 @@ class MusicComposerTool(AICPBaseTool):
             params[param] = parsers.resolve_param_from_video(
                 video=self.video, param_name=param
             )
-        script_input = yaml.dump(
-            [{"description": s["description"]} for s in parsers.get_script()]
+        params["input"] = self.get_llm_input(self.get_descriptions())
+        return params
+
+    def get_descriptions(self) -> list[dict]:
+        return [
+            {"description": s["description"]}
+            for s in parsers.get_script(self.workspace)
+        ]
+
+    def get_llm_input(self, descriptions: list[dict]) -> str:
+        return yaml.dump(yaml.dump(descriptions))
+
+    def load_cached_prompts(self, prompts_key):
+        prompts_file = self.workspace.path("music_prompts.yaml")
+        if memo.is_fresh(self.workspace, prompts_file, prompts_key):
+            with open(prompts_file) as prompts:
+                print("Loading existing music prompts: music_prompts.yaml")
+                return yaml.load(prompts.read().strip(), Loader=yaml.Loader)
+        print("Generating new music prompts...")
+        return None
+
+    def save_prompts(self, prompts, prompts_key):
+        prompts_file = self.workspace.path("music_prompts.yaml")
+        with open(prompts_file, "w") as f:
+            f.write(yaml.dump(prompts))
+        memo.record(self.workspace, prompts_file, prompts_key)
+        return prompts
+
+    def ego(self):
+        cast_member = self.video.director.get_music_composer()
+        params = self.get_params()
+        prompts_key = memo.digest(cast_member, params)
+        prompts = self.load_cached_prompts(prompts_key)
+        if prompts is not None:
+            return prompts
+
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.MUSIC_PROMPTS,
+        )
+        prompts = llms.run_with_repair(
+            chain, params, self.get_descriptions(), self.get_llm_input, "music prompts"
         )
-        params["input"] = yaml.dump(script_input)
+        return self.save_prompts(schemas.OutputSchema.to_data(prompts), prompts_key)
 
-        retries = 3
-        while retries > 0:
-            try:
-                response = chain.run(
-                    **params,
-                )
-                print(response)
-                parsed = yaml.load(response, Loader=yaml.Loader)
-                if len(parsed) != len(parsers.get_scenes()):
-                    raise Exception("Number of scenes does not match")
-                # Save the updated script
-                with open(
-                    os.path.join(utils.PATH_PREFIX, "music_prompts.yaml"), "w"
-                ) as f:
-                    f.write(response)
-
-                return parsed
-            except Exception as e:
-                retries -= 1
-                logger.warning(e)
-
-        logger.error("Failed to generate music prompts, retries exhausted")
-        raise Exception("Failed to generate music prompts, retries exhausted")
+    async def aego(self):
+        cast_member = self.video.director.get_music_composer()
+        params = self.get_params()
+        prompts_key = memo.digest(cast_member, params)
+        prompts = self.load_cached_prompts(prompts_key)
+        if prompts is not None:
+            return prompts
+
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.MUSIC_PROMPTS,
+        )
+        prompts = await llms.arun_with_repair(
+            chain, params, self.get_descriptions(), self.get_llm_input, "music prompts"
+        )
+        return self.save_prompts(schemas.OutputSchema.to_data(prompts), prompts_key)
+
+    def compose(self) -> str:
+        with scheduler.gpu_slot():
+            self.generate_music()
+
+        return "Done generating music score"
 
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         self.initialize_agent()
+        return self.compose()
 
-        model = MusicGen.get_pretrained("medium")
-        scenes = get_scenes()
+    async def _arun(
+        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
+    ) -> str:
+        self.scene_prompts = await self.aego()
+        return await scheduler.run_blocking(self.compose)
+
+    def generate_music(self):
+        if fake_backend.is_enabled():
+            use_model = contextlib.nullcontext(fake_backend.FakeMusicGen())
+        else:
+            use_model = model_registry.use(
+                "musicgen-medium", lambda: MusicGen.get_pretrained("medium")
+            )
+        with use_model as model:
+            self.generate_scenes_music(model)
+
+    def generate_scenes_music(self, model):
+        scenes = get_scenes(self.workspace)
 
         for i, scene in enumerate(scenes):
             # dont recreate music, its expensive
-            if os.path.exists(os.path.join(utils.MUSIC_PATH, f"music-{i+1}-1.wav")):
+            music_file = os.path.join(self.workspace.music_path, f"music-{i+1}-1.wav")
+            seed = self.video.production_config.seed_for("music", i)
+            music_key = memo.digest(
+                "medium", self.scene_prompts[i]["prompt"], scene.duration, seed
+            )
+            if memo.is_fresh(self.workspace, music_file, music_key):
                 print(f"Skipping: music for scene {i+1}... already exists")
                 continue
 
+            # Remove chunks of a previous take, the new one can have fewer chunks
+            for filename in glob.glob(
+                os.path.join(self.workspace.music_path, f"music-{i+1}-*.wav")
+            ):
+                os.remove(filename)
+
             print(f"PROMPT: {self.scene_prompts[i]['prompt']}")
 
             # Generate music in 30 second chunks for each scene, but no chunks shorter than 8 seconds
@@ -107,6 +183,9 @@ class MusicComposerTool(AICPBaseTool):
             num_chunks = max(1, num_chunks)
 
             print(f"Generating {num_chunks} chunks for scene {i+1}...")
+            if seed is not None:
+                # MusicGen samples with torch's global generator
+                torch.manual_seed(seed)
             for j in range(num_chunks):
                 chunk_duration = 30
                 if j == num_chunks - 1:
@@ -127,7 +206,9 @@ class MusicComposerTool(AICPBaseTool):
                     progress=True,
                 )
 
-                filename = os.path.join(utils.MUSIC_PATH, f"music-{i+1}-{j+1}.wav")
+                filename = os.path.join(
+                    self.workspace.music_path, f"music-{i+1}-{j+1}.wav"
+                )
                 audio_write(
                     filename,
                     output[0].to("cpu"),
@@ -136,11 +217,4 @@ class MusicComposerTool(AICPBaseTool):
                     rms_headroom_db=16,
                     add_suffix=False,
                 )
-
-        return "Done generating music score"
-
-    def _arun(
-        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        raise NotImplementedError("Async version of this tool is not implemented")
+            memo.record(self.workspace, music_file, music_key)
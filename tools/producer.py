@@ -2,12 +2,8 @@
 
 import glob
 import os
-import subprocess
 
-from langchain.callbacks.manager import (
-    AsyncCallbackManagerForToolRun,
-    CallbackManagerForToolRun,
-)
+from langchain.callbacks.manager import CallbackManagerForToolRun
 from typing import Optional
 from utils import utils, parsers
 from .base import AICPBaseTool
@@ -17,27 +13,32 @@ class ProducerTool(AICPBaseTool):
     name = "producer"
     description = "Useful when you want to finalize the video file"
 
+    inputs = ["final_audio", "storyboard", "animation", "subtitles"]
+    outputs = ["final_video"]
+
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        audio_dict = {utils.FINAL_AUDIO_FILE: 0}
+        audio_dict = {self.workspace.final_audio_file: 0}
 
         # Create video from animated images
-        if os.path.exists(utils.ANIMATION_VIDEO_FILE):
+        if os.path.exists(self.workspace.animation_video_file):
             self.combine_audio_with_video(
-                audio_dict, utils.ANIMATION_VIDEO_FILE, utils.FINAL_VIDEO_FILE
+                audio_dict,
+                self.workspace.animation_video_file,
+                self.workspace.final_video_file,
             )
         # Create video from still images
         else:
-            scenes = parsers.get_scenes()
+            scenes = parsers.get_scenes(self.workspace)
             images = self.get_scene_images(scenes)
 
             resolution = (
                 self.video.production_config.video_width,
                 self.video.production_config.video_height,
             )
-            output_file = utils.FINAL_VIDEO_FILE
+            output_file = self.workspace.final_video_file
             self.create_video_from_images_with_audio(
                 images, audio_dict, resolution, output_file
             )
@@ -47,32 +48,29 @@ class ProducerTool(AICPBaseTool):
 
         return "Done producing video file"
 
-    def _arun(
-        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        raise NotImplementedError("Async not implemented")
-
     def get_scene_images(self, scenes):
         images_dict = {}
+        timeline = parsers.get_snapshot(self.workspace).timeline
 
         upscaler_path = ""
-        # if os.path.exists(os.path.join(utils.STORYBOARD_PATH, "img2img")):
+        # if os.path.exists(os.path.join(self.workspace.storyboard_path, "img2img")):
         #    # use gfpgan upscaled images if they exist
         #    upscaler_path = "img2img"
 
         if self.video.production_config.voiceline_synced_storyboard:
             # Use voiceline synced storyboard images
-            vo_lines = parsers.get_voiceover_lines()
-            for i, vo_line in enumerate(vo_lines, start=1):
+            for i, duration in enumerate(timeline.durations.tolist(), start=1):
                 image = os.path.join(upscaler_path, f"scene_{i:02}_01.png")
-                images_dict[image] = vo_line.duration
+                images_dict[image] = duration
         else:
-            for i, scene in enumerate(scenes):
+            scene_durations = timeline.scene_durations(len(scenes)).tolist()
+            for i, scene_duration in enumerate(scene_durations):
                 scene_images = glob.glob(
-                    os.path.join(utils.STORYBOARD_PATH, f"scene_{i+1:02}_*.png")
+                    os.path.join(
+                        self.workspace.storyboard_path, f"scene_{i+1:02}_*.png"
+                    )
                 )
-                duration_per_image = scene.duration / len(scene_images)
+                duration_per_image = scene_duration / len(scene_images)
 
                 for img in scene_images:
                     image = os.path.join(upscaler_path, os.path.basename(img))
@@ -83,12 +81,12 @@ class ProducerTool(AICPBaseTool):
     def _add_subtitles(self):
         if not self.video.production_config.enable_subtitles:
             return
-        if not os.path.exists(utils.VOICEOVER_SUBTITLES):
+        if not os.path.exists(self.workspace.voiceover_subtitles):
             return
 
-        input_file = utils.FINAL_VIDEO_FILE
-        output_file = utils.FINAL_VIDEO_FILE
-        subtitle_file = utils.VOICEOVER_SUBTITLES
+        input_file = self.workspace.final_video_file
+        output_file = self.workspace.final_video_file
+        subtitle_file = self.workspace.voiceover_subtitles
 
         text_color = "#FF0000"
         outline_color = "#0000000"
@@ -106,7 +104,7 @@ class ProducerTool(AICPBaseTool):
             ],
         )
         for command in commands:
-            subprocess.run(command, shell=True)
+            utils.run_command(command)
 
     def combine_audio_with_video(self, audio_dict, input_file, output_file):
         # Add audio to the video
@@ -125,7 +123,7 @@ class ProducerTool(AICPBaseTool):
 
         # Construct the ffmpeg command for audio addition
         ffmpeg_cmd = f"ffmpeg -y -i {input_file} {audio_input_str}-filter_complex '{audio_filter_str}' -map 0:v -map '[a]' -c:v copy '{output_file}'"
-        subprocess.run(ffmpeg_cmd, shell=True)
+        utils.run_command(ffmpeg_cmd)
 
     def create_video_from_images_with_audio(
         self, images_dict, audio_dict, resolution, output_file
@@ -134,17 +132,21 @@ class ProducerTool(AICPBaseTool):
         sorted_images = images_dict.items()
 
         # Create a temporary file with the list of images and durations
-        if os.path.exists(os.path.join(utils.STORYBOARD_PATH, "restored_imgs")):
+        if os.path.exists(
+            os.path.join(self.workspace.storyboard_path, "restored_imgs")
+        ):
             # use gfpgan upscaled images if they exist
             image_set = "restored_imgs"
-        elif os.path.exists(os.path.join(utils.STORYBOARD_PATH, "img2img")):
+        elif os.path.exists(os.path.join(self.workspace.storyboard_path, "img2img")):
             # use img2img upscaled images if they exist
             image_set = "img2img"
         else:
             image_set = ""
 
         print(f"IMAGE_SET={image_set}")
-        images_list_file = os.path.join(utils.STORYBOARD_PATH, "images_list.txt")
+        images_list_file = os.path.join(
+            self.workspace.storyboard_path, "images_list.txt"
+        )
 
         with open(images_list_file, "w") as f:
             for image_path, duration in sorted_images:
@@ -158,8 +160,8 @@ class ProducerTool(AICPBaseTool):
         # codec
         codec = "-c:v libx264 -preset ultrafast"
 
-        ffmpeg_cmd = f"ffmpeg -y -f concat -i {images_list_file} -vf '{scale_filter}' -r 30 {audio_compressor} {codec} -y '{utils.TEMP_VIDEO_FILE}'"
-        subprocess.run(ffmpeg_cmd, shell=True)
+        ffmpeg_cmd = f"ffmpeg -y -f concat -i {images_list_file} -vf '{scale_filter}' -r 30 {audio_compressor} {codec} -y '{self.workspace.temp_video_file}'"
+        utils.run_command(ffmpeg_cmd)
 
         # Add audio to the video
         sorted_audio = audio_dict.items()
@@ -176,12 +178,14 @@ class ProducerTool(AICPBaseTool):
         audio_filter_str += f"{audio_streams_str}amix=inputs={len(sorted_audio)}[a]"
 
         # Construct the ffmpeg command for audio addition
-        ffmpeg_cmd = f"ffmpeg -y -i {utils.TEMP_VIDEO_FILE} {audio_input_str}-filter_complex '{audio_filter_str}' -map 0:v -map '[a]' -c:v copy '{output_file}'"
-        subprocess.run(ffmpeg_cmd, shell=True)
+        ffmpeg_cmd = f"ffmpeg -y -i {self.workspace.temp_video_file} {audio_input_str}-filter_complex '{audio_filter_str}' -map 0:v -map '[a]' -c:v copy '{output_file}'"
+        utils.run_command(ffmpeg_cmd)
 
 
 def generate_ffmpeg_commands(input_file, subtitle_file, output_file, settings):
     commands = []
+    # The parts are written next to the output file
+    output_dir = os.path.dirname(output_file)
     # Split the video into parts according to the settings
     for i, setting in enumerate(settings):
         start_time = setting[0]
@@ -192,15 +196,14 @@ def generate_ffmpeg_commands(input_file, subtitle_file, output_file, settings):
             subtitle_file,
             start_time,
             end_time,
-            os.path.join(utils.PATH_PREFIX, f"part{i}.mp4"),
+            os.path.join(output_dir, f"part{i}.mp4"),
         )
         commands.append(command)
     # Concatenate the parts back together
     concat_command = (
         f"ffmpeg -y -i 'concat:"
         + "|".join(
-            os.path.join(utils.PATH_PREFIX, f"part{i}.mp4")
-            for i in range(len(settings))
+            os.path.join(output_dir, f"part{i}.mp4") for i in range(len(settings))
         )
         + f"' -c copy {output_file}"
     )
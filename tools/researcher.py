@@ -11,7 +11,7 @@ from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
-from utils import utils, llms, parsers
+from utils import llms, parsers
 from .base import AICPBaseTool
 
 
@@ -19,13 +19,15 @@ class ResearcherTool(AICPBaseTool):
     name = "researcher"
     description = "Useful when you need to research a topic"
 
-    def _run(
-        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
+    outputs = ["research"]
 
+    def get_chain_and_params(self, query: str):
         cast_member = self.video.director.get_researcher()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+        )
         prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
         prompt_params.append("input")
         # This is in addition to the input (Human param)
@@ -36,17 +38,31 @@ class ResearcherTool(AICPBaseTool):
                 video=self.video, param_name=param
             )
         params["input"] = query
-        result = chain.run(
-            **params,
-        )
-        with open(utils.RESEARCH, "w") as f:
+        return chain, params
+
+    def save_research(self, result: str, query: str) -> str:
+        with open(self.workspace.research, "w") as f:
             # prefix results with the original prompt for context
             result += f'\nuser_input: "{query}"'
             f.write(result)
-        return f"File written to {utils.RESEARCH}"
+        return f"File written to {self.workspace.research}"
+
+    def _run(
+        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Use the tool."""
+        chain, params = self.get_chain_and_params(query)
+        result = chain.run(
+            **params,
+        )
+        return self.save_research(result, query)
 
     async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+        chain, params = self.get_chain_and_params(query)
+        result = await chain.arun(
+            **params,
+        )
+        return self.save_research(result, query)
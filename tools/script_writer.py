@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import os
 from typing import Optional
 from dotenv import load_dotenv
 import logging
@@ -12,7 +11,7 @@ from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
-from utils import utils, llms, parsers
+from utils import llms, parsers, memo, schemas
 
 from .base import AICPBaseTool
 
@@ -25,12 +24,17 @@ class ScriptWriterTool(AICPBaseTool):
         "Useful when you need to write a script, pass the file containing the research"
     )
 
-    def _run(
-        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
+    inputs = ["research"]
+    outputs = ["script", "script_summary"]
+
+    def get_chain_and_params(self):
         cast_member = self.video.director.get_script_writer()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.SCRIPT,
+        )
 
         prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
         prompt_params.append("input")
@@ -41,43 +45,70 @@ class ScriptWriterTool(AICPBaseTool):
             params[param] = parsers.resolve_param_from_video(
                 video=self.video, param_name=param
             )
-        params["input"] = open(utils.RESEARCH, "r").read()
-
-        retries = 3
-        while retries > 0:
-            try:
-                result = chain.run(
-                    **params,
-                )
-                parsed = yaml.load(result, Loader=yaml.Loader)
-                # Make sure that every element in the list has the following:
-                # title, description, an array of characters (with name and actor name)
-                # an array of dialogue that includes
-
-                with open(utils.SCRIPT, "w") as f:
-                    f.write(result)
-                # Summarize the script in a few sentences
-                if not os.path.exists(utils.SCRIPT_SUMMARY):
-                    with open(utils.SCRIPT_SUMMARY, "w") as f:
-                        f.write(
-                            llms.get_llm(
-                                model=cast_member.model,
-                                template="Summarize the following script in 4 sentences",
-                            ).run(result)
-                        )
-
-                return f"File written to {utils.SCRIPT}"
-            except Exception as e:
-                retries -= 1
-                logger.warning(f"{e}")
-                logger.warning("Failed to generate script, retrying")
-
-        logger.error("Failed to generate script, retries exhausted")
-
-        return "Failed to generate script"
-
-    def _arun(
+        params["input"] = open(self.workspace.research, "r").read()
+        return chain, params
+
+    def parse_script(self, result: str) -> str:
+        """Validate the script, returns it as YAML."""
+        scenes = schemas.SCRIPT.parse(result)
+        return yaml.dump(
+            schemas.OutputSchema.to_data(scenes), sort_keys=False, allow_unicode=True
+        )
+
+    def save_script(self, result: str):
+        with open(self.workspace.script, "w") as f:
+            f.write(result)
+        parsers.invalidate(self.workspace)
+
+    def get_summary_chain(self, result: str):
+        """Return the chain summarizing the script, None if the summary is fresh."""
+        cast_member = self.video.director.get_script_writer()
+        summary_key = memo.digest(cast_member.model, result)
+        if memo.is_fresh(self.workspace, self.workspace.script_summary, summary_key):
+            return None, summary_key
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template="Summarize the following script in 4 sentences",
+            cache=cast_member.llm_cache,
+        )
+        return chain, summary_key
+
+    def save_summary(self, summary: str, summary_key: str):
+        with open(self.workspace.script_summary, "w") as f:
+            f.write(summary)
+        memo.record(self.workspace, self.workspace.script_summary, summary_key)
+
+    def _run(
+        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Use the tool."""
+        chain, params = self.get_chain_and_params()
+        try:
+            result = llms.run_with_retries(chain, params, self.parse_script, "script")
+            self.save_script(result)
+            # Summarize the script in a few sentences
+            summary_chain, summary_key = self.get_summary_chain(result)
+            if summary_chain is not None:
+                self.save_summary(summary_chain.run(result), summary_key)
+        except Exception:
+            return "Failed to generate script"
+
+        return f"File written to {self.workspace.script}"
+
+    async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+        chain, params = self.get_chain_and_params()
+        try:
+            result = await llms.arun_with_retries(
+                chain, params, self.parse_script, "script"
+            )
+            self.save_script(result)
+            summary_chain, summary_key = self.get_summary_chain(result)
+            if summary_chain is not None:
+                self.save_summary(await summary_chain.arun(result), summary_key)
+        except Exception:
+            return "Failed to generate script"
+
+        return f"File written to {self.workspace.script}"
@@ -1,15 +1,11 @@
 import os
 import glob
-import subprocess
 
-from langchain.callbacks.manager import (
-    AsyncCallbackManagerForToolRun,
-    CallbackManagerForToolRun,
-)
+from langchain.callbacks.manager import CallbackManagerForToolRun
 from pydub import AudioSegment
 from typing import Optional
-from utils.parsers import get_scenes
-from utils import utils, demucs, audio_utils
+from utils.parsers import get_scenes, get_snapshot
+from utils import utils, demucs, audio_utils, scheduler
 
 from .base import AICPBaseTool
 
@@ -55,7 +51,7 @@ def combine_music_with_crossfade(music_paths, output_path, crossfade_duration=1.
     cmd = f'ffmpeg {input_str} -filter_complex "{filter_complex_str}" -map "[ac{len(music_paths) - 1}]" {output_path}'
 
     # Run the FFmpeg command
-    subprocess.run(cmd, shell=True)
+    utils.run_command(cmd)
 
 
 def duck(
@@ -140,21 +136,26 @@ class SoundEngineerTool(AICPBaseTool):
     name = "soundengineer"
     description = "Useful when you need to create the final audio for the video"
 
+    inputs = ["music", "voiceover"]
+    outputs = ["final_audio"]
+
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
 
-        scenes = get_scenes()
+        scenes = get_scenes(self.workspace)
+        timeline = get_snapshot(self.workspace).timeline
+        scene_durations = timeline.scene_durations(len(scenes)).tolist()
 
         # For each scene, calculate the duration of all music-{scene_number}.wav files
         # and pad the audio with silence if the duration is less than the scene duration
 
         all_music_files = []
-        for i, scene in enumerate(scenes):
+        for i, scene_duration in enumerate(scene_durations):
             music_files_for_scene = []
             glob_result = glob.glob(
-                os.path.join(utils.MUSIC_PATH, f"music-{i+1}-*.wav")
+                os.path.join(self.workspace.music_path, f"music-{i+1}-*.wav")
             )
             for filename in glob_result:
                 music_files_for_scene.append(filename)
@@ -166,23 +167,26 @@ class SoundEngineerTool(AICPBaseTool):
                     filename
                 ).duration_seconds
 
-            if duration_of_music_files < scene.duration:
+            if duration_of_music_files < scene_duration:
                 # Pad the audio with silence
                 pad_audio_with_fade(
                     music_files_for_scene[-1],
                     music_files_for_scene[-1],
                     1000,
-                    1000 * (scene.duration - duration_of_music_files),
+                    1000 * (scene_duration - duration_of_music_files),
                 )
 
         combine_music_with_crossfade(
-            all_music_files, os.path.join(utils.MUSIC_PATH, "music.wav")
+            all_music_files, os.path.join(self.workspace.music_path, "music.wav")
         )
-        filtered_voice = demucs.demucs_voice_filter(utils.VOICEOVER_WAV_FILE)
+        with scheduler.gpu_slot():
+            filtered_voice = demucs.demucs_voice_filter(
+                self.workspace.voiceover_wav_file
+            )
         voiceover = audio_utils.numpy_to_audiosegment(filtered_voice.to("cpu").numpy())
 
         background_music = AudioSegment.from_file(
-            os.path.join(utils.MUSIC_PATH, "music.wav")
+            os.path.join(self.workspace.music_path, "music.wav")
         )
 
         # Boost audio sources slightly
@@ -200,12 +204,6 @@ class SoundEngineerTool(AICPBaseTool):
         combined = voiceover.overlay(background_music)
         combined.fade_in(400)
         combined.fade_out(400)
-        combined.export(utils.FINAL_AUDIO_FILE, format="wav")
+        combined.export(self.workspace.final_audio_file, format="wav")
 
         return "Done generating final audio"
-
-    def _arun(
-        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        raise NotImplementedError("Async version of this tool is not implemented")
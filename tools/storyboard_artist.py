@@ -1,36 +1,52 @@
 #!usr/bin/env python
 
 import os
-import torch
 import yaml
 import logging
 
-from diffusers import (
-    DDIMScheduler,
-    StableDiffusionImg2ImgPipeline,
-)
 from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
 from PIL import Image
 from typing import Optional
-from utils import llms, utils, parsers, image_gen
+from utils import (
+    llms,
+    llm_executor,
+    llm_batching,
+    parsers,
+    image_gen,
+    scheduler,
+    memo,
+    schemas,
+)
 from .base import AICPBaseTool
 
 logger = logging.getLogger(__name__)
 
 logger.setLevel(logging.DEBUG)
 
+# Tokens of a prompt in the answer, stable diffusion only reads the first 77
+PROMPT_TOKENS = 100
+
 
 class StoryBoardArtistTool(AICPBaseTool):
     name = "storyboardartist"
     description = "Useful when you need to generate images for the script"
 
+    inputs = ["script"]
+    outputs = ["storyboard"]
+
     scene_prompts = []
     positive_prompt = ""
     negative_prompt = ""
 
+    def get_inputs(self) -> list[str]:
+        # Voiceline synced prompts are generated from the recorded voiceover lines
+        if self.video.production_config.voiceline_synced_storyboard:
+            return self.inputs + ["voiceover", "script_summary"]
+        return self.inputs
+
     def initialize_agent(self):
         self.load_prompts()
 
@@ -40,21 +56,11 @@ class StoryBoardArtistTool(AICPBaseTool):
         self.positive_prompt = cast_member.positive_prompt
         self.negative_prompt = cast_member.negative_prompt
 
-        # load storyboard artist prompts if they exist or create them
-        prompts_file = os.path.join(utils.PATH_PREFIX, "storyboard_prompts.yaml")
-        if os.path.exists(prompts_file):
-            with open(prompts_file) as prompts:
-                logger.info("Loading existing prompts from: storyboard_prompts.yaml")
-                self.scene_prompts = yaml.load(
-                    prompts.read().strip(), Loader=yaml.Loader
-                )
-        else:
-            logger.info("Generating text-to-image prompts for storyboard artist...")
-            self.scene_prompts = self.ego()
+        # load storyboard artist prompts, only the ones with changed inputs are
+        # generated again
+        self.scene_prompts = self.ego()
 
-    def ego(self):
-        """Run the script through the mind of the storyboard artist
-        to generate more descriptive prompts"""
+    def get_params(self) -> dict:
         cast_member = self.video.director.get_storyboard_artist()
         prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
         # This is in addition to the input (Human param)
@@ -64,246 +70,310 @@ class StoryBoardArtistTool(AICPBaseTool):
             params[param] = parsers.resolve_param_from_video(
                 video=self.video, param_name=param
             )
+        return params
 
-        prompts = []
-        if self.video.production_config.voiceline_synced_storyboard:
-            with open(utils.SCRIPT_SUMMARY, "r") as f:
-                script_summary = f.read()
-
-            # Do it per scene and provide the dialog lines
-            vo_lines = parsers.get_voiceover_lines()
-            # Group by scene
-            for scene_index, scene in enumerate(parsers.get_scenes()):
-                logger.info(f"Generating prompts for scene {scene_index}")
-                # If we already have prompts for this scene, load them
-                prompts_file = os.path.join(
-                    utils.STORYBOARD_PATH, f"scene_{scene_index}_prompts.yaml"
-                )
-                if os.path.exists(prompts_file):
-                    with open(prompts_file) as prompts:
-                        logger.info(
-                            f"Loading existing prompts from: scene_{scene_index}_prompts.yaml"
-                        )
-                        prompts = yaml.load(prompts.read().strip(), Loader=yaml.Loader)
-                        prompts.extend(prompts)
-                        continue
+    def get_prompt_groups(self, params):
+        """Split the prompts to generate in groups cached in their own file.
 
-                vo_lines_for_scene = [
-                    vo_line
-                    for vo_line in vo_lines
-                    if vo_line.scene_index == scene_index
-                ]
+        Returns a list of (prompts_file, key, calls) per group, every call is
+        the LLM input, with one prompt expected back per scene or dialog line.
+        The scenes (or the dialog lines of a scene) are packed in as few calls
+        as fit in the model's context.
+        """
+        cast_member = self.video.director.get_storyboard_artist()
+        model = cast_member.model
+        budget = llm_batching.get_budget(model, cast_member.prompt, params)
+
+        def cost(item):
+            return llm_batching.input_tokens(item, model) + PROMPT_TOKENS
+
+        if not self.video.production_config.voiceline_synced_storyboard:
+            scenes = parsers.get_scenes(self.workspace)
+            # Use only the title and description lines to save tokens
+            scenes_input = [
+                {
+                    "scene_title": s.scene_title,
+                    "scene_description": s.description,
+                }
+                for s in scenes
+            ]
+            prompts_file = self.workspace.path("storyboard_prompts.yaml")
+            prompts_key = memo.digest(
+                cast_member, {**params, "input": yaml.dump(scenes_input)}
+            )
+            calls = llm_batching.pack(scenes_input, budget, cost)
+            logger.info(f"Prompts of {len(scenes)} scenes in {len(calls)} LLM calls")
+            return [(prompts_file, prompts_key, calls)]
+
+        with open(self.workspace.script_summary, "r") as f:
+            script_summary = f.read()
+
+        # Do it per scene and provide the dialog lines
+        project = parsers.get_snapshot(self.workspace)
+        groups = []
+        for scene_index, scene in enumerate(project.scenes):
+            vo_lines_for_scene = project.voiceover_lines_by_scene.get(scene_index, [])
+            scene_input = {
+                "script_summary": script_summary,
+                "scene_title": scene.scene_title,
+                "scene_description": scene.description,
+            }
+            # The sentences of a line stay in the same call
+            line_groups = {}
+            for vo_line in vo_lines_for_scene:
+                line_groups.setdefault(vo_line.line_index, []).append(
+                    {"actor": vo_line.actor.name, "line": vo_line.line}
+                )
+            calls = llm_batching.pack(
+                [line_groups[line_index] for line_index in sorted(line_groups)],
+                budget - llm_batching.input_tokens(scene_input, model),
+                lambda line_group: sum(cost(line) for line in line_group),
+            )
+            if len(calls) > 1:
+                logger.info(
+                    f"Splitting scene {scene_index} in {len(calls)} LLM calls because "
+                    f"its {len(vo_lines_for_scene)} lines don't fit in one"
+                )
+            inputs = [
+                {
+                    **scene_input,
+                    "number_of_expected_prompts": len(dialog_lines),
+                    "dialog_lines": dialog_lines,
+                }
+                for dialog_lines in (
+                    [line for line_group in call for line in line_group]
+                    for call in calls
+                )
+            ]
 
-                if len(vo_lines_for_scene) > 10:
-                    logger.info(
-                        f"Splitting scene {scene_index} into multiple prompts because it has {len(vo_lines_for_scene)} lines"
-                    )
-                    # Group and split by line_index as well
-                    # Get all the line indexes
-                    line_indexes = set(
-                        [vo_line.line_index for vo_line in vo_lines_for_scene]
-                    )
-                    # Group by line index
-                    vo_lines_for_scene = [
-                        [
-                            vo_line
-                            for vo_line in vo_lines_for_scene
-                            if vo_line.line_index == line_index
-                        ]
-                        for line_index in sorted(line_indexes)
-                    ]
-                    # call llm for each group
-                    scene_prompts = []
-                    for vo_lines_for_line_index in vo_lines_for_scene:
-                        logger.info(
-                            f"Generating prompts for scene {scene_index} line {vo_lines_for_line_index[0].line_index}"
-                        )
-                        params["input"] = yaml.dump(
-                            {
-                                "script_summary": script_summary,
-                                "scene_title": scene.scene_title,
-                                "scene_description": scene.description,
-                                "number_of_expected_prompts": len(
-                                    vo_lines_for_line_index
-                                ),
-                                "dialog_lines": [
-                                    {"actor": vo_line.actor.name, "line": vo_line.line}
-                                    for vo_line in vo_lines_for_line_index
-                                ],
-                            }
-                        )
-                        scene_prompts.extend(
-                            self._call_llm(params, len(vo_lines_for_line_index))
-                        )
-
-                else:
-                    logger.info(f"Generating prompts for scene {scene_index}")
-                    params["input"] = yaml.dump(
-                        {
-                            "script_summary": script_summary,
-                            "scene_title": scene.scene_title,
-                            "scene_description": scene.description,
-                            "number_of_expected_prompts": len(vo_lines_for_scene),
-                            "dialog_lines": [
-                                {"line": vo_line.line} for vo_line in vo_lines_for_scene
-                            ],
-                        }
-                    )
-                    scene_prompts = self._call_llm(params, len(vo_lines_for_scene))
-                prompts.extend(scene_prompts)
-                # Save the prompts so we don't recompute them if failure
-                with open(
-                    prompts_file,
-                    "w",
-                ) as f:
-                    f.write(yaml.dump(scene_prompts))
-        else:
-            params["input"] = yaml.dump(
-                [
-                    {
-                        "scene_title": s.scene_title,
-                        "scene_description": s.description,
-                    }
-                    for s in parsers.get_scenes()
-                ]
+            prompts_file = os.path.join(
+                self.workspace.storyboard_path, f"scene_{scene_index}_prompts.yaml"
+            )
+            groups.append(
+                (prompts_file, memo.digest(cast_member, params, inputs), inputs)
             )
-            prompts = self._call_llm(params, len(parsers.get_scenes()))
+        return groups
 
-        # Save the prompts
-        with open(os.path.join(utils.PATH_PREFIX, "storyboard_prompts.yaml"), "w") as f:
+    def load_cached_group(self, prompts_file, key):
+        if memo.is_fresh(self.workspace, prompts_file, key):
+            with open(prompts_file) as f:
+                logger.info(
+                    f"Loading existing prompts from: {os.path.basename(prompts_file)}"
+                )
+                return yaml.load(f.read().strip(), Loader=yaml.Loader)
+        logger.info(f"Generating prompts for {os.path.basename(prompts_file)}")
+        return None
+
+    def save_group(self, prompts, prompts_file, key):
+        # Save the prompts so we don't recompute them if failure
+        with open(prompts_file, "w") as f:
             f.write(yaml.dump(prompts))
+        memo.record(self.workspace, prompts_file, key)
+        return prompts
 
+    def save_prompts(self, groups_prompts):
+        prompts = [prompt for group in groups_prompts for prompt in group]
+        with open(self.workspace.path("storyboard_prompts.yaml"), "w") as f:
+            f.write(yaml.dump(prompts))
         return prompts
 
+    def ego(self):
+        """Run the script through the mind of the storyboard artist
+        to generate more descriptive prompts"""
+        params = self.get_params()
+        model = self.video.director.get_storyboard_artist().model
+
+        def get_prompts(llm_input):
+            return self._call_llm(params, llm_input)
+
+        def get_group(group):
+            prompts_file, key, calls = group
+            group_prompts = self.load_cached_group(prompts_file, key)
+            if group_prompts is None:
+                answers = llm_executor.fan_out(get_prompts, calls, model)
+                group_prompts = [prompt for answer in answers for prompt in answer]
+                self.save_group(group_prompts, prompts_file, key)
+            return group_prompts
+
+        groups_prompts = llm_executor.fan_out(
+            get_group, self.get_prompt_groups(params), model
+        )
+        return self.save_prompts(groups_prompts)
+
+    async def aego(self):
+        """Async version of ego."""
+        params = self.get_params()
+        model = self.video.director.get_storyboard_artist().model
+
+        async def get_prompts(llm_input):
+            return await self._acall_llm(params, llm_input)
+
+        async def get_group(group):
+            prompts_file, key, calls = group
+            group_prompts = self.load_cached_group(prompts_file, key)
+            if group_prompts is None:
+                answers = await llm_executor.afan_out(get_prompts, calls, model)
+                group_prompts = [prompt for answer in answers for prompt in answer]
+                self.save_group(group_prompts, prompts_file, key)
+            return group_prompts
+
+        groups_prompts = await llm_executor.afan_out(
+            get_group, self.get_prompt_groups(params), model
+        )
+        return self.save_prompts(groups_prompts)
+
     def img2img_upscaler(self):
         # setup stable diffusion pipeline
-        os.makedirs(os.path.join(utils.STORYBOARD_PATH, "img2img"), exist_ok=True)
+        os.makedirs(
+            os.path.join(self.workspace.storyboard_path, "img2img"), exist_ok=True
+        )
 
         cast_member = self.video.director.get_storyboard_artist()
-        pipe = StableDiffusionImg2ImgPipeline.from_pretrained(
-            cast_member.sd_model,
-            custom_pipeline="lpw_stable_diffusion",
-            torch_dtype=torch.float16,
-        )
+        with image_gen.use_img2img_pipeline(cast_member.sd_model) as pipe:
+            # settings
+            guidance_scale = 7.5
+            noise_strength = 0.35
+            num_inference_steps = 30
+            num_images_per_prompt = 1
+            num_images_per_scene = self.video.production_config.num_images_per_scene
+            image_height = self.video.production_config.video_height
+            image_width = self.video.production_config.video_width
+
+            # enumerate scenes and generate image set
+            for i, scene in enumerate(self.scene_prompts):
+                prompt = f"{scene['prompt']}, {self.positive_prompt}"
+                logger.info(f"PP={prompt}")
+                logger.info(f"NP={self.negative_prompt}")
+
+                for j in range(0, num_images_per_scene):
+                    file = os.path.join(
+                        self.workspace.storyboard_path, f"scene_{i+1:02}_{j+1:02}.png"
+                    )
+                    output_file = os.path.join(
+                        self.workspace.storyboard_path,
+                        "img2img",
+                        f"scene_{i+1:02}_{j+1:02}.png",
+                    )
+                    seed = self.video.production_config.seed_for("img2img", i, j)
+                    # dont recreate images, its expensive
+                    image_key = memo.digest(
+                        cast_member.sd_model,
+                        memo.file_digest(file),
+                        prompt,
+                        self.negative_prompt,
+                        image_width,
+                        image_height,
+                        num_inference_steps,
+                        guidance_scale,
+                        noise_strength,
+                        seed,
+                    )
+                    if memo.is_fresh(self.workspace, output_file, image_key):
+                        logger.info(f"Skipping: img2img/scene_{i+1:02}_{j+1:02}.png")
+                        continue
 
-        pipe = pipe.to("cuda")
+                    scene_image = Image.open(file).convert("RGB")
+                    scene_image = scene_image.resize((image_width, image_height))
 
-        pipe.enable_xformers_memory_efficient_attention()
-        pipe.scheduler = DDIMScheduler.from_config(pipe.scheduler.config)
+                    image = pipe(
+                        prompt=prompt,
+                        negative_prompt=self.negative_prompt,
+                        image=scene_image,
+                        height=image_height,
+                        width=image_width,
+                        num_inference_steps=num_inference_steps,
+                        num_images_per_prompt=num_images_per_prompt,
+                        guidance_scale=guidance_scale,
+                        strength=noise_strength,
+                        generator=image_gen.generator(seed),
+                    ).images[0]
 
-        # settings
-        guidance_scale = 7.5
-        noise_strength = 0.35
-        num_inference_steps = 30
-        num_images_per_prompt = 1
-        num_images_per_scene = self.video.production_config.num_images_per_scene
-        image_height = self.video.production_config.video_height
-        image_width = self.video.production_config.video_width
+                    image.save(output_file)
+                    memo.record(self.workspace, output_file, image_key)
 
-        # enumerate scenes and generate image set
-        for i, scene in enumerate(self.scene_prompts):
-            prompt = f"{scene['prompt']}, {self.positive_prompt}"
-            logger.info(f"PP={prompt}")
-            logger.info(f"NP={self.negative_prompt}")
+            return "Done generating images"
 
-            for j in range(0, num_images_per_scene):
-                # dont recreate images, its expensive
-                if os.path.exists(
+    def stable_diffusion(self):
+        # setup stable diffusion pipeline
+        cast_member = self.video.director.get_storyboard_artist()
+        lora_paths = []
+        for actor in self.video.actors:
+            if not actor.lora_keyword:
+                continue
+            lora_paths.append(
+                os.path.join("loras", f"{actor.lora_keyword}.safetensors")
+            )
+
+        with image_gen.use_pipeline_with_loras(
+            cast_member.sd_model, lora_paths
+        ) as pipe:
+            # settings
+            guidance_scale = 7.5
+            num_inference_steps = 50
+            num_images_per_prompt = self.video.production_config.num_images_per_scene
+            image_width = self.video.production_config.sd_base_image_width
+            image_height = self.video.production_config.sd_base_image_height
+
+            # enumerate scenes and generate image set
+            for i, scene in enumerate(self.scene_prompts):
+                prompt = f"{scene['prompt']}, {self.positive_prompt}"
+                image_files = [
                     os.path.join(
-                        utils.STORYBOARD_PATH, "img2img", f"scene_{i+1:02}_{j+1:02}.png"
+                        self.workspace.storyboard_path, f"scene_{i+1:02}_{j+1:02}.png"
                     )
+                    for j in range(num_images_per_prompt)
+                ]
+
+                seed = self.video.production_config.seed_for("storyboard", i)
+                # dont recreate images, its expensive
+                images_key = memo.digest(
+                    cast_member.sd_model,
+                    [memo.file_digest(lora_path) for lora_path in lora_paths],
+                    prompt,
+                    self.negative_prompt,
+                    image_width,
+                    image_height,
+                    num_inference_steps,
+                    guidance_scale,
+                    num_images_per_prompt,
+                    seed,
+                )
+                if memo.is_fresh(
+                    self.workspace, image_files[0], images_key, image_files
                 ):
-                    logger.info(f"Skipping: img2img/scene_{i+1:02}_{j+1:02}.png")
+                    logger.info(f"Skipping: scene_{i+1:02}_*.png")
                     continue
 
-                file = os.path.join(
-                    utils.STORYBOARD_PATH, f"scene_{i+1:02}_{j+1:02}.png"
-                )
-                scene_image = Image.open(file).convert("RGB")
-                scene_image = scene_image.resize((image_width, image_height))
+                logger.info(f"PP={prompt}")
+                logger.info(f"NP={self.negative_prompt}")
 
-                image = pipe(
+                images = pipe(
                     prompt=prompt,
                     negative_prompt=self.negative_prompt,
-                    image=scene_image,
-                    height=image_height,
                     width=image_width,
+                    height=image_height,
                     num_inference_steps=num_inference_steps,
                     num_images_per_prompt=num_images_per_prompt,
                     guidance_scale=guidance_scale,
-                    strength=noise_strength,
-                ).images[0]
+                    generator=image_gen.generator(seed),
+                ).images
 
-                image.save(
-                    os.path.join(
-                        utils.STORYBOARD_PATH, "img2img", f"scene_{i+1:02}_{j+1:02}.png"
-                    )
-                )
+                # enumerate image set and save each image
+                for image, image_file in zip(images, image_files):
+                    image.save(image_file)
+                memo.record(self.workspace, image_files[0], images_key)
 
-        # release models from vram
-        pipe, scene_image, image = None, None, None
-        del pipe, scene_image, image
-        torch.cuda.empty_cache()
+            return "Done generating images"
 
-        return "Done generating images"
+    def draw(self) -> str:
+        with scheduler.gpu_slot():
+            # generate images
+            self.stable_diffusion()
 
-    def stable_diffusion(self):
-        # setup stable diffusion pipeline
-        cast_member = self.video.director.get_storyboard_artist()
-        lora_paths = []
-        for actor in self.video.actors:
-            if not actor.lora_keyword:
-                continue
-            lora_paths.append(
-                os.path.join("loras", f"{actor.lora_keyword}.safetensors")
-            )
+            # upscale images with img2img
+            self.img2img_upscaler()
 
-        pipe = image_gen.get_pipeline_with_loras(cast_member.sd_model, lora_paths)
-        # settings
-        guidance_scale = 7.5
-        num_inference_steps = 50
-        num_images_per_prompt = self.video.production_config.num_images_per_scene
-        image_width = self.video.production_config.sd_base_image_width
-        image_height = self.video.production_config.sd_base_image_height
-
-        # enumerate scenes and generate image set
-        for i, scene in enumerate(self.scene_prompts):
-            # dont recreate images, its expensive
-            if os.path.exists(
-                os.path.join(
-                    utils.STORYBOARD_PATH, f"scene_{i+1:02}_{num_images_per_prompt}.png"
-                )
-            ):
-                logger.info(f"Skipping: scene_{i+1:02}_{num_images_per_prompt}.png")
-                continue
-
-            prompt = f"{scene['prompt']}, {self.positive_prompt}"
-
-            logger.info(f"PP={prompt}")
-            logger.info(f"NP={self.negative_prompt}")
-
-            images = pipe(
-                prompt=prompt,
-                negative_prompt=self.negative_prompt,
-                width=image_width,
-                height=image_height,
-                num_inference_steps=num_inference_steps,
-                num_images_per_prompt=num_images_per_prompt,
-                guidance_scale=guidance_scale,
-            ).images
-
-            # enumerate image set and save each image
-            for j, image in enumerate(images):
-                image.save(
-                    os.path.join(utils.STORYBOARD_PATH, f"scene_{i+1:02}_{j+1:02}.png")
-                )
-
-        # release models from vram
-        pipe, images, image = None, None, None
-        del pipe, images, image
-        torch.cuda.empty_cache()
-
-        return "Done generating images"
+        return "Done generating storyboard"
 
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
@@ -311,46 +381,70 @@ class StoryBoardArtistTool(AICPBaseTool):
         """Use the tool."""
         # initialize agent
         self.initialize_agent()
+        return self.draw()
 
-        # generate images
-        self.stable_diffusion()
-
-        # upscale images with img2img
-        self.img2img_upscaler()
-
-        return "Done generating storyboard"
-
-    def _arun(
+    async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+        cast_member = self.video.director.get_storyboard_artist()
+        self.positive_prompt = cast_member.positive_prompt
+        self.negative_prompt = cast_member.negative_prompt
+        self.scene_prompts = await self.aego()
+        return await scheduler.run_blocking(self.draw)
+
+    def get_items(self, llm_input) -> list:
+        """The scenes or dialog lines of an LLM input, a prompt is expected per item."""
+        if isinstance(llm_input, list):
+            return llm_input
+        return llm_input["dialog_lines"]
+
+    def get_llm_input(self, llm_input, items: list) -> str:
+        """The LLM input asking for the prompts of some of its items only."""
+        if isinstance(llm_input, list):
+            return yaml.dump(items)
+        return yaml.dump(
+            {
+                **llm_input,
+                "number_of_expected_prompts": len(items),
+                "dialog_lines": items,
+            }
+        )
 
-    def _call_llm(self, params, expected_number_of_prompts):
+    def _call_llm(self, params, llm_input):
         logger.debug("Calling LLM")
-        logger.debug(params)
-        retries = 3
-        while retries > 0:
-            cast_member = self.video.director.get_storyboard_artist()
-            chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
-            try:
-                # Use only the title and description lines to save tokens
-                response = chain.run(
-                    **params,
-                )
-                logger.debug(response)
-                parsed = yaml.load(response, Loader=yaml.Loader)
-                ## Check if parsed has the same number of prompts as expected
-                if len(parsed) != expected_number_of_prompts:
-                    logger.info(
-                        f"Unexpected number of prompts: {len(parsed)} != {expected_number_of_prompts}"
-                    )
-                    raise Exception("Unexpected number of prompts")
-                return parsed
-            except Exception as e:
-                logger.warning(e)
-                logger.info(f"Retrying {retries} more times...")
-                retries -= 1
-
-        logger.error("Failed to generate prompts, no more retries left")
-        raise Exception("Failed to generate prompts")
+        logger.debug(llm_input)
+        cast_member = self.video.director.get_storyboard_artist()
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.STORYBOARD_PROMPTS,
+        )
+        prompts = llms.run_with_repair(
+            chain,
+            params,
+            self.get_items(llm_input),
+            lambda items: self.get_llm_input(llm_input, items),
+            "storyboard prompts",
+        )
+        return schemas.OutputSchema.to_data(prompts)
+
+    async def _acall_llm(self, params, llm_input):
+        logger.debug("Calling LLM")
+        logger.debug(llm_input)
+        cast_member = self.video.director.get_storyboard_artist()
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.STORYBOARD_PROMPTS,
+        )
+        prompts = await llms.arun_with_repair(
+            chain,
+            params,
+            self.get_items(llm_input),
+            lambda items: self.get_llm_input(llm_input, items),
+            "storyboard prompts",
+        )
+        return schemas.OutputSchema.to_data(prompts)
@@ -1,15 +1,13 @@
 import os
-import torch
 import yaml
 
 from typing import Optional
-from diffusers import DPMSolverMultistepScheduler, StableDiffusionPipeline
 from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
 from typing import Optional
-from utils import utils, llms, parsers
+from utils import llms, parsers, scheduler, memo, image_gen
 from .base import AICPBaseTool
 
 
@@ -19,6 +17,9 @@ class ThumbnailArtistTool(AICPBaseTool):
     name = "thumbnailartist"
     description = "Useful when you need to create a thumbnail for your video"
 
+    inputs = ["script"]
+    outputs = ["thumbnails"]
+
     scene_prompts = []
     positive_prompt = ""
     negative_prompt = ""
@@ -32,97 +33,143 @@ class ThumbnailArtistTool(AICPBaseTool):
         self.positive_prompt = cast_member.positive_prompt
         self.negative_prompt = cast_member.negative_prompt
 
-        # load storyboard artist prompts if they exist or create them
-        prompts_file = os.path.join(utils.PATH_PREFIX, "thumbnail_prompts.yaml")
-        if os.path.exists(prompts_file):
-            with open(prompts_file) as prompts:
-                print(f"Loading existing prompts from: {prompts_file}")
-                self.scene_prompts = yaml.load(
-                    prompts.read().strip(), Loader=yaml.Loader
-                )
-        else:
-            print("Generating text-to-image prompts for thumbnail artist...")
-            self.scene_prompts = self.ego()
+        # load thumbnail artist prompts if they are up to date or create them
+        self.scene_prompts = self.ego()
 
-    def ego(self):
-        """Run the script through the mind of the storyboard artist
-        to generate more descriptive prompts"""
+    async def aload_prompts(self):
         cast_member = self.video.director.get_thumbnail_artist()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
+        self.positive_prompt = cast_member.positive_prompt
+        self.negative_prompt = cast_member.negative_prompt
+        self.scene_prompts = await self.aego()
+
+    def get_script_input(self):
         # Use only the description lines to save tokens
         script_input = yaml.dump(
-            [{"description": s["description"]} for s in parsers.get_script()]
+            [
+                {"description": s["description"]}
+                for s in parsers.get_script(self.workspace)
+            ]
+        )
+        prompts_key = memo.digest(
+            self.video.director.get_thumbnail_artist(), script_input
         )
+        return script_input, prompts_key
+
+    def load_cached_prompts(self, prompts_key):
+        prompts_file = self.workspace.path("thumbnail_prompts.yaml")
+        if memo.is_fresh(self.workspace, prompts_file, prompts_key):
+            with open(prompts_file) as prompts:
+                print(f"Loading existing prompts from: {prompts_file}")
+                return yaml.load(prompts.read().strip(), Loader=yaml.Loader)
+        print("Generating text-to-image prompts for thumbnail artist...")
+        return None
 
-        response = chain.run(script_input)
+    def save_prompts(self, response, prompts_key):
         print(response)
 
         # Save the updated script
-        with open(os.path.join(utils.PATH_PREFIX, "thumbnail_prompts.yaml"), "w") as f:
+        prompts_file = self.workspace.path("thumbnail_prompts.yaml")
+        with open(prompts_file, "w") as f:
             f.write(response)
+        memo.record(self.workspace, prompts_file, prompts_key)
 
         return yaml.load(response, Loader=yaml.Loader)
 
+    def get_chain(self):
+        cast_member = self.video.director.get_thumbnail_artist()
+        return llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+        )
+
+    def ego(self):
+        """Run the script through the mind of the storyboard artist
+        to generate more descriptive prompts"""
+        script_input, prompts_key = self.get_script_input()
+        prompts = self.load_cached_prompts(prompts_key)
+        if prompts is not None:
+            return prompts
+        response = self.get_chain().run(script_input)
+        return self.save_prompts(response, prompts_key)
+
+    async def aego(self):
+        script_input, prompts_key = self.get_script_input()
+        prompts = self.load_cached_prompts(prompts_key)
+        if prompts is not None:
+            return prompts
+        response = await self.get_chain().arun(script_input)
+        return self.save_prompts(response, prompts_key)
+
     def stable_diffusion(self):
         # setup stable diffusion pipeline
         cast_member = self.video.director.get_thumbnail_artist()
-        pipe = StableDiffusionPipeline.from_pretrained(
-            cast_member.sd_model,
-            custom_pipeline="lpw_stable_diffusion",
-            torch_dtype=torch.float16,
-        )
-        pipe = pipe.to("cuda")
-        pipe.enable_xformers_memory_efficient_attention()
-        pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
-        #        scheduler.config.algorithm_type = "sde-dpmsolver++"
-        #        pipe.scheduler = scheduler
-
-        # settings
-        guidance_scale = 7.5
-        num_inference_steps = 50
-        num_images_per_prompt = 2
-        image_height = self.video.production_config.sd_base_image_height
-        image_width = self.video.production_config.sd_base_image_width
-
-        # enumerate scenes and generate image set
-        for i, scene in enumerate(self.scene_prompts):
-            # dont recreate images, its expensive
-            if os.path.exists(
-                os.path.join(
-                    utils.THUMBNAILS_PATH,
-                    f"thumbnail_{i+1}_{num_images_per_prompt}.jpg",
-                )
-            ):
-                print(f"Skipping: thumbnail_{i+1}_{num_images_per_prompt}.jpg")
-                continue
-
-            prompt = f"{scene['prompt']}, {self.positive_prompt}"
-
-            print(f"PP={prompt}")
-            print(f"NP={self.negative_prompt}")
-
-            images = pipe(
-                prompt=prompt,
-                negative_prompt=self.negative_prompt,
-                width=image_width,
-                height=image_height,
-                num_inference_steps=num_inference_steps,
-                num_images_per_prompt=num_images_per_prompt,
-                guidance_scale=guidance_scale,
-            ).images
-
-            # enumerate image set and save each image
-            for j, image in enumerate(images):
-                image.save(
-                    os.path.join(utils.THUMBNAILS_PATH, f"thumbnail_{i+1}_{j+1}.jpg")
+        with image_gen.use_lpw_pipeline(cast_member.sd_model) as pipe:
+            # settings
+            guidance_scale = 7.5
+            num_inference_steps = 50
+            num_images_per_prompt = 2
+            image_height = self.video.production_config.sd_base_image_height
+            image_width = self.video.production_config.sd_base_image_width
+
+            # enumerate scenes and generate image set
+            for i, scene in enumerate(self.scene_prompts):
+                prompt = f"{scene['prompt']}, {self.positive_prompt}"
+                image_files = [
+                    os.path.join(
+                        self.workspace.thumbnails_path, f"thumbnail_{i+1}_{j+1}.jpg"
+                    )
+                    for j in range(num_images_per_prompt)
+                ]
+
+                seed = self.video.production_config.seed_for("thumbnail", i)
+                # dont recreate images, its expensive
+                images_key = memo.digest(
+                    cast_member.sd_model,
+                    prompt,
+                    self.negative_prompt,
+                    image_width,
+                    image_height,
+                    num_inference_steps,
+                    guidance_scale,
+                    num_images_per_prompt,
+                    seed,
                 )
+                if memo.is_fresh(
+                    self.workspace, image_files[0], images_key, image_files
+                ):
+                    print(f"Skipping: thumbnail_{i+1}_*.jpg")
+                    continue
+
+                print(f"PP={prompt}")
+                print(f"NP={self.negative_prompt}")
+
+                images = pipe(
+                    prompt=prompt,
+                    negative_prompt=self.negative_prompt,
+                    width=image_width,
+                    height=image_height,
+                    num_inference_steps=num_inference_steps,
+                    num_images_per_prompt=num_images_per_prompt,
+                    guidance_scale=guidance_scale,
+                    generator=image_gen.generator(seed),
+                ).images
+
+                # enumerate image set and save each image
+                for image, image_file in zip(images, image_files):
+                    image.save(image_file)
+                memo.record(self.workspace, image_files[0], images_key)
+
+            return "Done generating images"
+
+    def generate_thumbnails(self):
+        with scheduler.gpu_slot():
+            self.stable_diffusion()
 
-        # release models from vram
-        pipe, images, image = None, None, None
-        del pipe, images, image
-        torch.cuda.empty_cache()
+        # TODO Generate the text
+        # TODO Combine the text and the image
 
-        return "Done generating images"
+        return "Done generating thumbnails"
 
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
@@ -133,15 +180,14 @@ class ThumbnailArtistTool(AICPBaseTool):
             return "Skipping thumbnail artist"
 
         self.initialize_agent()
-        self.stable_diffusion()
+        return self.generate_thumbnails()
 
-        # TODO Generate the text
-        # TODO Combine the text and the image
-
-        return "Done generating thumbnails"
-
-    def _arun(
+    async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+        if self.video.director.get_thumbnail_artist() == None:
+            return "Skipping thumbnail artist"
+
+        await self.aload_prompts()
+        return await scheduler.run_blocking(self.generate_thumbnails)
@@ -7,14 +7,24 @@ from langchain.callbacks.manager import (
 )
 from typing import Optional
 import os
+import re
 import librosa
 import nltk
 import numpy as np
-import torch
 from scipy.io import wavfile
 
-from bark.generation import preload_models, clean_models
-from utils import utils, llms, parsers, voice_gen
+from utils import (
+    llms,
+    llm_executor,
+    llm_batching,
+    parsers,
+    voice_gen,
+    scheduler,
+    memo,
+    tracing,
+    timeline,
+    schemas,
+)
 import math
 import yaml
 from .base import AICPBaseTool
@@ -27,6 +37,9 @@ class VoiceOverArtistTool(AICPBaseTool):
     name = "voiceoverartist"
     description = "Useful when you need to generate a voiceover for the script"
 
+    inputs = ["script"]
+    outputs = ["voiceover", "subtitles"]
+
     actor = {}
     speaker = ""
     scene_prompts = []
@@ -36,50 +49,114 @@ class VoiceOverArtistTool(AICPBaseTool):
         self.load_prompts()
 
     def load_prompts(self):
-        # load voiceover artist prompts if they exist or create them
-        prompts_file = os.path.join(utils.PATH_PREFIX, "voiceover_prompts.yaml")
-        if os.path.exists(prompts_file):
-            with open(prompts_file) as prompts:
-                print("Loading existing prompt file: voiceover_prompts")
-                self.scene_prompts = yaml.load(prompts.read(), Loader=yaml.Loader)
-        else:
-            print("Generating new dialog prompts...")
-            self.scene_prompts = self.ego()
+        # load voiceover artist prompts, only the scene groups with changed
+        # inputs are generated again
+        self.scene_prompts = self.ego()
 
-    def ego(self):
-        """Personalize the dialog according to the selected voice actor"""
-        all_scenes = parsers.get_scenes()
-
-        num_scenes_per_group = 3
-        # Split and do num_scenes_per_group scenes at a time
-        scenes = []
-        for i in range(0, len(all_scenes), num_scenes_per_group):
-            scenes.append(all_scenes[i : i + num_scenes_per_group])
-
-        # Generate the prompts
-        all_prompts = []
-        for scene_group, some_scenes in enumerate(scenes):
-            # If we have a cached version, use that
+    def get_scene_groups(self):
+        """Pack the scenes in as few LLM calls as fit in the model's context.
+
+        Returns a list of (cached_file, group_key, scenes) per group
+        """
+        all_scenes = parsers.get_scenes(self.workspace)
+        cast_member = self.video.director.get_voiceover_artist()
+        params = self.get_params()
+
+        model = cast_member.model
+        budget = llm_batching.get_budget(model, cast_member.prompt, params)
+
+        def cost(scene):
+            # The answer rewrites the lines of the scene, about as long as them
+            return 2 * llm_batching.input_tokens(self.get_scene_input(scene), model)
+
+        scene_groups = llm_batching.pack(all_scenes, budget, cost)
+        groups = []
+        for scene_group, some_scenes in enumerate(scene_groups):
+            # If we have a cached version of the same scenes, use that
             cached_file = os.path.join(
-                utils.VOICEOVER_PATH, f"voiceover_prompts-{scene_group}.yaml"
+                self.workspace.voiceover_path, f"voiceover_prompts-{scene_group}.yaml"
             )
-            if os.path.exists(cached_file):
-                with open(cached_file) as f:
-                    print(f"Loading cached prompts for scenes {scene_group}")
-                    parts = yaml.load(f.read(), Loader=yaml.Loader)
-                    all_prompts.extend(parts)
-                    continue
-            parts = self._call_llm(some_scenes)
-            # Cache parts to file
-            with open(cached_file, "w") as f:
-                f.write(yaml.dump(parts))
+            # Scene durations are left out, they change once the voiceover exists
+            group_key = memo.digest(
+                cast_member,
+                params,
+                [
+                    (scene.scene_title, scene.description, scene.dialogue)
+                    for scene in some_scenes
+                ],
+            )
+            groups.append((cached_file, group_key, some_scenes))
+        logger.info(f"Voiceover of {len(all_scenes)} scenes in {len(groups)} LLM calls")
+        return groups
+
+    def load_cached_group(self, cached_file, group_key):
+        if memo.is_fresh(self.workspace, cached_file, group_key):
+            with open(cached_file) as f:
+                print(f"Loading cached prompts for {os.path.basename(cached_file)}")
+                return yaml.load(f.read(), Loader=yaml.Loader)
+        return None
 
-            all_prompts.extend(parts)
+    def save_group(self, parts, cached_file, group_key):
+        # Cache parts to file
+        with open(cached_file, "w") as f:
+            f.write(yaml.dump(parts))
+        memo.record(self.workspace, cached_file, group_key)
+        return parts
 
-        with open(os.path.join(utils.PATH_PREFIX, "voiceover_prompts.yaml"), "w") as f:
+    def save_prompts(self, groups_parts):
+        all_prompts = [part for parts in groups_parts for part in parts]
+        with open(self.workspace.path("voiceover_prompts.yaml"), "w") as f:
             f.write(yaml.dump(all_prompts))
         return all_prompts
 
+    def ego(self):
+        """Personalize the dialog according to the selected voice actor"""
+
+        def get_group(group):
+            cached_file, group_key, some_scenes = group
+            parts = self.load_cached_group(cached_file, group_key)
+            if parts is None:
+                parts = self.save_group(
+                    self._call_llm(some_scenes), cached_file, group_key
+                )
+            return parts
+
+        groups_parts = llm_executor.fan_out(
+            get_group, self.get_scene_groups(), self.get_model()
+        )
+        return self.save_prompts(groups_parts)
+
+    async def aego(self):
+        """Async version of ego."""
+
+        async def get_group(group):
+            cached_file, group_key, some_scenes = group
+            parts = self.load_cached_group(cached_file, group_key)
+            if parts is None:
+                parts = self.save_group(
+                    await self._acall_llm(some_scenes), cached_file, group_key
+                )
+            return parts
+
+        groups_parts = await llm_executor.afan_out(
+            get_group, self.get_scene_groups(), self.get_model()
+        )
+        return self.save_prompts(groups_parts)
+
+    def get_model(self) -> str:
+        return self.video.director.get_voiceover_artist().model
+
+    def get_params(self) -> dict:
+        """Resolve the cast member prompt params from existing config/director/program"""
+        cast_member = self.video.director.get_voiceover_artist()
+        prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
+        params = {}
+        for param in prompt_params:
+            params[param] = parsers.resolve_param_from_video(
+                video=self.video, param_name=param
+            )
+        return params
+
     def concatenate_and_remove(self, arr, target):
         i = 1  # start from second element
         while i < len(arr):
@@ -90,6 +167,12 @@ class VoiceOverArtistTool(AICPBaseTool):
                 i += 1  # move to the next element
         return arr
 
+    def record(self) -> str:
+        with scheduler.gpu_slot():
+            self.generate_voiceover()
+
+        return "Done generating voiceover audio"
+
     def _run(
         self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
     ) -> str:
@@ -98,96 +181,292 @@ class VoiceOverArtistTool(AICPBaseTool):
         self.initialize_agent()
 
         # then generate the voiceover
-        preload_models()
+        return self.record()
+
+    async def _arun(
+        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
+    ) -> str:
+        """Use the tool."""
+        self.scene_prompts = await self.aego()
+        return await scheduler.run_blocking(self.record)
+
+    def get_sentences(self):
+        """Split the voiceover lines of every scene into the sentences to record.
+
+        Returns a list per scene of (line_index, sentence_index, actor, sentence)
+        """
+        all_sentences = []
+        for scene in self.scene_prompts:
+            scene_sentences = []
+            for line_index, item in enumerate(scene):
+                actor = Actor.from_name(item["actor"])
+                sentences = nltk.sent_tokenize(item["line"])
+
+                # It's way more likely to get a good laugh if it's in the sentence
+                # We get a lot more "just noise" if it is a separate token
+                non_word_tokens = [
+                    "[laughs]",
+                    "[sighs]",
+                    "[clears throat]",
+                    "[gasps]",
+                    "[coughs]",
+                ]
+                for token in non_word_tokens:
+                    sentences = self.concatenate_and_remove(sentences, token)
+
+                for sentence_index, sentence in enumerate(sentences):
+                    scene_sentences.append(
+                        (line_index, sentence_index, actor, sentence)
+                    )
+            all_sentences.append(scene_sentences)
+        return all_sentences
+
+    def remove_stale_sentences(self, sentence_files):
+        """Remove recorded sentences that are no longer part of the script,
+        they would otherwise still be picked up as voiceover lines."""
+        for file in os.listdir(self.workspace.voiceover_path):
+            if not re.fullmatch(r"scene_\d+_line_\d+_\d+\.(wav|json)", file):
+                continue
+            if os.path.splitext(file)[0] not in sentence_files:
+                print(f"Removing stale line {file}")
+                os.remove(os.path.join(self.workspace.voiceover_path, file))
+                if file.endswith(".json"):
+                    timeline.remove(self.workspace, os.path.splitext(file)[0])
+
+    def index_sentence(
+        self,
+        indexed,
+        scene_index,
+        line_index,
+        sentence_index,
+        wav_file,
+        start,
+        force=False,
+    ):
+        """Add the sentence to the timeline index unless it's already there as is.
+
+        `indexed` (id -> entry) is kept up to date with the entries added, pass
+        `force` when the sentence was just recorded again.
+        """
+        id = timeline.sentence_id(scene_index, line_index, sentence_index)
+        if not force and id in indexed and indexed[id]["start"] == start:
+            return
+        with open(wav_file.replace(".wav", ".json"), "r") as f:
+            results = json.load(f)
+        indexed[id] = timeline.append(
+            self.workspace,
+            scene_index,
+            line_index,
+            sentence_index,
+            actor=results.pop("actor"),
+            sentence=results.pop("sentence"),
+            duration=results.pop("duration"),
+            start=start,
+            wav=os.path.relpath(wav_file, self.workspace.root or "."),
+            **results,
+        )
+
+    def get_sentence_wav_file(self, scene_index, line_index, sentence_index) -> str:
+        return os.path.join(
+            self.workspace.voiceover_path,
+            f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}.wav",
+        )
+
+    def record_sentences(self, all_sentences, sentence_keys, indexed):
+        """Record the sentences whose text or actor changed.
+
+        The sentences of an actor are recorded together, their takes are
+        generated in batches. Each sentence is saved and added to the timeline
+        index as soon as its take is accepted, with its previous start, the
+        assembly fixes it if it moved.
+        """
         silence = np.zeros(int(0.25 * voice_gen.NEW_SAMPLE_RATE))
-        pieces = []
-        timecodes = [0]  # Start at 0
+        production_config = self.video.production_config
+        # actor name -> (ids, wav file, key, actor, sentence) of its sentences
+        # to record
+        to_record = {}
+        for scene_index, scene_sentences in enumerate(all_sentences):
+            for (line_index, sentence_index, actor, sentence), sentence_key in zip(
+                scene_sentences, sentence_keys[scene_index]
+            ):
+                sentence_wav_file = self.get_sentence_wav_file(
+                    scene_index, line_index, sentence_index
+                )
+                if memo.is_fresh(self.workspace, sentence_wav_file, sentence_key):
+                    print(f"Skipping line {os.path.basename(sentence_wav_file)}...")
+                    continue
+                to_record.setdefault(actor.name, []).append(
+                    (
+                        (scene_index, line_index, sentence_index),
+                        sentence_wav_file,
+                        sentence_key,
+                        actor,
+                        sentence,
+                    )
+                )
+
+        for sentences in to_record.values():
+            actor = sentences[0][3]
+
+            def save_take(index, take_to_save, sentences=sentences):
+                # Saved as soon as it is final, a crash resumes from there
+                ids, sentence_wav_file, sentence_key, actor, _ = sentences[index]
+                concatenated_take = np.concatenate([take_to_save[0], silence])
+                voice_gen.save_audio_signal_wav(
+                    concatenated_take,
+                    voice_gen.NEW_SAMPLE_RATE,
+                    sentence_wav_file,
+                )
+                # Save the result of the take
+                with open(sentence_wav_file.replace(".wav", ".json"), "w") as f:
+                    # Update the duration to take into account the silence
+                    take_to_save[2]["duration"] = (
+                        len(concatenated_take) / voice_gen.NEW_SAMPLE_RATE
+                    )
+                    # Update the actor name value
+                    take_to_save[2]["actor"] = actor.name
+                    json.dump(take_to_save[2], f, indent=4)
+                memo.record(self.workspace, sentence_wav_file, sentence_key)
+                previous = indexed.get(timeline.sentence_id(*ids))
+                self.index_sentence(
+                    indexed,
+                    *ids,
+                    sentence_wav_file,
+                    start=previous["start"] if previous else 0,
+                    force=True,
+                )
+
+            with tracing.span(
+                "voiceover sentences",
+                category="tts",
+                actor=actor.name,
+                sentences=len(sentences),
+            ):
+                voice_gen.generate_sentences_as_takes(
+                    [sentence for _, _, _, _, sentence in sentences],
+                    history_prompt=actor.speaker,
+                    text_temp=actor.speaker_text_temp,
+                    waveform_temp=actor.speaker_waveform_temp,
+                    max_takes=10,
+                    save_all_takes=True,
+                    speech_wpm=actor.speaker_wpm,
+                    output_dir=self.workspace.voiceover_path,
+                    output_file_prefixes=[
+                        os.path.basename(sentence_wav_file).replace(".wav", "-take")
+                        for _, sentence_wav_file, _, _, _ in sentences
+                    ],
+                    on_best_take=save_take,
+                    seeds=(
+                        None
+                        if production_config.seed is None
+                        else [
+                            production_config.seed_for("voiceover", *ids)
+                            for ids, _, _, _, _ in sentences
+                        ]
+                    ),
+                )
+
+    def generate_voiceover(self):
+        """Record the voiceover lines and the subtitles."""
+        all_sentences = self.get_sentences()
+        # Each sentence is recorded again only if its text, actor or seed
+        # changed
+        production_config = self.video.production_config
+        sentence_keys = [
+            [
+                memo.digest(
+                    actor,
+                    sentence,
+                    production_config.seed_for(
+                        "voiceover", scene_index, line_index, sentence_index
+                    ),
+                )
+                for line_index, sentence_index, actor, sentence in scene_sentences
+            ]
+            for scene_index, scene_sentences in enumerate(all_sentences)
+        ]
+        voiceover_key = memo.digest(sentence_keys)
 
         # dont recreate voiceover, its expensive
-        if os.path.exists(utils.VOICEOVER_WAV_FILE):
+        if memo.is_fresh(
+            self.workspace, self.workspace.voiceover_wav_file, voiceover_key
+        ):
             print("Skipping VO generation...")
         else:
-            for scene_index, scene in enumerate(self.scene_prompts):
-                print(f"--- SCENE: {scene_index + 1}/{len(self.scene_prompts)} ---")
-                for line_index, item in enumerate(scene):
-                    actor = Actor.from_name(item["actor"])
-                    sentences = nltk.sent_tokenize(item["line"])
-
-                    # It's way more likely to get a good laugh if it's in the sentence
-                    # We get a lot more "just noise" if it is a separate token
-                    non_word_tokens = [
-                        "[laughs]",
-                        "[sighs]",
-                        "[clears throat]",
-                        "[gasps]",
-                        "[coughs]",
+            with voice_gen.use_bark_models():
+                self.remove_stale_sentences(
+                    [
+                        f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}"
+                        for scene_index, scene_sentences in enumerate(all_sentences)
+                        for line_index, sentence_index, _, _ in scene_sentences
                     ]
-                    for token in non_word_tokens:
-                        sentences = self.concatenate_and_remove(sentences, token)
-
-                    for sentence_index, sentence in enumerate(sentences):
-                        print(f"{actor.name}: {sentence}")
-                        sentence_wav_file = os.path.join(
-                            utils.VOICEOVER_PATH,
-                            f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}.wav",
+                )
+                indexed = {
+                    entry["id"]: entry for entry in timeline.read(self.workspace) or []
+                }
+                self.record_sentences(all_sentences, sentence_keys, indexed)
+                pieces = []
+                # Start of the next sentence in the voiceover, in seconds
+                offset = 0
+                timecodes = [0]  # Start at 0
+                for scene_index, scene_sentences in enumerate(all_sentences):
+                    for line_index, sentence_index, _, _ in scene_sentences:
+                        sentence_wav_file = self.get_sentence_wav_file(
+                            scene_index, line_index, sentence_index
                         )
-                        if os.path.exists(sentence_wav_file):
-                            print("Skipping line...")
-                            # Load wav file as a piece
-                            audio_array, _ = librosa.load(
-                                sentence_wav_file, sr=voice_gen.NEW_SAMPLE_RATE
-                            )
-                            pieces += [audio_array, silence]
-                            continue
-
-                        take_to_save = voice_gen.generate_speech_as_takes(
-                            sentence,
-                            history_prompt=actor.speaker,
-                            text_temp=actor.speaker_text_temp,
-                            waveform_temp=actor.speaker_waveform_temp,
-                            max_takes=10,
-                            save_all_takes=True,
-                            speech_wpm=actor.speaker_wpm,
-                            output_dir=utils.VOICEOVER_PATH,
-                            output_file_prefix=f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}-take",
+                        # Load wav file as a piece, it already includes the silence
+                        audio_array, _ = librosa.load(
+                            sentence_wav_file, sr=voice_gen.NEW_SAMPLE_RATE
                         )
-                        audio_array = take_to_save[0]
-
-                        concatenated_take = np.concatenate([audio_array, silence])
-                        pieces += [audio_array, silence]
-                        voice_gen.save_audio_signal_wav(
-                            concatenated_take,
-                            voice_gen.NEW_SAMPLE_RATE,
+                        self.index_sentence(
+                            indexed,
+                            scene_index,
+                            line_index,
+                            sentence_index,
                             sentence_wav_file,
+                            start=offset,
                         )
-                        # Save the result of the take
-                        with open(sentence_wav_file.replace(".wav", ".json"), "w") as f:
-                            # Update the duration to take into account the silence
-                            take_to_save[2]["duration"] = (
-                                len(concatenated_take) / voice_gen.NEW_SAMPLE_RATE
-                            )
-                            # Update the actor name value
-                            take_to_save[2]["actor"] = actor.name
-                            json.dump(take_to_save[2], f, indent=4)
-
-                timecodes.append(
-                    math.ceil(sum([len(p) / voice_gen.NEW_SAMPLE_RATE for p in pieces]))
-                )
+                        pieces += [audio_array]
+                        offset += len(audio_array) / voice_gen.NEW_SAMPLE_RATE
 
-            full_audio = np.concatenate(pieces)
-            int_audio_arr = (full_audio * np.iinfo(np.int16).max).astype(np.int16)
-            wavfile.write(
-                utils.VOICEOVER_WAV_FILE, voice_gen.NEW_SAMPLE_RATE, int_audio_arr
-            )
+                    timecodes.append(
+                        math.ceil(
+                            sum([len(p) / voice_gen.NEW_SAMPLE_RATE for p in pieces])
+                        )
+                    )
+
+                full_audio = np.concatenate(pieces)
+                int_audio_arr = (full_audio * np.iinfo(np.int16).max).astype(np.int16)
+                wavfile.write(
+                    self.workspace.voiceover_wav_file,
+                    voice_gen.NEW_SAMPLE_RATE,
+                    int_audio_arr,
+                )
+                with open(self.workspace.voiceover_timecodes, "w") as f:
+                    f.write("\n".join(map(str, timecodes)))
+                memo.record(
+                    self.workspace, self.workspace.voiceover_wav_file, voiceover_key
+                )
+                # The voiceover lines and scene durations changed
+                parsers.invalidate(self.workspace)
 
-        if os.path.exists(utils.VOICEOVER_SUBTITLES):
+        subtitles_key = memo.digest(
+            memo.file_digest(self.workspace.voiceover_wav_file),
+            self.video.production_config.subtitles_fontname,
+            self.video.production_config.subtitles_fontsize,
+            self.video.production_config.subtitles_alignment,
+        )
+        if memo.is_fresh(
+            self.workspace, self.workspace.voiceover_subtitles, subtitles_key
+        ):
             print("Skipping subtitles generation...")
         else:
-            full_transcription = voice_gen.get_whisper_model().transcribe(
-                utils.VOICEOVER_WAV_FILE, word_timestamps=True
-            )
+            with voice_gen.use_whisper_model() as whisper_model:
+                full_transcription = whisper_model.transcribe(
+                    self.workspace.voiceover_wav_file, word_timestamps=True
+                )
 
-            with open(utils.VOICEOVER_SUBTITLES, "w") as f:
+            with open(self.workspace.voiceover_subtitles, "w") as f:
                 srt_data = voice_gen.generate_ass(
                     full_transcription,
                     self.video.production_config.subtitles_fontname,
@@ -195,77 +474,56 @@ class VoiceOverArtistTool(AICPBaseTool):
                     self.video.production_config.subtitles_alignment,
                 )
                 f.write(srt_data)
+            memo.record(
+                self.workspace, self.workspace.voiceover_subtitles, subtitles_key
+            )
 
-            with open(utils.VOICEOVER_TIMECODES, "w") as f:
-                f.write("\n".join(map(str, timecodes)))
-
-        # Due to bug in clean_models
-        while True:
-            try:
-                clean_models()
-                break
-            except:
-                pass
-        torch.cuda.empty_cache()
+    def get_scene_input(self, scene: Scene) -> dict:
+        return {
+            "scene_title": scene.scene_title,
+            "scene_description": scene.description,
+            "scene_lines": [
+                {
+                    "actor": line.actor.name,
+                    "line": line.line,
+                }
+                for line in scene.dialogue
+            ],
+        }
 
-        return "Done generating voiceover audio"
-
-    def _arun(
-        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+    def get_llm_input(self, scenes: list[Scene]) -> str:
+        return yaml.dump([self.get_scene_input(scene) for scene in scenes])
 
     def _call_llm(self, scenes: list[Scene]) -> list:
         cast_member = self.video.director.get_voiceover_artist()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
-        prompt_params = parsers.get_params_from_prompt(cast_member.prompt)
-        # Resolve params from existing config/director/program
-        params = {}
-        for param in prompt_params:
-            params[param] = parsers.resolve_param_from_video(
-                video=self.video, param_name=param
-            )
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.VOICEOVER_LINES,
+        )
+        lines = llms.run_with_repair(
+            chain,
+            self.get_params(),
+            scenes,
+            self.get_llm_input,
+            "voiceover prompts",
+        )
+        return schemas.OutputSchema.to_data(lines)
 
+    async def _acall_llm(self, scenes: list[Scene]) -> list:
         cast_member = self.video.director.get_voiceover_artist()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
-        retries = 3
-        params["input"] = yaml.dump(
-            [
-                {
-                    "scene_title": scene.scene_title,
-                    "scene_description": scene.description,
-                    "scene_lines": [
-                        {
-                            "actor": line.actor.name,
-                            "line": line.line,
-                        }
-                        for line in scene.dialogue
-                    ],
-                }
-                for scene in scenes
-            ]
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+            schema=schemas.VOICEOVER_LINES,
         )
-        while retries > 0:
-            try:
-                response = chain.run(
-                    **params,
-                )
-                print(response)
-                parsed = yaml.load(response, Loader=yaml.Loader)
-                if len(parsed) != len(scenes):
-                    raise Exception("Number of scenes does not match")
-                # Make sure it's an array of arrays that include actor and line
-                for converted_scene in parsed:
-                    for converted_dialogue in converted_scene:
-                        if "actor" not in converted_dialogue:
-                            raise Exception("Actor not found in converted dialogue")
-                        if "line" not in converted_dialogue:
-                            raise Exception("Line not found in converted dialogue")
-                return parsed
-            except Exception as e:
-                retries -= 1
-                if retries == 0:
-                    raise e
-                print("Retrying...")
-        raise Exception("Failed to convert")
+        lines = await llms.arun_with_repair(
+            chain,
+            self.get_params(),
+            scenes,
+            self.get_llm_input,
+            "voiceover prompts",
+        )
+        return schemas.OutputSchema.to_data(lines)
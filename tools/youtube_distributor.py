@@ -9,7 +9,7 @@ from langchain.callbacks.manager import (
     CallbackManagerForToolRun,
 )
 from typing import Optional
-from utils import utils, llms, parsers
+from utils import llms, parsers
 
 
 logger = logging.getLogger(__name__)
@@ -19,29 +19,45 @@ class YoutubeDistributorTool(AICPBaseTool):
     name = "youtubedistributor"
     description = "Useful for distributing videos to youtube"
 
-    def ego(self):
+    inputs = ["script"]
+    outputs = ["distribution_metadata"]
+
+    def get_chain_and_input(self):
         cast_member = self.video.director.get_youtube_distributor()
-        chain = llms.get_llm(model=cast_member.model, template=cast_member.prompt)
+        chain = llms.get_llm(
+            model=cast_member.model,
+            template=cast_member.prompt,
+            cache=cast_member.llm_cache,
+        )
         script_input = yaml.dump(
-            [{"description": s["description"]} for s in parsers.get_script()]
+            [
+                {"description": s["description"]}
+                for s in parsers.get_script(self.workspace)
+            ]
         )
+        return chain, script_input
 
+    def ego(self):
+        chain, script_input = self.get_chain_and_input()
         response = chain.run(script_input)
 
         logger.info("Ego response: %s", response)
         return yaml.load(response, Loader=yaml.Loader)
 
-    def _run(
-        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
-    ) -> str:
-        """Use the tool."""
-        ego_response = self.ego()
+    async def aego(self):
+        chain, script_input = self.get_chain_and_input()
+        response = await chain.arun(script_input)
+
+        logger.info("Ego response: %s", response)
+        return yaml.load(response, Loader=yaml.Loader)
+
+    def save_metadata(self, ego_response) -> str:
         print(ego_response)
-        with open(utils.DISTRIBUTION_METADATA_FILE, "w") as file:
+        with open(self.workspace.distribution_metadata_file, "w") as file:
             file.write(yaml.dump(ego_response))
 
         #        upload_yt.upload_video(upload_yt.Options(
-        #            file=utils.FINAL_VIDEO_FILE,
+        #            file=self.workspace.final_video_file,
         #            title=ego_response["title"],
         #            description=ego_response["description"],
         #            tags=",".join(ego_response["tags"]),
@@ -50,8 +66,14 @@ class YoutubeDistributorTool(AICPBaseTool):
         #
         return "Done uploading video file to youtube, check your channel"
 
-    def _arun(
+    def _run(
+        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None
+    ) -> str:
+        """Use the tool."""
+        return self.save_metadata(self.ego())
+
+    async def _arun(
         self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
     ) -> str:
         """Use the tool."""
-        raise NotImplementedError("Async not implemented")
+        return self.save_metadata(await self.aego())
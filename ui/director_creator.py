@@ -1,4 +1,4 @@
-from utils import utils
+from utils import utils, catalog
 import gradio as gr
 import os
 from models import Director
@@ -36,23 +36,23 @@ def change_artist(artist):
     return change
 
 
-# Same for directors
-directors = [
-    f.split(".")[0] for f in os.listdir(utils.DIRECTOR_PATH) if f.endswith(".yaml")
-]
-
-current_director = Director.from_yaml(
-    os.path.join(utils.DIRECTOR_PATH, f"{directors[0]}.yaml")
-)
+# The director being edited, loaded when the UI is built
+current_director = None
 
 
 def director_creator_ui():
+    global current_director
+    # A copy, the ones of the catalog are shared
+    current_director = Director.from_yaml(
+        catalog.path("directors", catalog.names("directors")[0])
+    )
+
     with gr.Blocks() as demo:
         with gr.Tab("Researcher"):
             researcher = gr.Dropdown(
                 label="Researcher",
-                choices=utils.researchers,
-                value=utils.researchers[0],
+                choices=catalog.names("researchers"),
+                value=catalog.names("researchers")[0],
                 interactive=True,
             )
             researcher_prompt = gr.Textbox(
@@ -66,8 +66,8 @@ def director_creator_ui():
             with gr.Tab("Script Writer"):
                 script_writer = gr.Dropdown(
                     label="Script Writer",
-                    choices=utils.script_writers,
-                    value=utils.script_writers[0],
+                    choices=catalog.names("script_writers"),
+                    value=catalog.names("script_writers")[0],
                     interactive=True,
                 )
                 script_writer_prompt = gr.Textbox(
@@ -81,8 +81,8 @@ def director_creator_ui():
             with gr.Tab("Storyboard Artist"):
                 storyboard_artist = gr.Dropdown(
                     label="Storyboard Artist",
-                    choices=utils.storyboard_artists,
-                    value=utils.storyboard_artists[0],
+                    choices=catalog.names("storyboard_artists"),
+                    value=catalog.names("storyboard_artists")[0],
                     interactive=True,
                 )
                 storyboard_artist_prompt = gr.Textbox(
@@ -96,8 +96,8 @@ def director_creator_ui():
             with gr.Tab("Thumbnail Artist"):
                 thumbnail_artist = gr.Dropdown(
                     label="Thumbnail Artist",
-                    choices=utils.thumbnail_artists,
-                    value=utils.thumbnail_artists[0],
+                    choices=catalog.names("thumbnail_artists"),
+                    value=catalog.names("thumbnail_artists")[0],
                     interactive=True,
                 )
             thumbnail_artist_prompt = gr.Textbox(
@@ -112,8 +112,8 @@ def director_creator_ui():
         with gr.Tab("Voiceover Artist"):
             voiceover_artist = gr.Dropdown(
                 label="Voiceover Artist",
-                choices=utils.voiceover_artists,
-                value=utils.voiceover_artists[0],
+                choices=catalog.names("voiceover_artists"),
+                value=catalog.names("voiceover_artists")[0],
                 interactive=True,
             )
             voiceover_artist_prompt = gr.Textbox(
@@ -128,8 +128,8 @@ def director_creator_ui():
         with gr.Tab("Music Composer"):
             music_composer = gr.Dropdown(
                 label="Music Composer",
-                choices=utils.music_composers,
-                value=utils.music_composers[0],
+                choices=catalog.names("music_composers"),
+                value=catalog.names("music_composers")[0],
                 interactive=True,
             )
             music_composer_prompt = gr.Textbox(
@@ -143,8 +143,8 @@ def director_creator_ui():
         with gr.Tab("Youtube Distributor"):
             youtube_distributor = gr.Dropdown(
                 label="Youtube Distributor",
-                choices=utils.youtube_distributors,
-                value=utils.youtube_distributors[0],
+                choices=catalog.names("youtube_distributors"),
+                value=catalog.names("youtube_distributors")[0],
                 interactive=True,
             )
             youtube_distributor_prompt = gr.Textbox(
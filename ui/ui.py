@@ -1,64 +1,41 @@
-from utils import utils
+from utils import catalog
 from models import Director, ProductionConfig, Program
 from ui.actor_creator import actor_creator_ui
 from ui.director_creator import director_creator_ui
 import gradio as gr
-import os
-
-
-# List files in the actors directory
-# Filter by yaml files, and remove the extension
-actors = [f.split(".")[0] for f in os.listdir(utils.ACTOR_PATH) if f.endswith(".yaml")]
-# Same for directors
-directors = [
-    f.split(".")[0] for f in os.listdir(utils.DIRECTOR_PATH) if f.endswith(".yaml")
-]
-# Same for configs
-production_configs = [
-    f.split(".")[0]
-    for f in os.listdir(utils.PRODUCTION_CONFIG_PATH)
-    if f.endswith(".yaml")
-]
-# Same for programs
-programs = [
-    f.split(".")[0]
-    for f in os.listdir(utils.PROGRAMS_PATH_PREFIX)
-    if f.endswith(".yaml")
-]
-
-current_config = ProductionConfig.from_yaml(
-    os.path.join(utils.PRODUCTION_CONFIG_PATH, f"{production_configs[0]}.yaml")
-)
 
 
 def change_director(director):
     """Change the current director"""
-    d = Director.from_yaml(os.path.join(utils.DIRECTOR_PATH, f"{director}.yaml"))
+    d = catalog.get("directors", director, Director)
     return "\n".join([f"{k}: {v}" for k, v in d.as_dict().items()])
 
 
 def change_production(production):
     """Change the current production"""
-    c = ProductionConfig.from_yaml(
-        os.path.join(utils.PRODUCTION_CONFIG_PATH, f"{production}.yaml")
-    )
+    c = catalog.get("production_configs", production, ProductionConfig)
     return "\n".join([f"{k}: {v}" for k, v in c.__dict__.items()])
 
 
 def change_program(program):
     """Change the current program"""
-    p = Program.from_yaml(os.path.join(utils.PROGRAMS_PATH_PREFIX, f"{program}.yaml"))
+    p = catalog.get("programs", program, Program)
     return "\n".join([f"{k}: {v}" for k, v in p.__dict__.items()])
 
 
 def change_prompt_info_text(program):
     """Change the current prompt info text"""
-    p = Program.from_yaml(os.path.join(utils.PROGRAMS_PATH_PREFIX, f"{program}.yaml"))
+    p = catalog.get("programs", program, Program)
     return gr.update(info=p.prompt_placeholder_text)
 
 
 def make_ui(prep_video_params):
     """Prepare UI blocks"""
+    actors = catalog.names("actors")
+    directors = catalog.names("directors")
+    production_configs = catalog.names("production_configs")
+    programs = catalog.names("programs")
+
     with gr.Blocks() as demo:
         with gr.Tab("Make a video"):
             video_prompt = gr.Textbox(lines=1, label="Video Prompt")
@@ -0,0 +1,340 @@
+"""bark's semantic, coarse and fine stages for a batch of sequences at once.
+
+`bark.generation` samples one sequence at a time. These are the same sampling
+loops over a batch, so the takes of a sentence (or of several sentences of the
+same speaker) go through each model in one forward pass per step instead of
+one per take. Only the sampling voice_gen uses is supported (a temperature,
+no top_k or top_p) and every sequence shares the history prompt.
+
+Every stage takes an optional generator per sequence. The tokens of a
+sequence are then drawn from its own generator, the same whatever else is in
+the batch, instead of from torch's global one.
+"""
+import numpy as np
+import torch
+import torch.nn.functional as F
+from bark import generation
+from bark.generation import (
+    CODEBOOK_SIZE,
+    COARSE_INFER_TOKEN,
+    COARSE_RATE_HZ,
+    COARSE_SEMANTIC_PAD_TOKEN,
+    N_COARSE_CODEBOOKS,
+    N_FINE_CODEBOOKS,
+    SEMANTIC_INFER_TOKEN,
+    SEMANTIC_PAD_TOKEN,
+    SEMANTIC_RATE_HZ,
+    SEMANTIC_VOCAB_SIZE,
+    TEXT_ENCODING_OFFSET,
+    TEXT_PAD_TOKEN,
+)
+
+# bark's limit on the semantic tokens of a sequence, about 15s of speech
+MAX_SEMANTIC_TOKENS = 768
+
+
+def _get_model(name: str):
+    if name not in generation.models:
+        generation.preload_models()
+    model = generation.models[name]
+    if generation.OFFLOAD_CPU:
+        model_on_device = model["model"] if name == "text" else model
+        model_on_device.to(generation.models_devices[name])
+    return model
+
+
+def _offload(model):
+    if generation.OFFLOAD_CPU:
+        model.to("cpu")
+
+
+def seeded_generators(seeds: list[int]) -> list[torch.Generator]:
+    """A generator per seed, on the device bark samples on."""
+    device = generation.models_devices.get("text") or generation._grab_best_device()
+    return [torch.Generator(device).manual_seed(seed) for seed in seeds]
+
+
+def _draw(probs: torch.Tensor, generators: list = None) -> torch.Tensor:
+    """A token per distribution of probs (batch, ..., vocab), shape (batch, ..., 1)."""
+    if generators is None:
+        tokens = torch.multinomial(probs.reshape(-1, probs.shape[-1]), num_samples=1)
+        return tokens.reshape(*probs.shape[:-1], 1)
+    return torch.stack(
+        [
+            torch.multinomial(
+                sequence_probs.reshape(-1, probs.shape[-1]),
+                num_samples=1,
+                generator=generator,
+            ).reshape(*probs.shape[1:-1], 1)
+            for sequence_probs, generator in zip(probs, generators)
+        ]
+    )
+
+
+def _sample(logits: torch.Tensor, temp: float, generators: list = None) -> torch.Tensor:
+    """A token per row of logits (batch, ..., vocab), shape (batch, ..., 1)."""
+    probs = F.softmax(logits / temp, dim=-1)
+    return _draw(probs, generators)
+
+
+def generate_semantic(
+    texts: list[str],
+    history_prompt=None,
+    temp: float = 0.7,
+    min_eos_p: float = 0.2,
+    max_tokens: list = None,
+    generators: list = None,
+) -> list:
+    """The semantic tokens of every text, like generation.generate_text_semantic.
+
+    `max_tokens` is the budget of every sequence (None for bark's limit), the
+    sequences still going past theirs are stopped and returned as None.
+    """
+    if history_prompt is not None:
+        history = generation._load_history_prompt(history_prompt)
+        semantic_history = history["semantic_prompt"].astype(np.int64)[-256:]
+    else:
+        semantic_history = np.array([], dtype=np.int64)
+    semantic_history = np.pad(
+        semantic_history,
+        (0, 256 - len(semantic_history)),
+        constant_values=SEMANTIC_PAD_TOKEN,
+    )
+
+    model_container = _get_model("text")
+    model = model_container["model"]
+    tokenizer = model_container["tokenizer"]
+    device = next(model.parameters()).device
+    rows = []
+    for text in texts:
+        text = generation._normalize_whitespace(text)
+        encoded_text = np.array(generation._tokenize(tokenizer, text))[:256]
+        encoded_text = np.pad(
+            encoded_text + TEXT_ENCODING_OFFSET,
+            (0, 256 - len(encoded_text)),
+            constant_values=TEXT_PAD_TOKEN,
+        )
+        rows.append(np.hstack([encoded_text, semantic_history, [SEMANTIC_INFER_TOKEN]]))
+
+    batch = len(texts)
+    # The number of tokens of every sequence, -1 until it ends
+    lengths = np.full(batch, -1)
+    budgets = np.array(
+        [MAX_SEMANTIC_TOKENS if m is None else m for m in max_tokens or [None] * batch]
+    )
+    over_budget = np.zeros(batch, dtype=bool)
+    tokens = []
+    with generation._inference_mode():
+        x = torch.from_numpy(np.stack(rows).astype(np.int64)).to(device)
+        kv_cache = None
+        for n in range(MAX_SEMANTIC_TOKENS):
+            x_input = x if kv_cache is None else x[:, [-1]]
+            logits, kv_cache = model(
+                x_input, merge_context=True, use_cache=True, past_kv=kv_cache
+            )
+            # The semantic tokens and the end of the sequence
+            relevant_logits = torch.hstack(
+                (
+                    logits[:, 0, :SEMANTIC_VOCAB_SIZE],
+                    logits[:, 0, [SEMANTIC_PAD_TOKEN]],
+                )
+            )
+            probs = F.softmax(relevant_logits / temp, dim=-1)
+            item_next = _draw(probs, generators)
+            eos = (item_next[:, 0] == SEMANTIC_VOCAB_SIZE) | (probs[:, -1] >= min_eos_p)
+            lengths[(lengths < 0) & eos.cpu().numpy()] = n
+            over_budget |= (lengths < 0) & (n >= budgets)
+            if ((lengths >= 0) | over_budget).all():
+                break
+            # The ended sequences keep going, their tokens are dropped
+            x = torch.cat((x, item_next), dim=1)
+            tokens.append(item_next)
+        lengths[lengths < 0] = len(tokens)
+        generated = (
+            torch.cat(tokens, dim=1).cpu().numpy()
+            if tokens
+            else np.zeros((batch, 0), dtype=np.int64)
+        )
+    _offload(model)
+    generation._clear_cuda_cache()
+    return [
+        None if over_budget[i] else generated[i, :length]
+        for i, length in enumerate(lengths)
+    ]
+
+
+def _coarse_history(history_prompt, max_semantic_history: int, ratio: float):
+    """The semantic and coarse history, trimmed like generation.generate_coarse."""
+    if history_prompt is None:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    history = generation._load_history_prompt(history_prompt)
+    x_semantic_history = history["semantic_prompt"]
+    x_coarse_history = (
+        generation._flatten_codebooks(history["coarse_prompt"]) + SEMANTIC_VOCAB_SIZE
+    )
+    n_semantic_hist_provided = np.min(
+        [
+            max_semantic_history,
+            len(x_semantic_history) - len(x_semantic_history) % 2,
+            int(np.floor(len(x_coarse_history) / ratio)),
+        ]
+    )
+    n_coarse_hist_provided = int(round(n_semantic_hist_provided * ratio))
+    x_semantic_history = x_semantic_history[-n_semantic_hist_provided:]
+    x_coarse_history = x_coarse_history[-n_coarse_hist_provided:]
+    # bark's hack for time alignment
+    x_coarse_history = x_coarse_history[:-2]
+    return x_semantic_history.astype(np.int64), x_coarse_history.astype(np.int64)
+
+
+def generate_coarse(
+    semantics: list[np.ndarray],
+    history_prompt=None,
+    temp: float = 0.7,
+    max_coarse_history: int = 630,
+    sliding_window_len: int = 60,
+    generators: list = None,
+) -> list[np.ndarray]:
+    """The coarse codes of every semantic sequence, like generation.generate_coarse.
+
+    The sequences step together, the shorter ones are padded like bark pads
+    the end of any sequence and their extra codes are dropped.
+    """
+    ratio = COARSE_RATE_HZ / SEMANTIC_RATE_HZ * N_COARSE_CODEBOOKS
+    max_semantic_history = int(np.floor(max_coarse_history / ratio))
+    x_semantic_history, x_coarse_history = _coarse_history(
+        history_prompt, max_semantic_history, ratio
+    )
+    all_steps = [
+        int(round(np.floor(len(s) * ratio / N_COARSE_CODEBOOKS) * N_COARSE_CODEBOOKS))
+        for s in semantics
+    ]
+    n_steps = max(all_steps)
+    longest = max(len(s) for s in semantics)
+    x_semantic = np.stack(
+        [
+            np.hstack(
+                [
+                    x_semantic_history,
+                    s,
+                    np.full(longest - len(s), COARSE_SEMANTIC_PAD_TOKEN),
+                ]
+            )
+            for s in semantics
+        ]
+    ).astype(np.int64)
+    batch = len(semantics)
+    base_semantic_idx = len(x_semantic_history)
+
+    model = _get_model("coarse")
+    device = next(model.parameters()).device
+    with generation._inference_mode():
+        x_semantic_in = torch.from_numpy(x_semantic).to(device)
+        x_coarse_in = torch.from_numpy(np.tile(x_coarse_history, (batch, 1))).to(device)
+        infer_token = torch.full((batch, 1), COARSE_INFER_TOKEN, device=device)
+        n_step = 0
+        while n_step < n_steps:
+            semantic_idx = base_semantic_idx + int(round(n_step / ratio))
+            x_in = x_semantic_in[:, max(0, semantic_idx - max_semantic_history) :]
+            x_in = x_in[:, :256]
+            x_in = F.pad(
+                x_in, (0, 256 - x_in.shape[-1]), "constant", COARSE_SEMANTIC_PAD_TOKEN
+            )
+            x_in = torch.hstack(
+                [x_in, infer_token, x_coarse_in[:, -max_coarse_history:]]
+            )
+            kv_cache = None
+            for _ in range(min(sliding_window_len, n_steps - n_step)):
+                is_major_step = n_step % N_COARSE_CODEBOOKS == 0
+                x_input = x_in if kv_cache is None else x_in[:, [-1]]
+                logits, kv_cache = model(x_input, use_cache=True, past_kv=kv_cache)
+                logit_start_idx = (
+                    SEMANTIC_VOCAB_SIZE + (1 - int(is_major_step)) * CODEBOOK_SIZE
+                )
+                relevant_logits = logits[
+                    :, 0, logit_start_idx : logit_start_idx + CODEBOOK_SIZE
+                ]
+                item_next = _sample(relevant_logits, temp, generators) + logit_start_idx
+                x_coarse_in = torch.cat((x_coarse_in, item_next), dim=1)
+                x_in = torch.cat((x_in, item_next), dim=1)
+                n_step += 1
+        generated = x_coarse_in[:, len(x_coarse_history) :].cpu().numpy()
+    _offload(model)
+    generation._clear_cuda_cache()
+
+    coarses = []
+    for i, steps in enumerate(all_steps):
+        coarse = generated[i, :steps].reshape(-1, N_COARSE_CODEBOOKS).T
+        coarse = coarse - SEMANTIC_VOCAB_SIZE
+        for n in range(1, N_COARSE_CODEBOOKS):
+            coarse[n, :] -= n * CODEBOOK_SIZE
+        coarses.append(coarse)
+    return coarses
+
+
+def generate_fine(
+    coarses: list[np.ndarray],
+    history_prompt=None,
+    temp: float = 0.5,
+    generators: list = None,
+) -> list[np.ndarray]:
+    """The fine codes of every coarse sequence, like generation.generate_fine.
+
+    The shorter sequences are padded to the longest one, as bark pads the
+    sequences shorter than the model's window.
+    """
+    n_coarse = N_COARSE_CODEBOOKS
+    longest = max(coarse.shape[1] for coarse in coarses)
+    in_arr = np.stack(
+        [
+            np.pad(
+                coarse,
+                ((0, N_FINE_CODEBOOKS - n_coarse), (0, longest - coarse.shape[1])),
+                constant_values=CODEBOOK_SIZE,
+            )
+            for coarse in coarses
+        ]
+    ).astype(np.int64)
+    n_history = 0
+    if history_prompt is not None:
+        history = generation._load_history_prompt(history_prompt)
+        x_fine_history = history["fine_prompt"][:, -512:].astype(np.int64)
+        n_history = x_fine_history.shape[1]
+        in_arr = np.concatenate(
+            [np.tile(x_fine_history, (len(coarses), 1, 1)), in_arr], axis=2
+        )
+    # The model isn't causal, it needs a full window
+    n_remove_from_end = max(0, 1024 - in_arr.shape[2])
+    in_arr = np.pad(
+        in_arr, ((0, 0), (0, 0), (0, n_remove_from_end)), constant_values=CODEBOOK_SIZE
+    )
+    n_loops = max(0, int(np.ceil((longest - (1024 - n_history)) / 512))) + 1
+
+    model = _get_model("fine")
+    device = next(model.parameters()).device
+    with generation._inference_mode():
+        # (batch, time, codebooks)
+        in_arr = torch.from_numpy(in_arr.transpose(0, 2, 1).copy()).to(device)
+        length = in_arr.shape[1]
+        for n in range(n_loops):
+            start_idx = min(n * 512, length - 1024)
+            start_fill_idx = min(n_history + n * 512, length - 512)
+            rel_start_fill_idx = start_fill_idx - start_idx
+            in_buffer = in_arr[:, start_idx : start_idx + 1024, :].clone()
+            for nn in range(n_coarse, N_FINE_CODEBOOKS):
+                logits = model(nn, in_buffer)
+                relevant_logits = logits[:, rel_start_fill_idx:, :CODEBOOK_SIZE]
+                codebook_preds = _sample(relevant_logits, temp, generators)[..., 0]
+                in_buffer[:, rel_start_fill_idx:, nn] = codebook_preds
+            in_arr[
+                :,
+                start_fill_idx : start_fill_idx + 1024 - rel_start_fill_idx,
+                n_coarse:,
+            ] = in_buffer[:, rel_start_fill_idx:, n_coarse:]
+        generated = in_arr.cpu().numpy().transpose(0, 2, 1)
+    _offload(model)
+    generation._clear_cuda_cache()
+    return [
+        generated[i, :, n_history : n_history + coarse.shape[1]]
+        for i, coarse in enumerate(coarses)
+    ]
@@ -0,0 +1,51 @@
+"""Load the cast members (and actors) once per version of their YAML file.
+
+The cast is looked up over and over while making a video (every tool asks the
+director for its cast member, every voiceover line for its actor), so each
+file is parsed once and the same instance is returned until the file changes
+on disk, which a long running worker picks up on the next lookup.
+
+The instances are shared, treat them as read only.
+"""
+import os
+import threading
+from typing import Type, TypeVar
+
+import yaml
+from dacite import from_dict
+
+# The C loader is much faster, fall back to the python one if libyaml is missing
+Loader = getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+# (data class, path) -> ((mtime, size), instance)
+_cache: dict[tuple[type, str], tuple[tuple[int, int], object]] = {}
+
+
+def load_yaml(path: str):
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=Loader)
+
+
+def load(data_class: Type[T], path: str) -> T:
+    """Return the data class read from the YAML file at path."""
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = (data_class, os.path.abspath(path))
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    instance = from_dict(data_class=data_class, data=load_yaml(path))
+    with _lock:
+        _cache[key] = (version, instance)
+    return instance
+
+
+def clear():
+    """Forget the loaded cast."""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,73 @@
+"""Find the programs, cast members, actors and production configs on disk.
+
+Nothing is listed at import time, a directory is listed the first time its
+kind is asked for and then again only if its mtime changed (files were added
+or removed), checking the mtime at most every AICP_CATALOG_POLL_S seconds.
+That keeps a cast tree on a slow (e.g. network) mount from being listed on
+every import and every UI interaction. The entries themselves are parsed and
+cached by utils.cast.
+"""
+import os
+import time
+import threading
+
+from utils import utils, cast
+
+POLL_INTERVAL_S = float(os.environ.get("AICP_CATALOG_POLL_S", "2"))
+
+# kind -> directory of its YAML files
+DIRECTORIES = {
+    "programs": utils.PROGRAMS_PATH_PREFIX,
+    "actors": utils.ACTOR_PATH,
+    "directors": utils.DIRECTOR_PATH,
+    "production_configs": utils.PRODUCTION_CONFIG_PATH,
+    "researchers": utils.RESEARCHER_PATH,
+    "script_writers": utils.SCRIPT_WRITER_PATH,
+    "storyboard_artists": utils.STORYBOARD_ARTIST_PATH,
+    "thumbnail_artists": utils.THUMBNAIL_ARTIST_PATH,
+    "animation_artists": utils.ANIMATION_ARTIST_PATH,
+    "voiceover_artists": utils.VOICEOVER_ARTIST_PATH,
+    "music_composers": utils.MUSIC_COMPOSER_PATH,
+    "youtube_distributors": utils.YOUTUBE_DISTRIBUTOR_PATH,
+}
+
+_lock = threading.Lock()
+# kind -> (last checked, directory mtime, sorted names)
+_listings: dict[str, tuple[float, int, list[str]]] = {}
+
+
+def names(kind: str) -> list[str]:
+    """The names (file names without .yaml) of the entries of a kind, sorted."""
+    directory = DIRECTORIES[kind]
+    now = time.monotonic()
+    with _lock:
+        listing = _listings.get(kind)
+    if listing is not None and now - listing[0] < POLL_INTERVAL_S:
+        return listing[2]
+
+    mtime = os.stat(directory).st_mtime_ns
+    if listing is None or listing[1] != mtime:
+        entries = sorted(
+            f[: -len(".yaml")] for f in os.listdir(directory) if f.endswith(".yaml")
+        )
+    else:
+        entries = listing[2]
+    with _lock:
+        _listings[kind] = (now, mtime, entries)
+    return entries
+
+
+def path(kind: str, name: str) -> str:
+    """The YAML file of an entry."""
+    return os.path.join(DIRECTORIES[kind], f"{name}.yaml")
+
+
+def get(kind: str, name: str, data_class):
+    """The parsed entry, shared until its file changes (see utils.cast)."""
+    return cast.load(data_class, path(kind, name))
+
+
+def refresh():
+    """List every directory again on the next lookup."""
+    with _lock:
+        _listings.clear()
@@ -1,4 +1,5 @@
 import subprocess
+import contextlib
 import sys
 import torch as th
 import torchaudio as ta
@@ -8,6 +9,7 @@ from demucs.apply import apply_model
 from demucs.audio import AudioFile, convert_audio
 from demucs.pretrained import get_model_from_args
 from demucs.repo import ModelLoadingError
+from utils import model_registry, fake_backend
 
 
 def load_track(track, audio_channels, samplerate):
@@ -76,28 +78,35 @@ def separate_sources(
             self.repo = None
 
     args = ModelArgs(model_name, device)
-    # Load pre-trained model
-    try:
-        model = get_model_from_args(args)
-    except ModelLoadingError as error:
-        fatal(error.args[0])
-
-    # Load and preprocess audio
-    wav = load_track(track_path, model.audio_channels, model.samplerate)
-    ref = wav.mean(0)
-    wav -= ref.mean()
-    wav /= ref.std()
-
-    # Apply model to separate sources
-    sources = apply_model(
-        model,
-        wav[None],
-        device=device,
-        shifts=shifts,
-        split=split,
-        overlap=overlap,
-        num_workers=0,
-    )[0]
+    # Load pre-trained model, it stays loaded until the sources are separated
+    with contextlib.ExitStack() as stack:
+        try:
+            model = stack.enter_context(
+                model_registry.use(
+                    f"demucs-{model_name}",
+                    lambda: get_model_from_args(args),
+                    device=device,
+                )
+            )
+        except ModelLoadingError as error:
+            fatal(error.args[0])
+
+        # Load and preprocess audio
+        wav = load_track(track_path, model.audio_channels, model.samplerate)
+        ref = wav.mean(0)
+        wav -= ref.mean()
+        wav /= ref.std()
+
+        # Apply model to separate sources
+        sources = apply_model(
+            model,
+            wav[None],
+            device=device,
+            shifts=shifts,
+            split=split,
+            overlap=overlap,
+            num_workers=0,
+        )[0]
 
     # Post-process separated sources
     sources *= ref.std()
@@ -122,5 +131,7 @@ def demucs_voice_filter(filepath):
     """
     Separate the voice from a given audio track and return the filtered track.
     """
+    if fake_backend.is_enabled():
+        return fake_backend.fake_voice_filter(filepath)
     sources = separate_sources(filepath)
     return sources["vocals"][0]
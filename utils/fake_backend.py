@@ -0,0 +1,161 @@
+"""Stand-ins for the models, to run the whole production offline on a CPU.
+
+With `main.py --backend fake` (or `AICP_BACKEND=fake`) the LLMs (see
+llms.FakeLLM), bark, whisper, stable diffusion, MusicGen and demucs are
+replaced by the fakes below, everything else (parsers, memo, ffmpeg, pydub,
+animation ...) runs for real. The fakes quickly return well formed results of
+a plausible size, so a run measures the orchestration and I/O overhead the real
+models hide.
+"""
+import os
+import wave
+import hashlib
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ["real", "fake"]
+BACKEND = os.environ.get("AICP_BACKEND", "real")
+
+# Number of scenes (or items) made up when the input doesn't say how many
+FAKE_LIST_LENGTH = int(os.environ.get("AICP_FAKE_LIST_LENGTH", "4"))
+
+
+def set_backend(backend: str):
+    """Select the model backend, one of BACKENDS."""
+    global BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    BACKEND = backend
+
+
+def is_enabled() -> bool:
+    return BACKEND == "fake"
+
+
+def seed_of(*parts) -> int:
+    """A stable seed from the given parts, so fake outputs are reproducible."""
+    return int(hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:8], 16)
+
+
+LOREM = (
+    "the quick brown fox jumps over the lazy dog while a curious owl watches "
+    "from an old oak tree and the river hums a quiet song under the moonlight"
+).split()
+
+
+def made_up_sentences(seed: int, count: int = 2, words: int = 12) -> str:
+    """Some sentences of lorem ipsum like text."""
+    rng = np.random.default_rng(seed)
+    return " ".join(
+        " ".join(rng.choice(LOREM, size=words)).capitalize() + "." for _ in range(count)
+    )
+
+
+def fake_speech(sentence: str, speech_wpm: int, sample_rate: int) -> np.ndarray:
+    """A sine wave as long as the sentence would take to say."""
+    from utils import voice_gen
+
+    duration = 0.8 * voice_gen.estimate_speech_duration_with_pauses(
+        sentence, speaking_rate=speech_wpm
+    )
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    frequency = 110 + seed_of(sentence) % 110
+    # Syllable like amplitude modulation, faded out at the end
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    envelope[-int(0.3 * sample_rate) :] = 0
+    return (0.3 * envelope * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    """Read a 16 bit wav as a mono float array."""
+    with wave.open(path, "rb") as f:
+        sample_rate = f.getframerate()
+        channels = f.getnchannels()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    audio = data.reshape(-1, channels).mean(axis=1) / np.iinfo(np.int16).max
+    return audio.astype(np.float32), sample_rate
+
+
+class FakeWhisper:
+    """Transcribes every half second of audio as a word."""
+
+    def transcribe(self, audio, word_timestamps=False, **kwargs) -> dict:
+        if isinstance(audio, str):
+            samples, sample_rate = read_wav(audio)
+            duration = len(samples) / sample_rate
+        else:
+            # whisper takes 16kHz tensors
+            duration = len(audio) / 16000
+        words = [
+            {"word": f" {LOREM[i % len(LOREM)]}", "start": start, "end": start + 0.5}
+            for i, start in enumerate(np.arange(0, duration - 0.5, 0.5))
+        ]
+        return {
+            "text": " ".join(word["word"].strip() for word in words),
+            "segments": [{"words": words}],
+        }
+
+
+class FakeDiffusionPipeline:
+    """Paints solid colour images, the colour depends on the prompt."""
+
+    def __call__(
+        self,
+        prompt: str,
+        width: int = 512,
+        height: int = 512,
+        num_images_per_prompt: int = 1,
+        image=None,
+        **kwargs,
+    ):
+        from PIL import Image
+
+        if image is not None:
+            width, height = image.size
+        images = []
+        for i in range(num_images_per_prompt):
+            rng = np.random.default_rng(seed_of(prompt, i))
+            colour = tuple(int(c) for c in rng.integers(0, 256, size=3))
+            images.append(Image.new("RGB", (width, height), colour))
+        return SimpleNamespace(images=images)
+
+
+class FakeMusicGen:
+    """Generates a sustained chord per description, like MusicGen's output."""
+
+    sample_rate = 32000
+
+    def __init__(self):
+        self.duration = 30
+
+    def set_generation_params(self, duration: float = 30, **kwargs):
+        self.duration = duration
+
+    def generate(self, descriptions: list[str], progress: bool = False):
+        import torch
+
+        t = np.arange(int(self.duration * self.sample_rate)) / self.sample_rate
+        outputs = []
+        for description in descriptions:
+            rng = np.random.default_rng(seed_of(description))
+            chord = sum(
+                np.sin(2 * np.pi * frequency * t)
+                for frequency in rng.uniform(110, 440, size=3)
+            )
+            outputs.append((0.1 * chord).astype(np.float32)[None])
+        return torch.from_numpy(np.stack(outputs))
+
+
+def fake_voice_filter(filepath: str, sample_rate: int = 44100):
+    """Return the voiceover itself as demucs' vocals, at demucs' sample rate."""
+    import torch
+
+    audio, original_rate = read_wav(filepath)
+    positions = np.arange(0, len(audio), original_rate / sample_rate)
+    return torch.from_numpy(
+        np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    )
@@ -1,15 +1,43 @@
 import logging
+import contextlib
+from typing import Optional
+
 import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import (
+    DDIMScheduler,
+    DPMSolverMultistepScheduler,
+    StableDiffusionImg2ImgPipeline,
+    StableDiffusionPipeline,
+)
+from utils import model_registry, fake_backend
 
 logger = logging.getLogger(__name__)
 
 
-def get_pipeline_with_loras(
-    base_model_path, checkpoint_path: str | list[str]
-) -> StableDiffusionPipeline:
-    """Get a StableDiffusionPipeline with zero or more loras loaded."""
+def generator(seed: Optional[int]) -> Optional[torch.Generator]:
+    """A generator for the pipelines seeded with `seed`, None for a random one."""
+    if seed is None or fake_backend.is_enabled():
+        return None
+    return torch.Generator("cuda").manual_seed(seed)
+
+
+def use_pipeline_with_loras(base_model_path, checkpoint_path: str | list[str]):
+    """Use a StableDiffusionPipeline with zero or more loras loaded.
+
+    The pipeline stays loaded while in this context.
+    """
+    checkpoint_paths = (
+        checkpoint_path if isinstance(checkpoint_path, list) else [checkpoint_path]
+    )
+    if fake_backend.is_enabled():
+        return contextlib.nullcontext(fake_backend.FakeDiffusionPipeline())
+    return model_registry.use(
+        ("stable-diffusion", base_model_path, tuple(checkpoint_paths)),
+        lambda: _load_pipeline_with_loras(base_model_path, checkpoint_paths),
+    )
+
 
+def _load_pipeline_with_loras(base_model_path, checkpoint_paths: list[str]):
     pipeline = StableDiffusionPipeline.from_pretrained(
         base_model_path, torch_dtype=torch.float16, safety_checker=None
     )
@@ -19,10 +47,53 @@ def get_pipeline_with_loras(
         pipeline.scheduler.config, use_karras_sigmas=True
     )
     pipeline.scheduler.config.algorithm_type = "sde-dpmsolver++"
-    if isinstance(checkpoint_path, list):
-        for path in checkpoint_path:
-            pipeline.load_lora_weights(path)
-    else:
-        pipeline.load_lora_weights(checkpoint_path)
+    for path in checkpoint_paths:
+        pipeline.load_lora_weights(path)
+
+    return pipeline
+
+
+def use_lpw_pipeline(base_model_path):
+    """Use a long prompt weighting StableDiffusionPipeline while in this context."""
+    if fake_backend.is_enabled():
+        return contextlib.nullcontext(fake_backend.FakeDiffusionPipeline())
+    return model_registry.use(
+        ("stable-diffusion-lpw", base_model_path),
+        lambda: _load_lpw_pipeline(base_model_path),
+    )
+
 
+def _load_lpw_pipeline(base_model_path):
+    pipeline = StableDiffusionPipeline.from_pretrained(
+        base_model_path,
+        custom_pipeline="lpw_stable_diffusion",
+        torch_dtype=torch.float16,
+    )
+    pipeline = pipeline.to("cuda")
+    pipeline.enable_xformers_memory_efficient_attention()
+    pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
+        pipeline.scheduler.config
+    )
+    return pipeline
+
+
+def use_img2img_pipeline(base_model_path):
+    """Use a StableDiffusionImg2ImgPipeline while in this context."""
+    if fake_backend.is_enabled():
+        return contextlib.nullcontext(fake_backend.FakeDiffusionPipeline())
+    return model_registry.use(
+        ("stable-diffusion-img2img", base_model_path),
+        lambda: _load_img2img_pipeline(base_model_path),
+    )
+
+
+def _load_img2img_pipeline(base_model_path):
+    pipeline = StableDiffusionImg2ImgPipeline.from_pretrained(
+        base_model_path,
+        custom_pipeline="lpw_stable_diffusion",
+        torch_dtype=torch.float16,
+    )
+    pipeline = pipeline.to("cuda")
+    pipeline.enable_xformers_memory_efficient_attention()
+    pipeline.scheduler = DDIMScheduler.from_config(pipeline.scheduler.config)
     return pipeline
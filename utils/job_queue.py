@@ -0,0 +1,246 @@
+"""A SQLite backed queue of videos to produce.
+
+Jobs are added with `main.py --enqueue` (or `--enqueue-file`) and worked
+through by a long running `main.py --worker`. The worker runs the production
+one step at a time across all the queued jobs, so every job at the same step
+runs while that step's models are loaded, instead of paying the imports and
+model loads again for each video.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.environ.get("AICP_JOBS_DB", "jobs.db")
+# Number of times a step is attempted before the job is marked as failed
+MAX_ATTEMPTS = 3
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT NOT NULL,
+    program TEXT NOT NULL,
+    director TEXT NOT NULL,
+    actors TEXT NOT NULL,
+    config TEXT NOT NULL,
+    working_dir TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class Job:
+    """A queued video, with the same fields as main.prep_video_params."""
+
+    id: int
+    prompt: str
+    program: str
+    director: str
+    actors: list[str]
+    config: str
+    working_dir: str
+    step: str
+    status: str
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row):
+        """Create a job from a row of the jobs table."""
+        return cls(
+            id=row["id"],
+            prompt=row["prompt"],
+            program=row["program"],
+            director=row["director"],
+            actors=json.loads(row["actors"]),
+            config=row["config"],
+            working_dir=row["working_dir"],
+            step=row["step"],
+            status=row["status"],
+            attempts=row["attempts"],
+            error=row["error"],
+        )
+
+
+def connect(db_path: str = JOBS_DB) -> sqlite3.Connection:
+    """Open the jobs database, creating it if needed."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        conn.execute(SCHEMA)
+    return conn
+
+
+def enqueue(
+    conn: sqlite3.Connection,
+    prompt: str,
+    program: str,
+    director: str,
+    actors: list[str],
+    config: str,
+    working_dir: str,
+    step: str,
+) -> int:
+    """Add a video to the queue, returns the job id."""
+    now = time.time()
+    with conn:
+        cursor = conn.execute(
+            """INSERT INTO jobs
+            (prompt, program, director, actors, config, working_dir, step, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                prompt,
+                program,
+                director,
+                json.dumps(actors),
+                config,
+                working_dir,
+                step,
+                QUEUED,
+                now,
+                now,
+            ),
+        )
+    return cursor.lastrowid
+
+
+# The params of an inputs.txt line, in order, and their names in the file
+INPUTS_FIELDS = {
+    "prompt": "prompt",
+    "program": "program",
+    "director": "director",
+    "config": "config",
+    "working_dir": "output",
+    "actors": "actors",
+}
+
+
+def parse_inputs_line(line: str) -> Optional[dict]:
+    """Parse an inputs.txt line: prompt | program | director | config | output | actors
+
+    actors are comma separated, returns None for blank and comment (#) lines.
+    Raises a ValueError for a line without all the fields.
+    """
+    if not line.strip() or line.lstrip().startswith("#"):
+        return None
+    parts = [part.strip() for part in line.split("|")]
+    if len(parts) != len(INPUTS_FIELDS):
+        raise ValueError(
+            f"expected {len(INPUTS_FIELDS)} fields separated by |, got {len(parts)}"
+        )
+    params = dict(zip(INPUTS_FIELDS, parts))
+    params["actors"] = [
+        actor.strip() for actor in params["actors"].split(",") if actor.strip()
+    ]
+    missing = [label for name, label in INPUTS_FIELDS.items() if not params[name]]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    return params
+
+
+def get_jobs(conn: sqlite3.Connection, status: Optional[str] = None) -> list[Job]:
+    """List the jobs, optionally only the ones with the given status."""
+    if status is None:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)
+        ).fetchall()
+    return [Job.from_row(row) for row in rows]
+
+
+def update_job(conn: sqlite3.Connection, job: Job, **fields):
+    """Update the given fields of a job, both in the database and the object."""
+    for name, value in fields.items():
+        setattr(job, name, value)
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with conn:
+        conn.execute(
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), time.time(), job.id),
+        )
+
+
+def run_worker(
+    run_step: Callable[[Job, str], str],
+    steps: list[str],
+    db_path: str = JOBS_DB,
+    poll_interval: float = 10,
+    drain: bool = False,
+):
+    """Work through the queued jobs, one step at a time across all of them.
+
+    `run_step(job, step)` runs a single step of a job, `steps` lists the step
+    names in production order. With `drain` the worker returns once there is
+    nothing left to do, otherwise it keeps polling for new jobs.
+    """
+    conn = connect(db_path)
+    # Jobs left running by a worker that died are picked up again
+    for job in get_jobs(conn, RUNNING):
+        update_job(conn, job, status=QUEUED)
+
+    while True:
+        jobs = get_jobs(conn, QUEUED)
+        if not jobs:
+            if drain:
+                logger.info("No more queued jobs")
+                return
+            time.sleep(poll_interval)
+            continue
+
+        # Run the earliest step any job is waiting on, for all of them at once
+        step = min((job.step for job in jobs), key=steps.index)
+        batch = [job for job in jobs if job.step == step]
+        logger.info("Running step %s for jobs %s", step, [job.id for job in batch])
+        for job in batch:
+            update_job(conn, job, status=RUNNING)
+            try:
+                run_step(job, step)
+            except Exception as e:
+                logger.exception(e)
+                attempts = job.attempts + 1
+                update_job(
+                    conn,
+                    job,
+                    status=FAILED if attempts >= MAX_ATTEMPTS else QUEUED,
+                    attempts=attempts,
+                    error=str(e),
+                )
+                logger.warning(
+                    "Job %s failed at step %s, attempt %s/%s",
+                    job.id,
+                    step,
+                    attempts,
+                    MAX_ATTEMPTS,
+                )
+                continue
+
+            next_index = steps.index(step) + 1
+            if next_index < len(steps):
+                update_job(
+                    conn,
+                    job,
+                    status=QUEUED,
+                    step=steps[next_index],
+                    attempts=0,
+                    error=None,
+                )
+            else:
+                update_job(conn, job, status=DONE, attempts=0, error=None)
+                logger.info("Job %s done: %s", job.id, job.working_dir)
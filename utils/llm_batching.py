@@ -0,0 +1,113 @@
+"""Pack the scenes (or dialog lines) of the LLM calls within the model's context.
+
+Tools asking for an answer per item (the voiceover lines of every scene, the
+storyboard prompts of every scene or dialog line) `pack` their items in as few
+calls as fit in the model's context window: the system prompt, the items and
+the answer expected for them. Short scripts take a single call, long ones are
+split before they overflow the context.
+
+The context sizes are per backend (and per model for OpenAI), overridable with
+`AICP_LLM_CONTEXT_{BACKEND}`. The tokens are counted with tiktoken if it is
+installed, or estimated from the length of the text.
+"""
+import os
+import functools
+from typing import Any, Callable
+
+import yaml
+
+from utils import llm_executor
+
+# backend -> tokens in the context window, overridable with
+# AICP_LLM_CONTEXT_{BACKEND}
+CONTEXT_TOKENS = {
+    "openai": 4096,
+    "revgpt": 8192,
+    # The n_ctx the llama models are loaded with (see llms.get_llm_instance)
+    "llama": 4096,
+    "fake": 4096,
+}
+# OpenAI model name prefix -> tokens, the longest matching prefix wins
+OPENAI_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+}
+# Share of the context kept free for the answer, besides the one expected
+# per item, as the counts are estimates
+HEADROOM = float(os.environ.get("AICP_LLM_CONTEXT_HEADROOM", "0.1"))
+# Conservative for the llama tokenizers, they split text more than OpenAI's
+CHARS_PER_TOKEN = 3
+
+
+def get_context_tokens(model: str) -> int:
+    """The size of the model's context window, in tokens."""
+    backend = llm_executor.get_backend(model)
+    env = os.environ.get(f"AICP_LLM_CONTEXT_{backend.upper()}")
+    if env:
+        return int(env)
+    if backend == "openai":
+        name = model.split("-", 1)[-1]
+        prefixes = [
+            prefix for prefix in OPENAI_CONTEXT_TOKENS if name.startswith(prefix)
+        ]
+        if prefixes:
+            return OPENAI_CONTEXT_TOKENS[max(prefixes, key=len)]
+    return CONTEXT_TOKENS.get(backend, min(CONTEXT_TOKENS.values()))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str) -> int:
+    """The tokens of the text, exact with tiktoken for the OpenAI models."""
+    encoding = _get_encoding()
+    if encoding is not None and llm_executor.get_backend(model) == "openai":
+        return len(encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def get_budget(model: str, template: str, params: dict) -> int:
+    """The tokens left for the items of a call and their answers.
+
+    The system prompt is the template filled with the params, counted as both
+    to not depend on the template's placeholders.
+    """
+    prompt_tokens = count_tokens(template, model) + sum(
+        count_tokens(str(value), model) for value in params.values()
+    )
+    context = get_context_tokens(model)
+    return context - prompt_tokens - int(HEADROOM * context)
+
+
+def pack(items: list, budget: int, cost: Callable[[Any], int]) -> list[list]:
+    """Split the items, in order, in as few batches as fit in the budget.
+
+    `cost` is the tokens of an item in the LLM input plus those of its answer.
+    An item over the budget on its own still gets a batch, it can't be split
+    any further here.
+    """
+    batches = []
+    batch, used = [], 0
+    for item in items:
+        item_cost = cost(item)
+        if batch and used + item_cost > budget:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(item)
+        used += item_cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def input_tokens(item: Any, model: str) -> int:
+    """The tokens of an item of a list in the LLM input, dumped as YAML."""
+    return count_tokens(yaml.dump([item]), model)
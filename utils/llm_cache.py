@@ -0,0 +1,71 @@
+"""Disk cache of the LLM responses, so reruns don't pay for the same prompts.
+
+A response is keyed on the model and its generation params, the rendered
+system prompt and the human input, and stored as a json file under
+`AICP_LLM_CACHE_DIR` (`.cache/llm` by default). Entries older than
+`AICP_LLM_CACHE_TTL_S` (a week by default, 0 keeps them forever) are ignored.
+Set `AICP_LLM_CACHE=0` to always ask the model, or `llm_cache: false` in a cast
+member's YAML to do so only for that cast member.
+
+A response is cached as soon as it is received, callers that find it invalid
+`evict` it so the next attempt asks the model again (see llms.run_with_retries).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+from utils import memo
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("AICP_LLM_CACHE", "1") == "1"
+CACHE_DIR = os.environ.get("AICP_LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+TTL_S = float(os.environ.get("AICP_LLM_CACHE_TTL_S", 7 * 24 * 3600))
+
+
+def key(model: str, system: str, human: str, params: dict) -> str:
+    """The cache key of a prompt, `params` are the model's generation params."""
+    return memo.digest(model, system, human, params)
+
+
+def _path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def get(key: str) -> Optional[str]:
+    """The cached response, None if there is none or it expired."""
+    try:
+        with open(_path(key), "r") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable LLM cache entry {key} ({e})")
+        evict(key)
+        return None
+    if TTL_S and time.time() - entry["created_at"] > TTL_S:
+        evict(key)
+        return None
+    return entry["response"]
+
+
+def put(key: str, response: str, **info):
+    """Cache a response, `info` (e.g. the model) is kept for inspection."""
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so concurrent readers never see a partial entry
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"created_at": time.time(), "response": response, **info}, f)
+    os.replace(temp_path, path)
+
+
+def evict(key: str):
+    """Forget a cached response, e.g. one that failed validation."""
+    try:
+        os.remove(_path(key))
+    except FileNotFoundError:
+        pass
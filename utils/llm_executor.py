@@ -0,0 +1,177 @@
+"""Concurrency and rate limits of the LLM calls, per backend.
+
+Every LLM request of `llms.get_llm`'s chains holds a `slot` of its backend
+(the model prefix: openai, revgpt, llama) while it runs. A backend allows
+`AICP_LLM_CONCURRENCY_{BACKEND}` requests at once and
+`AICP_LLM_RPM_{BACKEND}` requests per minute (a token bucket, 0 means
+unlimited), whichever tool they come from.
+
+Tools fan independent calls (e.g. a call per scene group) out with `fan_out` or
+`afan_out`, which return the results in the order of the items.
+"""
+import os
+import time
+import asyncio
+import weakref
+import logging
+import threading
+import contextlib
+import contextvars
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from utils import tracing, fake_backend
+
+logger = logging.getLogger(__name__)
+
+# backend -> (requests at once, requests per minute), overridable with
+# AICP_LLM_CONCURRENCY_{BACKEND} and AICP_LLM_RPM_{BACKEND}
+DEFAULT_LIMITS = {
+    "openai": (8, 500),
+    "revgpt": (1, 20),
+    # A local model answers one prompt at a time
+    "llama": (1, 0),
+    "fake": (8, 0),
+}
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, `capacity` at once."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returns the seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+@dataclass
+class Limits:
+    backend: str
+    concurrency: int
+    bucket: Optional[TokenBucket]
+    semaphore: threading.BoundedSemaphore = field(init=False)
+    # event loop -> semaphore of the async calls made in it
+    async_semaphores: weakref.WeakKeyDictionary = field(
+        init=False, default_factory=weakref.WeakKeyDictionary
+    )
+
+    def __post_init__(self):
+        self.semaphore = threading.BoundedSemaphore(self.concurrency)
+
+    def get_async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self.async_semaphores:
+            self.async_semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return self.async_semaphores[loop]
+
+
+_lock = threading.Lock()
+# backend -> limits
+_limits: dict[str, Limits] = {}
+
+
+def get_backend(model: str) -> str:
+    """The backend answering for the model, its prefix e.g. openai."""
+    if fake_backend.is_enabled():
+        return "fake"
+    return model.split("-")[0]
+
+
+def get_limits(model: str) -> Limits:
+    backend = get_backend(model)
+    with _lock:
+        if backend not in _limits:
+            concurrency, rpm = DEFAULT_LIMITS.get(backend, (1, 0))
+            env = backend.upper()
+            concurrency = int(
+                os.environ.get(f"AICP_LLM_CONCURRENCY_{env}", concurrency)
+            )
+            rpm = float(os.environ.get(f"AICP_LLM_RPM_{env}", rpm))
+            _limits[backend] = Limits(
+                backend=backend,
+                concurrency=concurrency,
+                bucket=TokenBucket(rpm / 60, concurrency) if rpm else None,
+            )
+        return _limits[backend]
+
+
+@contextlib.contextmanager
+def slot(model: str):
+    """Hold one of the backend's request slots, waiting for the rate limit."""
+    limits = get_limits(model)
+    with tracing.span("wait for llm", category="scheduler", backend=limits.backend):
+        limits.semaphore.acquire()
+        try:
+            if limits.bucket is not None:
+                time.sleep(limits.bucket.reserve())
+        except BaseException:
+            limits.semaphore.release()
+            raise
+    try:
+        yield
+    finally:
+        limits.semaphore.release()
+
+
+@contextlib.asynccontextmanager
+async def aslot(model: str):
+    """Async version of slot."""
+    limits = get_limits(model)
+    semaphore = limits.get_async_semaphore()
+    with tracing.span("wait for llm", category="scheduler", backend=limits.backend):
+        await semaphore.acquire()
+        try:
+            if limits.bucket is not None:
+                await asyncio.sleep(limits.bucket.reserve())
+        except BaseException:
+            semaphore.release()
+            raise
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def fan_out(fn: Callable[[Any], Any], items: Iterable, model: str) -> list:
+    """Call fn on every item concurrently, returns the results in order.
+
+    As many calls run at once as the model's backend allows, the first
+    failure is raised once the calls already started are done.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    workers = min(len(items), get_limits(model).concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Every call runs in a copy of the context, to keep the tracing parent
+        futures = [
+            executor.submit(contextvars.copy_context().run, fn, item) for item in items
+        ]
+        return [future.result() for future in futures]
+
+
+async def afan_out(
+    fn: Callable[[Any], Awaitable[Any]], items: Iterable, model: str
+) -> list:
+    """Async version of fan_out."""
+    semaphore = asyncio.Semaphore(get_limits(model).concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await fn(item)
+
+    return list(await asyncio.gather(*[run(item) for item in items]))
@@ -1,20 +1,63 @@
 import os
+import re
+import struct
+import copy
 import logging
+import weakref
+import functools
+import threading
+import contextlib
+import yaml
 from langchain import LLMChain
 from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.openai import acompletion_with_retry
 from langchain.prompts.chat import (
     ChatPromptTemplate,
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
 from langchain.llms import LlamaCpp
-from typing import Any, List, Mapping, Optional
-from langchain.callbacks.manager import CallbackManagerForLLMRun
+from typing import Any, Callable, Dict, List, Mapping, Optional
+from uuid import UUID
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForChainRun,
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForChainRun,
+    CallbackManagerForLLMRun,
+)
 from langchain.llms.base import LLM
+from langchain.schema import (
+    AIMessage,
+    BaseMessage,
+    ChatGeneration,
+    ChatResult,
+    LLMResult,
+)
+from pydantic import root_validator
 from revChatGPT.V1 import Chatbot
+from utils import (
+    tracing,
+    fake_backend,
+    scheduler,
+    llm_cache,
+    llm_executor,
+    llm_batching,
+)
+from utils.schemas import OutputSchema, StreamValidator
 
 logger = logging.getLogger(__name__)
 
+GB = 1024**3
+
+# Attempts at getting a valid answer out of an LLM
+RETRIES = 3
+# Stream the answers with a schema through a validator, to stop the invalid
+# ones early (see schemas.StreamValidator)
+STREAM = os.environ.get("AICP_LLM_STREAM", "1") == "1"
+# Memory for the evaluated prompts of every llama.cpp model, 0 disables it
+LLAMA_STATE_CACHE_GB = float(os.environ.get("AICP_LLAMA_STATE_CACHE_GB", "2"))
+
 
 class RevGPTLLM(LLM):
     model: str
@@ -34,9 +77,12 @@ class RevGPTLLM(LLM):
             )
         return self.chatbot
 
-    def _ask(self, prompt: str) -> str:
+    def _ask(self, prompt: str, validator: Optional[StreamValidator] = None) -> str:
         response = ""
+        # Every message has the whole answer so far, leaving the loop stops it
         for data in self._get_chatbot().ask(prompt, auto_continue=True):
+            if validator is not None:
+                validator.feed(data["message"][len(response) :])
             response = data["message"]
         return response
 
@@ -45,10 +91,23 @@ class RevGPTLLM(LLM):
         prompt: str,
         stop: Optional[List[str]] = None,
         run_manager: Optional[CallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
+    ) -> str:
+        if stop is not None:
+            raise NotImplementedError("Stop not implemented")
+        return self._ask(prompt, validator)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
     ) -> str:
         if stop is not None:
             raise NotImplementedError("Stop not implemented")
-        return self._ask(prompt)
+        # The chatbot only has a blocking client
+        return await scheduler.run_blocking(self._ask, prompt, validator)
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
@@ -58,15 +117,516 @@ class RevGPTLLM(LLM):
         }
 
 
+# The LlamaCpp fields llama.cpp loads the model with, the others are sampling
+# params passed on every call
+LLAMA_LOAD_ARGS = [
+    "lora_path",
+    "lora_base",
+    "n_ctx",
+    "n_parts",
+    "seed",
+    "f16_kv",
+    "logits_all",
+    "vocab_only",
+    "use_mlock",
+    "n_threads",
+    "n_batch",
+    "use_mmap",
+    "last_n_tokens_size",
+    "n_gpu_layers",
+]
+
+_llama_locks_lock = threading.Lock()
+# loaded llama.cpp model -> lock of its calls
+_llama_locks = weakref.WeakKeyDictionary()
+
+
+def _load_llama(model_path: str, load_args: dict):
+    """Load a llama.cpp model, keeping the state of the prompts it evaluates.
+
+    Before evaluating a prompt llama.cpp restores the cached state sharing the
+    longest prefix with it, so calls repeating a long system prompt (a call
+    per scene group, with only the input changing) only evaluate the input.
+    """
+    from llama_cpp import Llama, LlamaRAMCache
+
+    llama = Llama(model_path, **load_args)
+    if LLAMA_STATE_CACHE_GB > 0:
+        llama.set_cache(LlamaRAMCache(capacity_bytes=int(LLAMA_STATE_CACHE_GB * GB)))
+    return llama
+
+
+@functools.lru_cache(maxsize=None)
+def _llama_layers(model_path: str) -> Optional[int]:
+    """The number of layers of a GGML model, from its header, None if unknown."""
+    with open(model_path, "rb") as f:
+        header = f.read(28)
+    if len(header) < 28:
+        return None
+    magic, version, *hparams = struct.unpack("<7I", header)
+    # ggjt (GGML v1 to v3): magic, version, n_vocab, n_embd, n_mult, n_head, n_layer
+    if magic != 0x67676A74:
+        return None
+    return hparams[4] or None
+
+
+def _llama_registry_args(values: dict) -> dict:
+    """The model_registry key, loader, device and sizes of a LlamaCpp's model.
+
+    Only the layers offloaded to the GPU are charged to the VRAM budget, the
+    other layers and the state cache to the RAM one.
+    """
+    load_args = {name: values[name] for name in LLAMA_LOAD_ARGS}
+    # Like LlamaCpp, only passed to llama.cpp when set
+    if load_args["n_gpu_layers"] is None:
+        del load_args["n_gpu_layers"]
+    model_path = values["model_path"]
+    model_size = os.path.getsize(model_path)
+    state_cache_size = int(LLAMA_STATE_CACHE_GB * GB)
+    gpu_layers = load_args.get("n_gpu_layers") or 0
+    registry_args = {
+        "key": ("llama", os.path.abspath(model_path), *sorted(load_args.items())),
+        "loader": functools.partial(_load_llama, model_path, load_args),
+    }
+    if not gpu_layers:
+        return {
+            **registry_args,
+            "device": "cpu",
+            "size": model_size + state_cache_size,
+        }
+    n_layers = _llama_layers(model_path)
+    # The whole model when its layers are unknown
+    gpu_share = min(gpu_layers, n_layers) / n_layers if n_layers else 1
+    gpu_size = int(model_size * gpu_share)
+    return {
+        **registry_args,
+        "device": "cuda",
+        "size": gpu_size,
+        "host_size": model_size - gpu_size + state_cache_size,
+    }
+
+
+@functools.lru_cache(maxsize=32)
+def _llama_grammar(grammar: str):
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_string(grammar, verbose=False)
+
+
+def _llama_lock(client) -> threading.Lock:
+    with _llama_locks_lock:
+        if client not in _llama_locks:
+            _llama_locks[client] = threading.Lock()
+        return _llama_locks[client]
+
+
+class LlamaCppLLM(LlamaCpp):
+    """LlamaCpp sharing the loaded models, with an async path.
+
+    The instances loading the same model with the same load args (see
+    LLAMA_LOAD_ARGS) share it through the model_registry instead of loading
+    it again, each with its own sampling params, and take turns using it.
+    They don't hold the model, it is pinned in the registry during each call
+    and can be evicted between calls. The async generation runs in an
+    executor thread.
+    """
+
+    @root_validator()
+    def validate_environment(cls, values: Dict) -> Dict:
+        """Load the model in the model_registry, the calls get it from there."""
+        from utils import model_registry
+
+        try:
+            with model_registry.use(**_llama_registry_args(values)):
+                values["client"] = None
+        except ImportError:
+            raise ModuleNotFoundError(
+                "The llama models need llama-cpp-python: pip install llama-cpp-python"
+            )
+        except Exception as e:
+            raise ValueError(
+                f"Could not load Llama model from path: {values['model_path']}. "
+                f"Received error {e}"
+            )
+        return values
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        grammar: Optional[str] = None,
+        validator: Optional[StreamValidator] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Generate, only sampling the tokens allowed by `grammar` (GBNF) if given.
+
+        With a `validator` the tokens are streamed through it, the generation
+        stops as soon as it rejects the answer. Without `max_tokens` the answer
+        can take the rest of the context.
+        """
+        # A llama.cpp model only evaluates one prompt at a time
+        with self._use_client() as client, _llama_lock(client):
+            # LlamaCpp's streaming path doesn't pass extra params to the model
+            params = {**self._get_parameters(stop), **kwargs}
+            if params["max_tokens"] is None:
+                prompt_tokens = len(client.tokenize(prompt.encode("utf-8")))
+                params["max_tokens"] = max(1, self.n_ctx - prompt_tokens)
+            if grammar is not None:
+                params["grammar"] = _llama_grammar(grammar)
+            if not self.streaming and validator is None:
+                return client(prompt=prompt, **params)["choices"][0]["text"]
+            text = ""
+            for chunk in client(prompt=prompt, stream=True, **params):
+                token = chunk["choices"][0]["text"]
+                text += token
+                if run_manager:
+                    run_manager.on_llm_new_token(token, verbose=self.verbose)
+                if validator is not None:
+                    validator.feed(token)
+            return text
+
+    def _use_client(self):
+        """Keep the model loaded in the block, see model_registry.use."""
+        from utils import model_registry
+
+        return model_registry.use(**_llama_registry_args(vars(self)))
+
+    def get_num_tokens(self, text: str) -> int:
+        with self._use_client() as client:
+            return len(client.tokenize(text.encode("utf-8")))
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        # The sync run manager is only used to stream tokens, which the async
+        # one can't receive from another thread
+        return await scheduler.run_blocking(self._call, prompt, stop, **kwargs)
+
+
+@contextlib.contextmanager
+def keep_loaded(model: str, **kwargs):
+    """Keep a local model loaded in the block, e.g. for a batch of videos.
+
+    Does nothing for the remote models.
+    """
+    llm = get_llm_instance(model, **kwargs)
+    if not isinstance(llm, LlamaCppLLM):
+        yield
+        return
+
+    with llm._use_client():
+        yield
+
+
+class FakeLLM(LLM):
+    """An LLM answering with made up YAML in the shape its prompt asks for.
+
+    The shape comes from the example after the last `---` of the system
+    template, the number of items from the human input (the list of scenes,
+    lines or `number_of_expected_prompts`). Prompts without an example (e.g.
+    the script summary) get plain text.
+    """
+
+    model: str = "fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
+    ) -> str:
+        system, _, human = prompt.rpartition("\nHuman: ")
+        seed = fake_backend.seed_of(prompt)
+        example = self._get_example(system)
+        if example is None:
+            return fake_backend.made_up_sentences(seed, count=4)
+        answer = yaml.dump(
+            self._answer(example, self._parse_input(human), system, seed),
+            sort_keys=False,
+            allow_unicode=True,
+        )
+        if validator is not None:
+            # Streamed a line at a time
+            for line in answer.splitlines(keepends=True):
+                validator.feed(line)
+        return answer
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
+    ) -> str:
+        return self._call(prompt, stop, validator=validator)
+
+    @staticmethod
+    def _get_example(system: str):
+        """Parse the YAML example following the last `---` line of the template."""
+        lines = system.splitlines()
+        separators = [i for i, line in enumerate(lines) if line.strip() == "---"]
+        if not separators:
+            return None
+        example = lines[separators[-1] + 1 :]
+        # Drop trailing text until what is left parses
+        while example:
+            try:
+                parsed = yaml.safe_load("\n".join(example))
+                if isinstance(parsed, (list, dict)):
+                    return parsed
+            except yaml.YAMLError:
+                pass
+            example = example[:-1]
+        return None
+
+    @staticmethod
+    def _parse_input(human: str):
+        try:
+            parsed = yaml.safe_load(human)
+            # Some tools dump their input twice
+            if isinstance(parsed, str):
+                parsed = yaml.safe_load(parsed)
+            return parsed
+        except yaml.YAMLError:
+            return human
+
+    @staticmethod
+    def _get_actor(system: str) -> str:
+        """Pick the first actor of the cast mentioned in the prompt."""
+        from utils import catalog
+
+        actors = catalog.names("actors")
+        for actor in actors:
+            if re.search(rf"\b{actor}\b", system, re.IGNORECASE):
+                return actor
+        return actors[0]
+
+    def _answer(self, example, human_input, system: str, seed: int):
+        if isinstance(example, dict):
+            return self._fill(example, system, seed)
+
+        if (
+            isinstance(human_input, dict)
+            and "number_of_expected_prompts" in human_input
+        ):
+            count = human_input["number_of_expected_prompts"]
+        elif isinstance(human_input, list):
+            count = len(human_input)
+        else:
+            count = max(len(example), fake_backend.FAKE_LIST_LENGTH)
+
+        answer = []
+        for i in range(count):
+            item = example[min(i, len(example) - 1)]
+            if isinstance(item, list):
+                # A list of lines per scene, one per line of the input scene
+                scene = human_input[i] if isinstance(human_input, list) else {}
+                lines = scene.get("scene_lines") or [{}]
+                answer.append(
+                    [
+                        {
+                            **self._fill(item[0], system, seed + i * 100 + j),
+                            **({"actor": line["actor"]} if "actor" in line else {}),
+                        }
+                        for j, line in enumerate(lines)
+                    ]
+                )
+            else:
+                answer.append(self._fill(item, system, seed + i))
+        return answer
+
+    def _fill(self, value, system: str, seed: int, key: str = None):
+        """Replace the example values with made up ones of the same shape."""
+        if isinstance(value, dict):
+            return {
+                k: self._fill(v, system, seed + n, k)
+                for n, (k, v) in enumerate(value.items())
+            }
+        if isinstance(value, list):
+            return [self._fill(v, system, seed + n, key) for n, v in enumerate(value)]
+        if key == "actor":
+            return self._get_actor(system)
+        if key in ("name", "character") or not isinstance(value, str):
+            # Identifiers have to stay consistent across the answer
+            return value
+        if key in ("content", "line"):
+            return fake_backend.made_up_sentences(seed, count=3)
+        return fake_backend.made_up_sentences(seed, count=1)
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"model": self.model}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record a tracing span for every LLM call."""
+
+    def __init__(self, model: str):
+        self.model = model
+        # run id -> span
+        self.spans = {}
+        # The async callbacks run in executor threads, outside the context of
+        # the video's trace
+        self.trace = tracing.current_trace()
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs
+    ):
+        self.spans[run_id] = tracing.start_span(
+            "llm",
+            category="llm",
+            trace=self.trace,
+            model=self.model,
+            prompt_chars=sum(len(prompt) for prompt in prompts),
+        )
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[list],
+        *,
+        run_id: UUID,
+        **kwargs,
+    ):
+        self.spans[run_id] = tracing.start_span(
+            "llm",
+            category="llm",
+            trace=self.trace,
+            model=self.model,
+            prompt_chars=sum(
+                len(message.content) for batch in messages for message in batch
+            ),
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        span = self.spans.pop(run_id, None)
+        if span is None:
+            return
+        span.set(
+            response_chars=sum(
+                len(generation.text)
+                for generations in response.generations
+                for generation in generations
+            ),
+            **(response.llm_output or {}).get("token_usage", {}),
+        )
+        tracing.end_span(span)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        span = self.spans.pop(run_id, None)
+        if span is None:
+            return
+        span.set(error=repr(error))
+        tracing.end_span(span)
+
+
+class _StreamedMessage:
+    """The answer of a streamed OpenAI chat completion, put back together."""
+
+    def __init__(self):
+        self.role = "assistant"
+        self.content = ""
+        self.function_call = None
+
+    def add(self, delta: Mapping[str, Any]) -> str:
+        """Add a chunk of the answer, returns its new text."""
+        self.role = delta.get("role", self.role)
+        token = delta.get("content") or ""
+        self.content += token
+        function_call = delta.get("function_call")
+        if function_call:
+            if self.function_call is None:
+                self.function_call = {"name": "", "arguments": ""}
+            self.function_call["name"] += function_call.get("name") or ""
+            self.function_call["arguments"] += function_call.get("arguments") or ""
+            token += function_call.get("arguments") or ""
+        return token
+
+    def result(self) -> ChatResult:
+        additional_kwargs = {}
+        if self.function_call is not None:
+            additional_kwargs["function_call"] = self.function_call
+        message = AIMessage(content=self.content, additional_kwargs=additional_kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class ChatOpenAILLM(ChatOpenAI):
+    """ChatOpenAI streaming the answer through a validator when given one.
+
+    langchain only logs the errors of the token callbacks, so they can't stop
+    a generation, the answer is streamed here instead. The request is closed
+    as soon as the validator rejects the answer.
+    """
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if validator is None:
+            return super()._generate(messages, stop, run_manager, **kwargs)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs, "stream": True}
+        message = _StreamedMessage()
+        for stream_resp in self.completion_with_retry(messages=message_dicts, **params):
+            token = message.add(stream_resp["choices"][0]["delta"])
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            validator.feed(token)
+        return message.result()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        validator: Optional[StreamValidator] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if validator is None:
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs, "stream": True}
+        message = _StreamedMessage()
+        async for stream_resp in await acompletion_with_retry(
+            self, messages=message_dicts, **params
+        ):
+            token = message.add(stream_resp["choices"][0]["delta"])
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            validator.feed(token)
+        return message.result()
+
+
+# The LLMs taking a `validator` to stream their answer through
+STREAMING_LLMS = (ChatOpenAILLM, LlamaCppLLM, RevGPTLLM, FakeLLM)
+
+
 def get_llm_instance(model, **kwargs):
     """Return an LLM instance based on the model.
     The general pattern is {model-prefix}-{model}
     The prefix defines what sort of class to use, such as ChatOpenAI or RevGPTLLM etc..
     """
+    if fake_backend.is_enabled():
+        return FakeLLM(model=model, **kwargs)
+
     model_prefix_to_class = {
         "revgpt": RevGPTLLM,
-        "openai": ChatOpenAI,
-        "llama": LlamaCpp,
+        "openai": ChatOpenAILLM,
+        "llama": LlamaCppLLM,
     }
 
     model_prefix = model.split("-")[0]
@@ -82,16 +642,151 @@ def get_llm_instance(model, **kwargs):
         model_args["model"] = model_name
     elif model_prefix == "llama":
         model_args["model_path"] = os.path.join("models", f"{model_name}.bin")
-        model_args["n_ctx"] = 4096
+        model_args["n_ctx"] = llm_batching.get_context_tokens(model)
         model_args["n_gpu_layers"] = 20
         model_args["n_batch"] = 512
+        # The answer can take the rest of the context, the LLM calls pack as
+        # many items as fit in it (see llm_batching), LlamaCpp's default of
+        # 256 tokens would cut their answers short
+        model_args["max_tokens"] = None
 
     model_args.update(kwargs)
 
     return model_prefix_to_class[model_prefix](**model_args)
 
 
-def get_llm(model, template, **kwargs):
+def _response_text(response: LLMResult) -> str:
+    """The answer, or the arguments of the function the model called."""
+    generation = response.generations[0][0]
+    message = getattr(generation, "message", None)
+    if message is not None and "function_call" in message.additional_kwargs:
+        return message.additional_kwargs["function_call"]["arguments"]
+    return generation.text
+
+
+class CachedLLMChain(LLMChain):
+    """LLMChain answering from the llm_cache when it was asked the same before.
+
+    The requests to the model hold a slot of its backend, see llm_executor.
+    With an `output_schema` the model is made to answer in it where possible,
+    as a function call on OpenAI and with a grammar on llama.cpp, and the
+    answer is streamed through a validator stopping it once it can't be valid.
+    """
+
+    model: str
+    use_cache: bool = True
+    # An utils.schemas.OutputSchema
+    output_schema: Optional[Any] = None
+    # Whether an invalid item fails the whole answer, see StreamValidator
+    strict_output: bool = True
+
+    def cache_key(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """The llm_cache key of the chain's inputs, None if not cached."""
+        if not (self.use_cache and llm_cache.ENABLED):
+            return None
+        messages = self.prompt.format_prompt(**inputs).to_messages()
+        params = dict(self.llm._identifying_params)
+        if self.output_schema is not None:
+            params["output_schema"] = self.output_schema.json_schema()
+        return llm_cache.key(
+            self.model,
+            "\n".join(message.content for message in messages[:-1]),
+            messages[-1].content,
+            params,
+        )
+
+    def _get_cached(self, key: Optional[str]) -> Optional[str]:
+        response = llm_cache.get(key) if key else None
+        if response is not None:
+            logger.info(f"Using the cached response of {self.model}")
+            span = tracing.current_span()
+            if span is not None:
+                span.set(cached=True)
+        return response
+
+    def _constraints(self) -> Dict[str, Any]:
+        """The params making the model answer in the output schema."""
+        schema: OutputSchema = self.output_schema
+        if schema is None:
+            return {}
+        constraints = {}
+        if isinstance(self.llm, ChatOpenAI):
+            constraints = {
+                "functions": [schema.function()],
+                "function_call": {"name": schema.name},
+            }
+        elif isinstance(self.llm, LlamaCppLLM):
+            constraints = {"grammar": schema.grammar()}
+        # The other models only have the prompt to go by
+        if STREAM and isinstance(self.llm, STREAMING_LLMS):
+            constraints["validator"] = schema.validator(strict=self.strict_output)
+        return constraints
+
+    def _generate_text(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> str:
+        prompts, stop = self.prep_prompts([inputs], run_manager=run_manager)
+        response = self.llm.generate_prompt(
+            prompts,
+            stop,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **self._constraints(),
+        )
+        return _response_text(response)
+
+    async def _agenerate_text(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> str:
+        prompts, stop = await self.aprep_prompts([inputs], run_manager=run_manager)
+        response = await self.llm.agenerate_prompt(
+            prompts,
+            stop,
+            callbacks=run_manager.get_child() if run_manager else None,
+            **self._constraints(),
+        )
+        return _response_text(response)
+
+    def _call(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[CallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        key = self.cache_key(inputs)
+        response = self._get_cached(key)
+        if response is None:
+            with llm_executor.slot(self.model):
+                response = self._generate_text(inputs, run_manager)
+            if key:
+                llm_cache.put(key, response, model=self.model)
+        return {self.output_key: response}
+
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        key = self.cache_key(inputs)
+        response = self._get_cached(key)
+        if response is None:
+            async with llm_executor.aslot(self.model):
+                response = await self._agenerate_text(inputs, run_manager)
+            if key:
+                llm_cache.put(key, response, model=self.model)
+        return {self.output_key: response}
+
+
+def get_llm(
+    model, template, cache=True, schema: Optional[OutputSchema] = None, **kwargs
+):
+    """Return a chain asking the model, with the template as system prompt.
+
+    Its responses are cached unless `cache` is False (see utils.llm_cache), and
+    constrained to the `schema` if given (see utils.schemas).
+    """
     system_message_prompt = SystemMessagePromptTemplate.from_template(template)
     human_message_prompt = HumanMessagePromptTemplate.from_template("{input}")
 
@@ -99,5 +794,172 @@ def get_llm(model, template, **kwargs):
         [system_message_prompt, human_message_prompt]
     )
 
-    chain = LLMChain(llm=get_llm_instance(model, **kwargs), prompt=chat_prompt)
+    llm = get_llm_instance(model, callbacks=[TracingCallbackHandler(model)], **kwargs)
+    chain = CachedLLMChain(
+        llm=llm,
+        prompt=chat_prompt,
+        model=model,
+        output_schema=schema,
+        # The made up answers are faster than the cache
+        use_cache=cache and not fake_backend.is_enabled(),
+    )
     return chain
+
+
+def _evict(chain: LLMChain, params: dict):
+    key = chain.cache_key(params) if isinstance(chain, CachedLLMChain) else None
+    if key:
+        llm_cache.evict(key)
+
+
+def run_with_retries(
+    chain: LLMChain, params: dict, parse: Callable[[str], Any], name: str
+) -> Any:
+    """Run the chain until `parse` accepts its answer, returns the parsed answer.
+
+    `parse` raises on an invalid answer, the last error is raised once the
+    retries are exhausted.
+    """
+    for retry in range(RETRIES):
+        try:
+            with tracing.span(name, category="llm", retry=retry):
+                response = chain.run(**params)
+            logger.debug(response)
+            return parse(response)
+        except Exception as e:
+            # Don't get the same invalid answer out of the cache again
+            _evict(chain, params)
+            logger.warning(f"Failed to generate {name} ({e}), retrying")
+            if retry == RETRIES - 1:
+                logger.error(f"Failed to generate {name}, retries exhausted")
+                raise
+
+
+async def arun_with_retries(
+    chain: LLMChain, params: dict, parse: Callable[[str], Any], name: str
+) -> Any:
+    """Async version of run_with_retries."""
+    for retry in range(RETRIES):
+        try:
+            with tracing.span(name, category="llm", retry=retry):
+                response = await chain.arun(**params)
+            logger.debug(response)
+            return parse(response)
+        except Exception as e:
+            # Don't get the same invalid answer out of the cache again
+            _evict(chain, params)
+            logger.warning(f"Failed to generate {name} ({e}), retrying")
+            if retry == RETRIES - 1:
+                logger.error(f"Failed to generate {name}, retries exhausted")
+                raise
+
+
+class _Repair:
+    """The items of a run_with_repair, None until a valid one is answered."""
+
+    def __init__(self, chain, params, inputs, get_input, name):
+        self.chain = chain
+        self.params = params
+        self.inputs = inputs
+        self.get_input = get_input
+        self.name = name
+        self.items = [None] * len(inputs)
+
+    @property
+    def missing(self) -> list[int]:
+        return [i for i, item in enumerate(self.items) if item is None]
+
+    def next_call(self) -> tuple[LLMChain, dict]:
+        """The chain and params asking for the missing items only."""
+        missing = self.missing
+        schema = self.chain.output_schema.with_count(len(missing))
+        # pydantic's copy() would leave out the excluded fields, e.g. callbacks
+        chain = copy.copy(self.chain)
+        chain.output_schema = schema
+        # The valid items are kept, the invalid ones don't have to stop it
+        chain.strict_output = False
+        subset = [self.inputs[i] for i in missing]
+        return chain, {**self.params, "input": self.get_input(subset)}
+
+    def merge(self, response: str):
+        """Keep the valid items of the answer to the last call."""
+        missing = self.missing
+        items = self.chain.output_schema.parse_partial(response)
+        if len(items) != len(missing):
+            # No telling which of them answer which input, e.g. a dropped scene
+            # would shift all the following items
+            raise ValueError(f"Expected {len(missing)} {self.name}, got {len(items)}")
+        for index, item in zip(missing, items):
+            self.items[index] = item
+        if all(item is None for item in items):
+            raise ValueError(f"No valid {self.name} in the answer")
+        if self.missing:
+            logger.warning(
+                f"Repairing {len(self.missing)} of the {len(self.items)} {self.name}"
+            )
+
+
+def run_with_repair(
+    chain: LLMChain,
+    params: dict,
+    inputs: list,
+    get_input: Callable[[list], str],
+    name: str,
+) -> list:
+    """Ask for one item per input, then again for the missing or invalid ones.
+
+    The chain has an output schema, `get_input` renders the `input` param
+    asking for the items of some of the inputs. Returns the parsed items in the
+    order of the inputs, the valid items of an answer with the expected count
+    are kept and only the invalid ones are asked again.
+    """
+    repair = _Repair(chain, params, inputs, get_input, name)
+    for retry in range(RETRIES):
+        if not repair.missing:
+            break
+        call_chain, call_params = repair.next_call()
+        try:
+            with tracing.span(
+                name, category="llm", retry=retry, items=len(repair.missing)
+            ):
+                response = call_chain.run(**call_params)
+            logger.debug(response)
+            repair.merge(response)
+        except Exception as e:
+            # Don't get the same invalid answer out of the cache again
+            _evict(call_chain, call_params)
+            logger.warning(f"Failed to generate {name} ({e}), retrying")
+    if repair.missing:
+        logger.error(f"Failed to generate {name}, retries exhausted")
+        raise ValueError(f"Missing {len(repair.missing)} {name} after {RETRIES} tries")
+    return repair.items
+
+
+async def arun_with_repair(
+    chain: LLMChain,
+    params: dict,
+    inputs: list,
+    get_input: Callable[[list], str],
+    name: str,
+) -> list:
+    """Async version of run_with_repair."""
+    repair = _Repair(chain, params, inputs, get_input, name)
+    for retry in range(RETRIES):
+        if not repair.missing:
+            break
+        call_chain, call_params = repair.next_call()
+        try:
+            with tracing.span(
+                name, category="llm", retry=retry, items=len(repair.missing)
+            ):
+                response = await call_chain.arun(**call_params)
+            logger.debug(response)
+            repair.merge(response)
+        except Exception as e:
+            # Don't get the same invalid answer out of the cache again
+            _evict(call_chain, call_params)
+            logger.warning(f"Failed to generate {name} ({e}), retrying")
+    if repair.missing:
+        logger.error(f"Failed to generate {name}, retries exhausted")
+        raise ValueError(f"Missing {len(repair.missing)} {name} after {RETRIES} tries")
+    return repair.items
@@ -0,0 +1,113 @@
+"""Content addressed memoization of the expensive production units.
+
+Every unit of work (a generated prompt file, image, take, music chunk ...) is
+recorded in a manifest inside the output dir together with a digest of all its
+inputs (prompt, resolved cast member, upstream artifact digests, model id ...).
+A unit is only skipped on a rerun when its outputs exist and its inputs digest
+is unchanged, so editing the script redoes exactly the units affected by it.
+Every workspace (output dir) has its own manifest. The digests of a run with
+the fake backend differ from the real ones, so a real run redoes the units a
+fake run recorded.
+"""
+import os
+import json
+import hashlib
+import threading
+import dataclasses
+from typing import Optional
+
+from utils import fake_backend
+from utils.workspace import Workspace
+
+MANIFEST_FILE = "manifest.json"
+
+_lock = threading.RLock()
+# manifest path -> (mtime, entries)
+_manifests = {}
+# (path, mtime, size) -> digest, so unchanged files are only hashed once
+_file_digests = {}
+
+
+def _serialize(obj):
+    """Serialize the objects json doesn't know about."""
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    return str(obj)
+
+
+def digest(*parts) -> str:
+    """Return a stable digest of json serializable parts (and dataclasses)."""
+    if fake_backend.is_enabled():
+        # The real digests stay the same, only the fake outputs are told apart
+        parts = (fake_backend.BACKEND, *parts)
+    payload = json.dumps(parts, sort_keys=True, default=_serialize)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    """Return the digest of a file's contents, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    cache_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _file_digests:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        _file_digests[cache_key] = sha.hexdigest()
+    return _file_digests[cache_key]
+
+
+def _manifest_path(workspace: Workspace) -> str:
+    return workspace.path(MANIFEST_FILE)
+
+
+def _unit(workspace: Workspace, path: str) -> str:
+    """Units are named by their path relative to the output dir."""
+    return os.path.relpath(path, workspace.root or ".")
+
+
+def _read_manifest(workspace: Workspace) -> dict:
+    manifest_path = _manifest_path(workspace)
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    cached = _manifests.get(manifest_path)
+    if cached is None or cached[0] != mtime:
+        with open(manifest_path, "r") as f:
+            cached = (mtime, json.load(f))
+        _manifests[manifest_path] = cached
+    return cached[1]
+
+
+def is_fresh(
+    workspace: Workspace, path: str, key: str, outputs: Optional[list[str]] = None
+) -> bool:
+    """Whether the unit at `path` was produced from inputs with digest `key`.
+
+    `outputs` lists all the files produced by the unit when there are more than
+    one (defaults to `path`), they all have to exist for the unit to be fresh.
+    """
+    if not all(os.path.exists(output) for output in outputs or [path]):
+        return False
+    with _lock:
+        return _read_manifest(workspace).get(_unit(workspace, path)) == key
+
+
+def record(workspace: Workspace, path: str, key: str):
+    """Record that the unit at `path` was produced from inputs with digest `key`."""
+    with _lock:
+        manifest = dict(_read_manifest(workspace))
+        manifest[_unit(workspace, path)] = key
+        manifest_path = _manifest_path(workspace)
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+        # The next read doesn't have to load the manifest just written again
+        _manifests[manifest_path] = (os.stat(manifest_path).st_mtime_ns, manifest)
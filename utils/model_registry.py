@@ -0,0 +1,243 @@
+"""Keep the heavy models resident across tools and videos, within a memory budget.
+
+Tools ask the registry for a model by key with a loader, instead of loading it
+themselves, and get back a shared handle. Models stay loaded until the memory
+budget of their device is exceeded, then the least recently used ones that are
+not in use are evicted.
+
+Budgets are configured with `AICP_VRAM_BUDGET_GB` (defaults to 90% of the GPU
+memory) and `AICP_RAM_BUDGET_GB` (defaults to no limit).
+"""
+import os
+import gc
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional
+
+import torch
+
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+GB = 1024**3
+
+
+def _default_vram_budget() -> float:
+    if not torch.cuda.is_available():
+        return 0
+    return torch.cuda.get_device_properties(0).total_memory * 0.9 / GB
+
+
+BUDGETS_GB = {
+    "cuda": float(os.environ.get("AICP_VRAM_BUDGET_GB", _default_vram_budget())),
+    "cpu": float(os.environ.get("AICP_RAM_BUDGET_GB", 0)),
+}
+
+
+@dataclass
+class ResidentModel:
+    """A loaded model and its bookkeeping."""
+
+    key: Hashable
+    model: Any
+    device: str
+    size: int  # in bytes
+    unload: Optional[Callable[[Any], None]] = None
+    users: int = 0
+    # RAM used besides `size`, for the models split between the GPU and the CPU
+    host_size: int = 0
+
+    def charge(self, device: str) -> int:
+        """The bytes this model uses on the device."""
+        return (self.size if self.device == device else 0) + (
+            self.host_size if device == "cpu" else 0
+        )
+
+
+_lock = threading.RLock()
+# key -> ResidentModel, least recently used first
+_models: "OrderedDict[Hashable, ResidentModel]" = OrderedDict()
+# key -> lock, so a model is only loaded once when requested concurrently
+_load_locks = {}
+
+
+def _modules(obj, depth=2):
+    """Find the torch modules making up a model (pipelines, dicts of models...)."""
+    if isinstance(obj, torch.nn.Module):
+        return [obj]
+    if depth == 0:
+        return []
+    if isinstance(obj, dict):
+        values = obj.values()
+    elif hasattr(obj, "__dict__"):
+        values = vars(obj).values()
+    else:
+        return []
+    return [module for value in values for module in _modules(value, depth - 1)]
+
+
+def estimate_size(model) -> int:
+    """Estimate the memory used by a model's parameters and buffers, in bytes."""
+    size = 0
+    seen = set()
+    for module in _modules(model):
+        for tensor in [*module.parameters(), *module.buffers()]:
+            if id(tensor) in seen:
+                continue
+            seen.add(id(tensor))
+            size += tensor.numel() * tensor.element_size()
+    return size
+
+
+def _used(device: str) -> int:
+    return sum(entry.charge(device) for entry in _models.values())
+
+
+def _evict(entry: ResidentModel):
+    logger.info("Evicting model %s (%.2f GB)", entry.key, entry.size / GB)
+    with tracing.span("evict model", category="model", key=entry.key):
+        del _models[entry.key]
+        if entry.unload is not None:
+            entry.unload(entry.model)
+        entry.model = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+def _enforce_budget(device: str, keep: Hashable = None):
+    """Evict the least recently used idle models until the device fits its budget."""
+    budget = BUDGETS_GB.get(device, 0) * GB
+    if budget <= 0:
+        return
+    for entry in list(_models.values()):
+        if _used(device) <= budget:
+            return
+        if entry.charge(device) and entry.users == 0 and entry.key != keep:
+            _evict(entry)
+    if _used(device) > budget:
+        logger.warning(
+            "Models in use on %s need %.2f GB, over the %.2f GB budget",
+            device,
+            _used(device) / GB,
+            budget / GB,
+        )
+
+
+def _acquire(
+    key, loader, device, unload, pin: bool, size=None, host_size=0
+) -> ResidentModel:
+    """Return the resident entry for key, loading it if needed.
+
+    With `pin` the entry is marked as in use in the same critical section it
+    is found or added in, so it can't be evicted before the caller uses it.
+    """
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None:
+            _models.move_to_end(key)
+            entry.users += pin
+            return entry
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # Someone else may have loaded it while we were waiting
+        with _lock:
+            entry = _models.get(key)
+            if entry is not None:
+                _models.move_to_end(key)
+                entry.users += pin
+                return entry
+
+        logger.info("Loading model %s", key)
+        with tracing.span("load model", category="model", key=key, device=device):
+            try:
+                model = loader()
+            except torch.cuda.OutOfMemoryError:
+                # Make room by evicting everything idle on the device and try again
+                logger.warning("Out of memory loading %s, evicting idle models", key)
+                with _lock:
+                    for entry in list(_models.values()):
+                        if entry.device == device and entry.users == 0:
+                            _evict(entry)
+                model = loader()
+
+        entry = ResidentModel(
+            key=key,
+            model=model,
+            device=device,
+            size=estimate_size(model) if size is None else size,
+            unload=unload,
+            host_size=host_size,
+        )
+        logger.info("Loaded model %s (%.2f GB)", key, entry.size / GB)
+        with _lock:
+            entry.users += pin
+            _models[key] = entry
+            _enforce_budget(device, keep=key)
+            if host_size:
+                _enforce_budget("cpu", keep=key)
+        return entry
+
+
+def get(
+    key: Hashable,
+    loader: Callable[[], Any],
+    device: str = "cuda",
+    unload: Optional[Callable[[Any], None]] = None,
+    size: Optional[int] = None,
+    host_size: int = 0,
+):
+    """Return the shared model for `key`, loading it with `loader` if needed.
+
+    The model can be evicted as soon as other models are loaded, use `use` to
+    keep it resident while it is being used. `size` (in bytes) is for models
+    that are not made of torch modules, e.g. llama.cpp ones, and `host_size`
+    for the RAM they use besides it on another device.
+    """
+    return _acquire(
+        key, loader, device, unload, pin=False, size=size, host_size=host_size
+    ).model
+
+
+@contextlib.contextmanager
+def use(
+    key: Hashable,
+    loader: Callable[[], Any],
+    device: str = "cuda",
+    unload: Optional[Callable[[Any], None]] = None,
+    size: Optional[int] = None,
+    host_size: int = 0,
+):
+    """Like `get`, but the model can't be evicted until the block exits."""
+    entry = _acquire(
+        key, loader, device, unload, pin=True, size=size, host_size=host_size
+    )
+    try:
+        yield entry.model
+    finally:
+        with _lock:
+            entry.users -= 1
+            _enforce_budget(entry.device)
+            if entry.host_size:
+                _enforce_budget("cpu")
+
+
+def evict(key: Hashable):
+    """Unload a model if it is resident and not in use."""
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None and entry.users == 0:
+            _evict(entry)
+
+
+def clear():
+    """Unload all the models that are not in use."""
+    with _lock:
+        for entry in list(_models.values()):
+            if entry.users == 0:
+                _evict(entry)
@@ -1,6 +1,8 @@
 import os
 import json
 import re
+import functools
+import threading
 
 import contextlib
 import wave
@@ -8,65 +10,70 @@ import logging
 import yaml
 
 from models import Scene, SceneDialogue, Video, Actor, VOLine
-from utils import utils
+from utils import timeline
+from utils.timeline import Timeline
+from utils.workspace import Workspace
 
 logger = logging.getLogger(__name__)
 
+# The C version of the loader used so far, if libyaml is available
+ScriptLoader = getattr(yaml, "CLoader", yaml.Loader)
 
-def get_voiceover_duration():
+
+def get_voiceover_duration(workspace: Workspace):
     """Get the duration of the voiceover script."""
-    with contextlib.closing(wave.open(utils.VOICEOVER_WAV_FILE, "r")) as f:
+    with contextlib.closing(wave.open(workspace.voiceover_wav_file, "r")) as f:
         frames = f.getnframes()
         rate = f.getframerate()
         duration = frames / float(rate)
     return int(duration)
 
 
-def get_voiceover_lines():
-    """Get the successful takes of the recorded VO lines."""
+def _read_entries(workspace: Workspace) -> list[dict]:
+    """The successful takes of the recorded VO lines, as timeline entries."""
+    entries = timeline.read(workspace)
+    if entries is not None:
+        return entries
+    # Voiceovers recorded before the timeline index existed
+    return _scan_entries(workspace)
+
+
+def _scan_entries(workspace: Workspace) -> list[dict]:
+    """Read the VO lines from the json file of every sentence."""
     # List all the files in the voiceover directory
-    files = os.listdir(utils.VOICEOVER_PATH)
+    files = os.listdir(workspace.voiceover_path)
     # Filter only the files that end with .json and don't have the word "take" in them
     files = [
         file
         for file in files
         if file.endswith(".json") and "take" not in file  # Change to json later
     ]
-    vo_lines = []
+    entries = []
     # The file name is of the pattern `scene_{scene_index}_line_{line_index}_{sentence_index}.json`
     # Extract that info and read the file to get the duration and the text
-    # in order to create VOLine objects
     for file in files:
         scene_index, line_index, sentence_index = [
             int(i) for i in re.findall(r"\d+", file)
         ]
-        with open(os.path.join(utils.VOICEOVER_PATH, file), "r") as f:
+        with open(os.path.join(workspace.voiceover_path, file), "r") as f:
             text = f.read()
         vo_file_json = json.loads(text)
-        vo_lines.append(
-            VOLine(
-                actor=Actor.from_name(vo_file_json["actor"]),
-                line=vo_file_json["sentence"],
-                duration=vo_file_json["duration"],
-                scene_index=scene_index,
-                line_index=line_index,
-                sentence_index=sentence_index,
-            )
+        entries.append(
+            {
+                "scene_index": scene_index,
+                "line_index": line_index,
+                "sentence_index": sentence_index,
+                "actor": vo_file_json["actor"],
+                "sentence": vo_file_json["sentence"],
+                "duration": vo_file_json["duration"],
+            }
         )
     # Sort the lines by scene index, line index and sentence index
-    vo_lines.sort(key=lambda x: (x.scene_index, x.line_index, x.sentence_index))
-    return vo_lines
+    entries.sort(key=lambda e: (e["scene_index"], e["line_index"], e["sentence_index"]))
+    return entries
 
 
-def get_script():
-    """Retrieve the script from the script file."""
-    with open(utils.SCRIPT, "r") as file:
-        return yaml.load(file.read(), Loader=yaml.Loader)
-
-
-def get_scenes():
-    """Retrieve the scenes from the script file."""
-    script = get_script()
+def _read_scenes(script: list) -> list[Scene]:
     scenes = []
     for scene in script:
         characters_in_script = {}
@@ -92,24 +99,122 @@ def get_scenes():
                 ],
             )
         )
+    return scenes
+
+
+def _stat(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ProjectSnapshot:
+    """The script and the recorded voiceover lines of a workspace, parsed once.
+
+    Every part is parsed the first time it is asked for. The snapshot is
+    shared by the tools (see get_snapshot) until the script, the voiceover or
+    the voiceover directory changes on disk, or `invalidate` is called.
+    """
+
+    def __init__(self, workspace: Workspace, version: tuple):
+        self.workspace = workspace
+        self.version = version
+
+    @staticmethod
+    def get_version(workspace: Workspace) -> tuple:
+        """What the snapshot was read from, cheap to check on every access."""
+        return (
+            _stat(workspace.script),
+            _stat(workspace.voiceover_wav_file),
+            _stat(workspace.voiceover_path),
+            _stat(workspace.voiceover_timeline),
+        )
 
-    # Calculate duration of each scene
-    # If script file exists
-    if not os.path.exists(utils.VOICEOVER_WAV_FILE):
-        return scenes
+    @functools.cached_property
+    def script(self) -> list:
+        with open(self.workspace.script, "r") as file:
+            return yaml.load(file.read(), Loader=ScriptLoader)
+
+    @functools.cached_property
+    def timeline(self) -> Timeline:
+        return Timeline.from_entries(_read_entries(self.workspace))
 
-    vo_lines = get_voiceover_lines()
-    duration_so_far = 0
-    for i, scene in enumerate(scenes):
-        vo_lines_for_scene = [
-            vo_line for vo_line in vo_lines if vo_line.scene_index == i
+    @functools.cached_property
+    def voiceover_lines(self) -> list[VOLine]:
+        return [
+            VOLine(
+                actor=Actor.from_name(row.actor),
+                line=row.sentence,
+                duration=row.duration,
+                scene_index=row.scene_index,
+                line_index=row.line_index,
+                sentence_index=row.sentence_index,
+                start_time=row.start,
+            )
+            for row in self.timeline
         ]
-        scene_duration = sum([vo_line.duration for vo_line in vo_lines_for_scene])
-        scene.duration = scene_duration
-        scene.start_time = duration_so_far
-        duration_so_far += scene_duration
 
-    return scenes
+    @functools.cached_property
+    def voiceover_lines_by_scene(self) -> dict[int, list[VOLine]]:
+        by_scene = {}
+        for vo_line in self.voiceover_lines:
+            by_scene.setdefault(vo_line.scene_index, []).append(vo_line)
+        return by_scene
+
+    @functools.cached_property
+    def scenes(self) -> list[Scene]:
+        scenes = _read_scenes(self.script)
+
+        # Calculate duration of each scene
+        # If script file exists
+        if not os.path.exists(self.workspace.voiceover_wav_file):
+            return scenes
+
+        durations = self.timeline.scene_durations(len(scenes))
+        starts = self.timeline.scene_starts(len(scenes))
+        for scene, duration, start in zip(scenes, durations.tolist(), starts.tolist()):
+            scene.duration = duration
+            scene.start_time = start
+        return scenes
+
+
+_lock = threading.Lock()
+# workspace root -> snapshot
+_snapshots: dict[str, ProjectSnapshot] = {}
+
+
+def get_snapshot(workspace: Workspace) -> ProjectSnapshot:
+    """The current snapshot of the workspace, the objects in it are shared."""
+    version = ProjectSnapshot.get_version(workspace)
+    with _lock:
+        snapshot = _snapshots.get(workspace.root)
+        if snapshot is None or snapshot.version != version:
+            snapshot = ProjectSnapshot(workspace, version)
+            _snapshots[workspace.root] = snapshot
+        return snapshot
+
+
+def invalidate(workspace: Workspace):
+    """Parse the workspace again on the next access, call after writing to it."""
+    with _lock:
+        _snapshots.pop(workspace.root, None)
+
+
+def get_voiceover_lines(workspace: Workspace):
+    """Get the successful takes of the recorded VO lines."""
+    return get_snapshot(workspace).voiceover_lines
+
+
+def get_script(workspace: Workspace):
+    """Retrieve the script from the script file."""
+    return get_snapshot(workspace).script
+
+
+def get_scenes(workspace: Workspace):
+    """Retrieve the scenes from the script file."""
+    return get_snapshot(workspace).scenes
 
 
 def get_params_from_prompt(prompt: str) -> list[str]:
@@ -0,0 +1,168 @@
+"""Run the production tools as a dependency graph instead of a fixed sequence.
+
+Every tool declares the artifacts it needs (`inputs`) and the artifacts it
+produces (`outputs`), a tool is started as soon as everything it needs has been
+produced, so independent tools (e.g. the thumbnail artist and the voiceover
+artist) overlap instead of waiting on each other.
+
+`run_tools` runs every tool in its own thread, `arun_tools` runs them as tasks
+of the current event loop with the blocking parts (model inference, ffmpeg)
+offloaded to executor threads with `run_blocking`.
+"""
+import os
+import asyncio
+import functools
+import logging
+import threading
+import contextlib
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+# Number of tools allowed to run at the same time
+MAX_WORKERS = int(os.environ.get("AICP_MAX_WORKERS", "4"))
+# Number of tools allowed to hold the GPU at the same time
+GPU_SLOTS = int(os.environ.get("AICP_GPU_SLOTS", "1"))
+
+_gpu_semaphore = threading.BoundedSemaphore(GPU_SLOTS)
+
+
+@contextlib.contextmanager
+def gpu_slot():
+    """Hold a GPU slot while running model inference.
+
+    Tools mix LLM calls (network bound) with diffusion/TTS/music generation
+    (GPU bound), only the GPU bound parts are serialized so the LLM parts of
+    other tools can keep going in the meantime.
+    """
+    with tracing.span("wait for gpu", category="scheduler"):
+        _gpu_semaphore.acquire()
+    try:
+        yield
+    finally:
+        _gpu_semaphore.release()
+
+
+def run_tool(tool, query: str) -> str:
+    """Run a single tool in a tracing span, sampling its stack if profiling."""
+    with tracing.span(tool.name, category="tool"), tracing.profile(tool.name):
+        return tool.run(query)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call in the loop's executor, keeping the tracing context."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, fn, *args, **kwargs)
+    )
+
+
+async def arun_tool(tool, query: str) -> str:
+    """Async version of run_tool, the tool's stack is not sampled."""
+    with tracing.span(tool.name, category="tool"):
+        return await tool.arun(query)
+
+
+def get_dependencies(tools) -> dict[str, set[str]]:
+    """Map each tool name to the names of the tools it has to wait for.
+
+    Artifacts that are not produced by any of the given tools are assumed to
+    already exist on disk (e.g. when starting at a later step).
+    """
+    produced_by = {}
+    for tool in tools:
+        for artifact in tool.outputs:
+            produced_by[artifact] = tool.name
+
+    dependencies = {}
+    for tool in tools:
+        dependencies[tool.name] = {
+            produced_by[artifact]
+            for artifact in tool.get_inputs()
+            if artifact in produced_by and produced_by[artifact] != tool.name
+        }
+    return dependencies
+
+
+def run_tools(tools, query: str, max_workers: int = MAX_WORKERS) -> dict[str, str]:
+    """Run the tools concurrently, respecting their artifact dependencies.
+
+    Returns a dict of tool name to tool result, raises the first tool failure
+    once the tools that were already running are done.
+    """
+    dependencies = get_dependencies(tools)
+    tools_by_name = {tool.name: tool for tool in tools}
+    waiting = [tool.name for tool in tools]
+    running = {}
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            # Start every tool that has all of its inputs ready
+            for name in list(waiting):
+                if dependencies[name] <= results.keys():
+                    logger.info("Starting tool %s", name)
+                    waiting.remove(name)
+                    # Run in a copy of the context so the tool span is a child
+                    # of the current one
+                    context = contextvars.copy_context()
+                    future = executor.submit(
+                        context.run, run_tool, tools_by_name[name], query
+                    )
+                    running[future] = name
+
+            if not running:
+                raise ValueError(f"Unresolvable tool dependencies for {waiting}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    logger.error("Tool %s failed, not starting %s", name, waiting)
+                    waiting.clear()
+                    # Let the executor finish the tools that are still running
+                    raise future.exception()
+                logger.info("Finished tool %s", name)
+                results[name] = future.result()
+
+    return results
+
+
+async def arun_tools(tools, query: str) -> dict[str, str]:
+    """Async version of run_tools, every tool runs as a task of the current loop."""
+    dependencies = get_dependencies(tools)
+    tools_by_name = {tool.name: tool for tool in tools}
+    waiting = [tool.name for tool in tools]
+    running = {}
+    results = {}
+
+    while waiting or running:
+        for name in list(waiting):
+            if dependencies[name] <= results.keys():
+                logger.info("Starting tool %s", name)
+                waiting.remove(name)
+                # Tasks run in a copy of the current context, the tool span is
+                # a child of the current one
+                task = asyncio.create_task(arun_tool(tools_by_name[name], query))
+                running[task] = name
+
+        if not running:
+            raise ValueError(f"Unresolvable tool dependencies for {waiting}")
+
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            name = running.pop(task)
+            if task.exception() is not None:
+                logger.error("Tool %s failed, not starting %s", name, waiting)
+                waiting.clear()
+                # Let the tools that are still running finish
+                if running:
+                    await asyncio.wait(running)
+                raise task.exception()
+            logger.info("Finished tool %s", name)
+            results[name] = task.result()
+
+    return results
@@ -0,0 +1,396 @@
+"""The shape of the cast members' answers, to constrain and validate them.
+
+Each cast member answering with a list (the script writer's scenes, the
+storyboard, voiceover and music prompts) has an `OutputSchema`. `llms.get_llm`
+passes it to the model, as a function to call on OpenAI and as a GBNF grammar
+on llama.cpp, so the answer has the expected shape and number of items in the
+first place. `OutputSchema.parse` validates any answer (JSON or YAML, e.g. from
+the models that can't be constrained) into pydantic objects, and
+`OutputSchema.parse_partial` keeps the valid items of a malformed one so only
+the others are asked again (see llms.run_with_repair).
+
+The models stream their answer through an `OutputSchema.validator`, which
+checks every item as soon as it is complete and aborts the generation once the
+answer can't be valid anymore: not a list, broken YAML or JSON, too many items
+or (unless only the valid items are kept) an invalid item.
+"""
+import re
+import json
+import dataclasses
+from dataclasses import dataclass
+from typing import Any, List, Optional, Type
+
+import yaml
+from pydantic import BaseModel, parse_obj_as, root_validator
+
+# The C version of the loader, if libyaml is available
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class Character(BaseModel):
+    name: str
+    actor: str
+
+
+class Dialogue(BaseModel):
+    character: str
+    content: str
+
+
+class ScriptScene(BaseModel):
+    title: str
+    description: str
+    characters: List[Character]
+    dialogue: List[Dialogue]
+
+    @root_validator(skip_on_failure=True)
+    def check_characters(cls, values):
+        names = {character.name for character in values["characters"]}
+        for dialogue in values["dialogue"]:
+            if dialogue.character not in names:
+                raise ValueError(f"Unknown character {dialogue.character}")
+        return values
+
+
+class Prompt(BaseModel):
+    prompt: str
+
+
+class VoiceoverLine(BaseModel):
+    line: str
+    actor: str
+
+
+# Matches the strings of JSON, with escapes
+STRING_RULE = (
+    r'"\"" ( [^"\\] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] '
+    r'[0-9a-fA-F] [0-9a-fA-F]) )* "\""'
+)
+PRIMITIVE_RULES = {
+    "string": STRING_RULE,
+    "integer": r'"-"? [0-9]+',
+    "number": r'"-"? [0-9]+ ("." [0-9]+)? ([eE] [-+]? [0-9]+)?',
+    "boolean": r'"true" | "false"',
+}
+
+
+def _inline(schema: Any, definitions: dict) -> Any:
+    """Replace the $refs of a pydantic schema with their definition."""
+    if isinstance(schema, list):
+        return [_inline(item, definitions) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    if "$ref" in schema:
+        return _inline(definitions[schema["$ref"].split("/")[-1]], definitions)
+    return {
+        key: _inline(value, definitions)
+        for key, value in schema.items()
+        if key != "definitions"
+    }
+
+
+class _Grammar:
+    """Converts a JSON schema to GBNF rules, see llama.cpp's grammars/README."""
+
+    def __init__(self):
+        self.rules = {"ws": r"[ \t\n]*"}
+
+    def add(self, schema: dict, name: str) -> str:
+        """Add the rules matching the schema, returns the name of its rule."""
+        name = re.sub(r"[^a-zA-Z0-9-]+", "-", name).strip("-").lower()
+        kind = schema.get("type")
+        if kind in PRIMITIVE_RULES:
+            self.rules[kind] = PRIMITIVE_RULES[kind]
+            return kind
+        if kind == "object":
+            members = [
+                f'{json.dumps(json.dumps(key))} ws ":" ws '
+                f"{self.add(value, f'{name}-{key}')} ws"
+                for key, value in schema["properties"].items()
+            ]
+            self.rules[name] = '"{" ws ' + ' "," ws '.join(members) + ' "}"'
+            return name
+        if kind == "array":
+            item = f"{self.add(schema['items'], f'{name}-item')} ws"
+            min_items = schema.get("minItems", 0)
+            max_items = schema.get("maxItems")
+            if max_items == 0:
+                self.rules[name] = '"[" ws "]"'
+                return name
+            # The first item(s), then the optional ones
+            items = ' "," ws '.join([item] * max(min_items, 1))
+            if max_items is None:
+                items += f' ("," ws {item})*'
+            else:
+                items += f' ("," ws {item})?' * (max_items - max(min_items, 1))
+            if min_items == 0:
+                items = f"({items})?"
+            self.rules[name] = f'"[" ws {items} "]"'
+            return name
+        raise ValueError(f"Unsupported schema type {kind} for {name}")
+
+    def __str__(self):
+        return "\n".join(f"{name} ::= {body}" for name, body in self.rules.items())
+
+
+@dataclass(frozen=True)
+class OutputSchema:
+    """An answer made of a list of `item`, `count` of them if given.
+
+    With `nested` the answer is a list of lists of items (e.g. the lines of
+    every scene), `count` is then the number of lists.
+    """
+
+    name: str
+    item: Type[BaseModel]
+    count: Optional[int] = None
+    nested: bool = False
+
+    def with_count(self, count: int) -> "OutputSchema":
+        return dataclasses.replace(self, count=count)
+
+    def json_schema(self) -> dict:
+        """The JSON schema of the answer."""
+        item_schema = self.item.schema()
+        item_schema = _inline(item_schema, item_schema.get("definitions", {}))
+        if self.nested:
+            item_schema = {"type": "array", "items": item_schema, "minItems": 1}
+        schema = {"type": "array", "items": item_schema, "minItems": 1}
+        if self.count is not None:
+            schema["minItems"] = schema["maxItems"] = self.count
+        return schema
+
+    def function(self) -> dict:
+        """An OpenAI function taking the answer as its `items` argument."""
+        return {
+            "name": self.name,
+            "description": f"Answer with the {self.name}",
+            "parameters": {
+                "type": "object",
+                "properties": {"items": self.json_schema()},
+                "required": ["items"],
+            },
+        }
+
+    def grammar(self) -> str:
+        """A GBNF grammar of the answer as JSON, for llama.cpp."""
+        grammar = _Grammar()
+        grammar.rules["root"] = grammar.add(self.json_schema(), self.name) + " ws"
+        return str(grammar)
+
+    def _load(self, response: str) -> list:
+        """The list in the answer, before validating its items."""
+        try:
+            parsed = yaml.load(response, Loader=Loader)
+        except yaml.YAMLError as e:
+            raise ValueError(f"The {self.name} are not valid YAML or JSON: {e}")
+        # The arguments of a function call
+        if isinstance(parsed, dict) and "items" in parsed:
+            parsed = parsed["items"]
+        if not isinstance(parsed, list):
+            raise ValueError(f"Expected a list of {self.name}, got {type(parsed)}")
+        return parsed
+
+    def parse(self, response: str) -> list:
+        """Validate an answer, returns the list (of lists) of items.
+
+        Raises a ValueError (or pydantic's ValidationError, a subclass of it)
+        if the answer doesn't have the expected shape or number of items.
+        """
+        parsed = self._load(response)
+        if self.count is not None and len(parsed) != self.count:
+            raise ValueError(f"Expected {self.count} {self.name}, got {len(parsed)}")
+        if self.nested:
+            return parse_obj_as(List[List[self.item]], parsed)
+        return parse_obj_as(List[self.item], parsed)
+
+    def parse_item(self, value: Any) -> Any:
+        """Validate an item of the answer (a list of them if nested)."""
+        if not self.nested:
+            return parse_obj_as(self.item, value)
+        if not value:
+            raise ValueError(f"No {self.name} in the list")
+        return parse_obj_as(List[self.item], value)
+
+    def parse_partial(self, response: str) -> list:
+        """Validate the items of an answer one by one, None for the invalid ones.
+
+        The answer may have any number of items, only a ValueError if it isn't
+        a list at all.
+        """
+        items = []
+        for value in self._load(response):
+            try:
+                items.append(self.parse_item(value))
+            except ValueError:
+                items.append(None)
+        return items
+
+    def validator(self, strict: bool = True) -> "StreamValidator":
+        """A validator of the answer as it streams, see StreamValidator."""
+        return StreamValidator(self, strict)
+
+    @staticmethod
+    def to_data(items: list) -> list:
+        """The parsed items as plain lists and dicts, e.g. to dump as YAML."""
+        return [
+            OutputSchema.to_data(item) if isinstance(item, list) else item.dict()
+            for item in items
+        ]
+
+
+class StreamValidator:
+    """Checks an answer as it is generated, `feed` it the new text.
+
+    `feed` raises a ValueError as soon as the answer can't be valid anymore,
+    for the model to stop generating it. The items are checked as they are
+    complete, the end of the answer is left to `OutputSchema.parse`. With
+    `strict` False the invalid items are let through, as the valid ones are
+    kept anyway (see OutputSchema.parse_partial).
+    """
+
+    def __init__(self, schema: OutputSchema, strict: bool = True):
+        self.schema = schema
+        self.strict = strict
+        self.text = ""
+        # json or yaml, once the start of the answer tells
+        self.format = None
+        self.items = 0
+        # Position of the next character (or line, in YAML) to read
+        self.position = 0
+        # The JSON brackets open while reading, and the state of the list's items
+        self.brackets = []
+        self.list_depth = None
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.closed = False
+        # The indentation of the YAML list's items
+        self.indent = None
+
+    def feed(self, text: str):
+        self.text += text
+        if self.format is None:
+            self._detect_format()
+        if self.format == "json":
+            self._read_json()
+        elif self.format == "yaml":
+            self._read_yaml()
+
+    def _abort(self, reason: str):
+        raise ValueError(
+            f"Aborted the {self.schema.name} after {len(self.text)} characters: "
+            f"{reason}"
+        )
+
+    def _detect_format(self):
+        start = self.text.lstrip()
+        if not start:
+            return
+        if start[0] == "[":
+            self.format, self.list_depth = "json", 1
+        elif start[0] == "{":
+            # The arguments of a function call, {"items": [...]}
+            self.format, self.list_depth = "json", 2
+        elif start[0] == "-":
+            self.format = "yaml"
+        else:
+            # A list under an `items` key, or anything but a list
+            line, newline, _ = start.partition("\n")
+            if re.fullmatch(r"items:[ \t]*", line) and newline:
+                self.format = "yaml"
+            elif re.match(r"items:[ \t]*\[", line):
+                self.format, self.list_depth = "json", 1
+            elif not "items:".startswith(line) and not re.fullmatch(
+                r"items:[ \t]*", line
+            ):
+                self._abort(f"expected a list, got {line[:40]!r}")
+
+    def _check_item(self, value: Any):
+        self.items += 1
+        count = self.schema.count
+        if count is not None and self.items > count:
+            self._abort(f"more than the {count} expected")
+        if self.strict:
+            try:
+                self.schema.parse_item(value)
+            except ValueError as e:
+                self._abort(f"invalid item {self.items} ({e})")
+
+    def _load(self, text: str) -> Any:
+        try:
+            return yaml.load(text, Loader=Loader)
+        except yaml.YAMLError as e:
+            self._abort(f"not valid YAML or JSON ({e})")
+
+    def _end_json_item(self, end: int):
+        item = self.text[self.item_start : end]
+        if item.strip():
+            self._check_item(self._load(item))
+        self.item_start = end + 1
+
+    def _read_json(self):
+        for i in range(self.position, len(self.text)):
+            char = self.text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif self.closed and not self.brackets and not char.isspace():
+                self._abort("text after the list")
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.brackets.append(char)
+                at_list = len(self.brackets) == self.list_depth
+                if at_list and char == "[" and not self.closed:
+                    self.item_start = i + 1
+            elif char in "]}":
+                if not self.brackets or "[{"["]}".index(char)] != self.brackets[-1]:
+                    self._abort("unbalanced brackets")
+                if (
+                    len(self.brackets) == self.list_depth
+                    and self.item_start is not None
+                ):
+                    self._end_json_item(i)
+                    self.item_start = None
+                    self.closed = True
+                self.brackets.pop()
+            elif char == "," and len(self.brackets) == self.list_depth:
+                if self.item_start is not None:
+                    self._end_json_item(i)
+        self.position = len(self.text)
+
+    def _read_yaml(self):
+        end = self.text.rfind("\n") + 1
+        for line in self.text[self.position : end].splitlines(keepends=True):
+            start = self.position
+            self.position += len(line)
+            content = line.lstrip(" ")
+            if not content.strip() or content.startswith("#"):
+                continue
+            indent = len(line) - len(content)
+            if self.indent is None:
+                if content.startswith("-"):
+                    self.indent = indent
+                continue
+            if indent > self.indent:
+                continue
+            if indent < self.indent or not content.startswith("-"):
+                self._abort("text after the list")
+            # A new item, the one before it is complete
+            parsed = self._load(self.text[:start])
+            if isinstance(parsed, dict):
+                parsed = parsed.get("items")
+            if not isinstance(parsed, list) or not parsed:
+                self._abort(f"expected a list of {self.schema.name}")
+            self._check_item(parsed[-1])
+
+
+SCRIPT = OutputSchema("script_scenes", ScriptScene)
+STORYBOARD_PROMPTS = OutputSchema("storyboard_prompts", Prompt)
+MUSIC_PROMPTS = OutputSchema("music_prompts", Prompt)
+VOICEOVER_LINES = OutputSchema("voiceover_lines", VoiceoverLine, nested=True)
@@ -0,0 +1,248 @@
+"""Append-only index of the recorded voiceover sentences.
+
+The voiceover artist appends an entry (ids, actor, text, duration, start
+offset in the voiceover, take metrics and wav) for every sentence it accepts,
+and a removal for every sentence dropped from the script. Reading the
+voiceover lines is then one read of `voiceover/timeline.jsonl` instead of a
+listing of the voiceover dir and a json file per sentence. The last entry of a
+sentence wins.
+
+`Timeline` holds the entries as columns for the timing queries of the tools
+(scene durations and starts, image durations, what plays at a given time).
+"""
+import json
+import threading
+from typing import Optional
+
+import numpy as np
+
+from utils.workspace import Workspace
+
+_lock = threading.Lock()
+
+
+def sentence_id(scene_index: int, line_index: int, sentence_index: int) -> str:
+    """The name of a sentence's files, e.g. scene_00_line_01_02."""
+    return f"scene_{scene_index:02}_line_{line_index:02}_{sentence_index:02}"
+
+
+def _append(workspace: Workspace, entry: dict):
+    with _lock:
+        with open(workspace.voiceover_timeline, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def append(
+    workspace: Workspace,
+    scene_index: int,
+    line_index: int,
+    sentence_index: int,
+    actor: str,
+    sentence: str,
+    duration: float,
+    start: float,
+    wav: str,
+    **metrics,
+):
+    """Record an accepted sentence, returns its entry.
+
+    `wav` is relative to the workspace.
+    """
+    entry = {
+        "id": sentence_id(scene_index, line_index, sentence_index),
+        "scene_index": scene_index,
+        "line_index": line_index,
+        "sentence_index": sentence_index,
+        "actor": actor,
+        "sentence": sentence,
+        "duration": duration,
+        "start": start,
+        "wav": wav,
+        "metrics": metrics,
+    }
+    _append(workspace, entry)
+    return entry
+
+
+def remove(workspace: Workspace, id: str):
+    """Record that a sentence is no longer part of the voiceover."""
+    _append(workspace, {"id": id, "removed": True})
+
+
+def read(workspace: Workspace) -> Optional[list[dict]]:
+    """The current entries in voiceover order, None if there is no index yet."""
+    entries = {}
+    try:
+        with open(workspace.voiceover_timeline, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("removed"):
+                    entries.pop(entry["id"], None)
+                else:
+                    entries[entry["id"]] = entry
+    except FileNotFoundError:
+        return None
+    return sort_entries(entries.values())
+
+
+def entry_ids(entry: dict) -> tuple[int, int, int]:
+    """The scene, line and sentence index of an entry."""
+    return entry["scene_index"], entry["line_index"], entry["sentence_index"]
+
+
+def sort_entries(entries) -> list[dict]:
+    """The entries in voiceover order."""
+    return sorted(entries, key=entry_ids)
+
+
+# One row per sentence, in voiceover order
+COLUMNS = np.dtype(
+    [
+        ("scene_index", np.int32),
+        ("line_index", np.int32),
+        ("sentence_index", np.int32),
+        ("duration", np.float64),
+        ("start", np.float64),
+    ]
+)
+
+
+class TimelineRow:
+    """A view of one sentence of a Timeline, without copying it out."""
+
+    __slots__ = ("timeline", "index")
+
+    def __init__(self, timeline: "Timeline", index: int):
+        self.timeline = timeline
+        self.index = index
+
+    @property
+    def id(self) -> str:
+        return sentence_id(self.scene_index, self.line_index, self.sentence_index)
+
+    @property
+    def scene_index(self) -> int:
+        return int(self.timeline.rows["scene_index"][self.index])
+
+    @property
+    def line_index(self) -> int:
+        return int(self.timeline.rows["line_index"][self.index])
+
+    @property
+    def sentence_index(self) -> int:
+        return int(self.timeline.rows["sentence_index"][self.index])
+
+    @property
+    def duration(self) -> float:
+        return float(self.timeline.rows["duration"][self.index])
+
+    @property
+    def start(self) -> float:
+        return float(self.timeline.rows["start"][self.index])
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+    @property
+    def actor(self) -> str:
+        return self.timeline.actors[self.index]
+
+    @property
+    def sentence(self) -> str:
+        return self.timeline.sentences[self.index]
+
+    def __repr__(self):
+        return f"TimelineRow({self.id}, start={self.start:.3f}, duration={self.duration:.3f})"
+
+
+class Timeline:
+    """The sentences of the voiceover as columns, for timing queries.
+
+    The ids and times are a NumPy structured array (see COLUMNS) and the
+    actors and text are plain lists, row i of each is the i-th sentence of the
+    voiceover. The start of every sentence is the sum of the durations before
+    it, computed once, so the scene durations, scene starts and the sentence
+    playing at a given time are array operations instead of loops over VOLines.
+    """
+
+    def __init__(self, rows: np.ndarray, actors: list[str], sentences: list[str]):
+        self.rows = rows
+        self.actors = actors
+        self.sentences = sentences
+        durations = rows["duration"]
+        if len(rows):
+            rows["start"][0] = 0
+            np.cumsum(durations[:-1], out=rows["start"][1:])
+
+    @classmethod
+    def from_entries(cls, entries: list[dict]) -> "Timeline":
+        """A timeline of entries as returned by `read`, in voiceover order."""
+        rows = np.empty(len(entries), dtype=COLUMNS)
+        for name in ("scene_index", "line_index", "sentence_index", "duration"):
+            rows[name] = [entry[name] for entry in entries]
+        return cls(
+            rows,
+            [entry["actor"] for entry in entries],
+            [entry["sentence"] for entry in entries],
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> TimelineRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"Timeline index {index} out of range")
+        return TimelineRow(self, index)
+
+    def __iter__(self):
+        return (TimelineRow(self, i) for i in range(len(self)))
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.rows["duration"]
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.rows["start"]
+
+    @property
+    def duration(self) -> float:
+        """The length of the whole voiceover."""
+        return float(self.durations.sum())
+
+    def scene_durations(self, num_scenes: Optional[int] = None) -> np.ndarray:
+        """The voiceover duration of every scene, 0 for scenes without lines."""
+        return np.bincount(
+            self.rows["scene_index"],
+            weights=self.durations,
+            minlength=num_scenes or 0,
+        )[:num_scenes].astype(np.float64, copy=False)
+
+    def scene_starts(self, num_scenes: Optional[int] = None) -> np.ndarray:
+        """When every scene starts in the voiceover."""
+        durations = self.scene_durations(num_scenes)
+        starts = np.zeros_like(durations)
+        np.cumsum(durations[:-1], out=starts[1:])
+        return starts
+
+    def scene_rows(self, scene_index: int) -> range:
+        """The rows of the scene's sentences."""
+        scenes = self.rows["scene_index"]
+        return range(
+            int(np.searchsorted(scenes, scene_index, side="left")),
+            int(np.searchsorted(scenes, scene_index, side="right")),
+        )
+
+    def find(self, times) -> np.ndarray:
+        """The row of the sentence playing at each time, -1 past either end."""
+        times = np.asarray(times, dtype=np.float64)
+        if not len(self):
+            return np.full(times.shape, -1)
+        rows = np.searchsorted(self.starts, times, side="right") - 1
+        ends = self.starts[rows.clip(0)] + self.durations[rows.clip(0)]
+        return np.where((rows >= 0) & (times < ends), rows, -1)
@@ -0,0 +1,279 @@
+"""Timing spans for the production, exported as a Chrome trace.
+
+Wrap any unit of work in `with tracing.span("name", scene=1, take=2):`, spans
+opened inside it (in the same thread, or in tools started by the scheduler)
+become its children. make_video collects the spans of a video in its own
+`Trace` (see `trace`), so the videos made at once in a process don't mix
+their spans. At the end of make_video the spans are written to the output dir
+as `trace.json` (open it in chrome://tracing or ui.perfetto.dev) and
+`trace_summary.txt`, a table of the total time spent per span name.
+
+Set `AICP_PROFILE=1` to also sample the stack of every step's thread, the
+samples are written as `profile-{step}.txt` in the collapsed stack format used
+by flamegraph.pl and speedscope.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = "trace.json"
+SUMMARY_FILE = "trace_summary.txt"
+PROFILE = os.environ.get("AICP_PROFILE", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.environ.get("AICP_PROFILE_INTERVAL_MS", "10"))
+
+
+@dataclass
+class Span:
+    """A timed unit of work."""
+
+    name: str
+    category: str
+    start: float
+    thread_id: int
+    thread_name: str
+    parent: Optional["Span"] = None
+    end: Optional[float] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def set(self, **attributes):
+        """Add attributes to the span, e.g. results only known at the end."""
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """The spans and profiles collected for a video."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+        # step name -> Counter of collapsed stacks
+        self.profiles: dict[str, Counter] = {}
+
+    def add_span(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def add_profile(self, name: str, stacks: Counter):
+        with self.lock:
+            self.profiles.setdefault(name, Counter()).update(stacks)
+
+    def get_spans(self) -> list[Span]:
+        with self.lock:
+            return list(self.spans)
+
+    def get_profiles(self) -> dict[str, Counter]:
+        with self.lock:
+            return {name: Counter(stacks) for name, stacks in self.profiles.items()}
+
+    def write(self, output_dir: str):
+        """Write the trace, its summary and the profiles to the output dir."""
+        spans = self.get_spans()
+        with open(os.path.join(output_dir, TRACE_FILE), "w") as f:
+            json.dump(to_chrome_trace(spans), f)
+        summary = summarize(spans)
+        with open(os.path.join(output_dir, SUMMARY_FILE), "w") as f:
+            f.write(summary)
+        logger.info("Trace summary:\n%s", summary)
+
+        for name, stacks in self.get_profiles().items():
+            with open(os.path.join(output_dir, f"profile-{name}.txt"), "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+
+# Collects the spans opened outside of any `trace` block
+_default_trace = Trace()
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+@contextlib.contextmanager
+def trace():
+    """Collect the spans and profiles opened in the block in a new Trace."""
+    new_trace = Trace()
+    token = _current_trace.set(new_trace)
+    # The spans of the trace don't have a parent in another one
+    span_token = _current_span.set(None)
+    try:
+        yield new_trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+
+
+def current_trace() -> Trace:
+    """The trace collecting the spans opened here."""
+    return _current_trace.get() or _default_trace
+
+
+def get_spans() -> list[Span]:
+    """The spans collected by the current trace."""
+    return current_trace().get_spans()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(
+    name: str, category: str = "", trace: Optional[Trace] = None, **attributes
+) -> Span:
+    """Open a span as a child of the current one, prefer `span` when possible.
+
+    The span goes to the current trace, or `trace` for spans opened where the
+    context isn't the caller's (e.g. callbacks run in another thread).
+    """
+    thread = threading.current_thread()
+    new_span = Span(
+        name=name,
+        category=category,
+        start=time.perf_counter(),
+        thread_id=thread.ident,
+        thread_name=thread.name,
+        parent=_current_span.get(),
+        attributes=attributes,
+    )
+    (trace or current_trace()).add_span(new_span)
+    return new_span
+
+
+def end_span(span: Span):
+    span.end = time.perf_counter()
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "", **attributes):
+    """Time the block, spans opened inside it are its children."""
+    new_span = start_span(name, category, **attributes)
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.set(error=repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(new_span)
+
+
+class _Sampler(threading.Thread):
+    """Sample the stack of a thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name=f"sampler-{thread_id}", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+@contextlib.contextmanager
+def profile(name: str):
+    """Sample the calling thread's stack while in the block if AICP_PROFILE=1."""
+    if not PROFILE:
+        yield
+        return
+
+    profile_trace = current_trace()
+    sampler = _Sampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stopped.set()
+        sampler.join()
+        profile_trace.add_profile(name, sampler.stacks)
+
+
+def to_chrome_trace(spans: list[Span]) -> dict:
+    """Convert spans to Chrome trace events, with timestamps in microseconds."""
+    if not spans:
+        return {"traceEvents": []}
+    origin = min(s.start for s in spans)
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for s in spans:
+        threads[s.thread_id] = s.thread_name
+        events.append(
+            {
+                "name": s.name,
+                "cat": s.category,
+                "ph": "X",
+                "ts": (s.start - origin) * 1e6,
+                "dur": s.duration * 1e6,
+                "pid": pid,
+                "tid": s.thread_id,
+                "args": {key: str(value) for key, value in s.attributes.items()},
+            }
+        )
+    for thread_id, thread_name in threads.items():
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def summarize(spans: list[Span]) -> str:
+    """Return a table of the time spent per span name, slowest first."""
+    if not spans:
+        return "No spans recorded\n"
+    wall = max(s.start + s.duration for s in spans) - min(s.start for s in spans)
+    totals = {}
+    for s in spans:
+        count, total, longest = totals.get(s.name, (0, 0.0, 0.0))
+        totals[s.name] = (count + 1, total + s.duration, max(longest, s.duration))
+
+    header = f"{'span':<40} {'count':>7} {'total s':>10} {'mean s':>10} {'max s':>10} {'% wall':>7}"
+    lines = [header, "-" * len(header)]
+    for name, (count, total, longest) in sorted(
+        totals.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        lines.append(
+            f"{name[:40]:<40} {count:>7} {total:>10.3f} {total / count:>10.3f} "
+            f"{longest:>10.3f} {100 * total / wall if wall else 0:>7.1f}"
+        )
+    lines.append(f"\nWall time: {wall:.3f}s")
+    return "\n".join(lines) + "\n"
+
+
+def write_trace(output_dir: str):
+    """Write the current trace to the output dir, see Trace.write."""
+    current_trace().write(output_dir)
@@ -1,8 +1,11 @@
 # Description: Utility functions for the project.
 import os
+import subprocess
 
-# Those are the creation paths (files that get created during a run)
-PATH_PREFIX = ""
+from utils import tracing
+
+# Those are the creation paths (files that get created during a run), relative
+# to the output dir of the video, see workspace.Workspace
 RESEARCH = "research.yaml"
 SCRIPT = "script.yaml"
 SCRIPT_SUMMARY = "script_summary.txt"
@@ -13,6 +16,7 @@ VOICEOVER_WAV_FILE = "script.wav"
 FINAL_AUDIO_FILE = "audio.wav"
 VOICEOVER_TIMECODES = "voiceover_timecodes.txt"
 VOICEOVER_SUBTITLES = "voiceover.ass"
+VOICEOVER_TIMELINE = "timeline.jsonl"
 ANIMATION_VIDEO_FILE = "animation.mp4"
 TEMP_VIDEO_FILE = "temp_video.mp4"
 FINAL_VIDEO_FILE = "video.mp4"
@@ -35,66 +39,11 @@ YOUTUBE_DISTRIBUTOR_PATH = os.path.join(CAST_PATH_PREFIX, "youtube_distributors"
 PRODUCTION_CONFIG_PATH = os.path.join(CAST_PATH_PREFIX, "production_configs")
 
 PROGRAMS_PATH_PREFIX = os.environ.get("PROGRAMS_PATH_PREFIX", "programs")
-programs = [
-    f.split(".")[0] for f in os.listdir(PROGRAMS_PATH_PREFIX) if f.endswith(".yaml")
-]
-
-researchers = [
-    f.split(".")[0] for f in os.listdir(RESEARCHER_PATH) if f.endswith(".yaml")
-]
-script_writers = [
-    f.split(".")[0] for f in os.listdir(SCRIPT_WRITER_PATH) if f.endswith(".yaml")
-]
-storyboard_artists = [
-    f.split(".")[0] for f in os.listdir(STORYBOARD_ARTIST_PATH) if f.endswith(".yaml")
-]
-thumbnail_artists = [
-    f.split(".")[0] for f in os.listdir(THUMBNAIL_ARTIST_PATH) if f.endswith(".yaml")
-]
-animation_artists = [
-    f.split(".")[0] for f in os.listdir(ANIMATION_ARTIST_PATH) if f.endswith(".yaml")
-]
-voiceover_artists = [
-    f.split(".")[0] for f in os.listdir(VOICEOVER_ARTIST_PATH) if f.endswith(".yaml")
-]
-music_composers = [
-    f.split(".")[0] for f in os.listdir(MUSIC_COMPOSER_PATH) if f.endswith(".yaml")
-]
-youtube_distributors = [
-    f.split(".")[0] for f in os.listdir(YOUTUBE_DISTRIBUTOR_PATH) if f.endswith(".yaml")
-]
-production_configs = [
-    f.split(".")[0] for f in os.listdir(PRODUCTION_CONFIG_PATH) if f.endswith(".yaml")
-]
-
-
-def set_prefix(prefix):
-    """Set the prefix of the project."""
-    global PATH_PREFIX, RESEARCH, SCRIPT, STORYBOARD_PATH, VOICEOVER_PATH, VOICEOVER_WAV_FILE, FINAL_AUDIO_FILE, VOICEOVER_TIMECODES, VOICEOVER_SUBTITLES, ANIMATION_VIDEO_FILE, TEMP_VIDEO_FILE, FINAL_VIDEO_FILE, MUSIC_PATH, DISTRIBUTION_METADATA_FILE, THUMBNAILS_PATH, SCRIPT_SUMMARY
-
-    PATH_PREFIX = prefix
-    RESEARCH = os.path.join(prefix, RESEARCH.split("/")[-1])
-    SCRIPT = os.path.join(prefix, SCRIPT.split("/")[-1])
-    SCRIPT_SUMMARY = os.path.join(prefix, SCRIPT_SUMMARY.split("/")[-1])
-    VOICEOVER_WAV_FILE = os.path.join(prefix, VOICEOVER_WAV_FILE.split("/")[-1])
-    FINAL_AUDIO_FILE = os.path.join(prefix, FINAL_AUDIO_FILE.split("/")[-1])
-    VOICEOVER_TIMECODES = os.path.join(prefix, VOICEOVER_TIMECODES.split("/")[-1])
-    VOICEOVER_SUBTITLES = os.path.join(prefix, VOICEOVER_SUBTITLES.split("/")[-1])
-    ANIMATION_VIDEO_FILE = os.path.join(prefix, ANIMATION_VIDEO_FILE.split("/")[-1])
-    FINAL_VIDEO_FILE = os.path.join(prefix, FINAL_VIDEO_FILE.split("/")[-1])
-    TEMP_VIDEO_FILE = os.path.join(prefix, TEMP_VIDEO_FILE.split("/")[-1])
-    DISTRIBUTION_METADATA_FILE = os.path.join(
-        prefix, DISTRIBUTION_METADATA_FILE.split("/")[-1]
-    )
-
-    STORYBOARD_PATH = os.path.join(prefix, STORYBOARD_PATH.split("/")[-1])
-    os.makedirs(STORYBOARD_PATH, exist_ok=True)
-
-    VOICEOVER_PATH = os.path.join(prefix, VOICEOVER_PATH.split("/")[-1])
-    os.makedirs(VOICEOVER_PATH, exist_ok=True)
 
-    THUMBNAILS_PATH = os.path.join(prefix, THUMBNAILS_PATH.split("/")[-1])
-    os.makedirs(THUMBNAILS_PATH, exist_ok=True)
 
-    MUSIC_PATH = os.path.join(prefix, MUSIC_PATH.split("/")[-1])
-    os.makedirs(MUSIC_PATH, exist_ok=True)
+def run_command(cmd: str, name: str = "ffmpeg", **attributes):
+    """Run a shell command (usually ffmpeg) in a tracing span."""
+    with tracing.span(name, category="subprocess", command=cmd, **attributes) as span:
+        result = subprocess.run(cmd, shell=True)
+        span.set(returncode=result.returncode)
+    return result
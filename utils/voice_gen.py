@@ -1,6 +1,8 @@
 import os
+import contextlib
 from typing import Optional, Union, Dict
 import numpy as np
+from bark import generation
 from bark.generation import generate_coarse, generate_fine
 import json
 from bark import SAMPLE_RATE, api, text_to_semantic
@@ -12,10 +14,20 @@ from vocos import Vocos
 import whisper
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
+from utils import model_registry, tracing, fake_backend, bark_batch
 
 NEW_SAMPLE_RATE = 48000
-
-WHISPER_MODEL = None
+# The takes of a sentence sampled together, and the most sequences in a batch
+# (the GPU memory bounds it)
+TAKES_PER_BATCH = int(os.environ.get("AICP_BARK_TAKES_PER_BATCH", "4"))
+MAX_BATCH_SIZE = int(os.environ.get("AICP_BARK_BATCH_SIZE", "8"))
+# Reject the takes going over their duration, or degenerate, from their
+# semantic tokens, before the coarse, fine, Vocos and Whisper stages
+EARLY_REJECT = os.environ.get("AICP_BARK_EARLY_REJECT", "1") == "1"
+# A take shorter than this share of the estimated duration skipped words
+MIN_DURATION_RATIO = 0.3
+# A take repeating a token for longer than this is stuck (a hum or silence)
+MAX_REPEAT_S = 1.0
 
 
 def generate_ass(transcription_data, fontname, fontsize, alignment):
@@ -135,10 +147,12 @@ def compute_snr(audio_signal):
 
 def compute_similarity(str1, str2):
     # Load BERT model
-    model = SentenceTransformer("bert-base-nli-mean-tokens")
-
-    # Compute embeddings
-    embeddings = model.encode([str1, str2])
+    with model_registry.use(
+        "sentence-transformer-bert-base-nli-mean-tokens",
+        lambda: SentenceTransformer("bert-base-nli-mean-tokens"),
+    ) as model:
+        # Compute embeddings
+        embeddings = model.encode([str1, str2])
 
     # Compute cosine similarity
     cosine_sim = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
@@ -146,11 +160,42 @@ def compute_similarity(str1, str2):
     return cosine_sim * 100
 
 
-def get_whisper_model():
-    global WHISPER_MODEL
-    if WHISPER_MODEL is None:
-        WHISPER_MODEL = whisper.load_model("base.en")
-    return WHISPER_MODEL
+def use_whisper_model():
+    """Keep the whisper model loaded while in this context."""
+    if fake_backend.is_enabled():
+        return contextlib.nullcontext(fake_backend.FakeWhisper())
+    return model_registry.use("whisper-base.en", lambda: whisper.load_model("base.en"))
+
+
+def use_vocos_model():
+    """Keep the vocos model loaded while in this context."""
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return model_registry.use(
+        "vocos-encodec-24khz",
+        lambda: Vocos.from_pretrained("charactr/vocos-encodec-24khz").to(device),
+    )
+
+
+def _load_bark_models():
+    generation.preload_models()
+    return generation.models
+
+
+def _unload_bark_models(models):
+    # clean_models() deletes from the dict it iterates, clean them one by one
+    for model_key in list(generation.models):
+        generation.clean_models(model_key)
+
+
+def use_bark_models():
+    """Keep the bark models loaded while in this context.
+
+    bark keeps its models in a module global, the registry only decides when
+    they are loaded and cleaned up.
+    """
+    if fake_backend.is_enabled():
+        return contextlib.nullcontext()
+    return model_registry.use("bark", _load_bark_models, unload=_unload_bark_models)
 
 
 def non_silence_in_last_duration_audio(y, sr, duration_ms=250, silence_ratio=0.01):
@@ -212,30 +257,72 @@ def estimate_speech_duration_with_pauses(sentence, speaking_rate=150, comma_paus
 
 def generate_speech(sentence, history_prompt, text_temp, waveform_temp, speech_wpm):
     print(f"Generating sentence: {sentence}")
+    if fake_backend.is_enabled():
+        audio = fake_backend.fake_speech(sentence, speech_wpm, NEW_SAMPLE_RATE)
+        duration = len(audio) / NEW_SAMPLE_RATE
+        return (
+            audio,
+            False,
+            {
+                "sentence": sentence,
+                "transcribed_text": sentence,
+                "has_non_silence": False,
+                "text_similarity": 100.0,
+                "duration": duration,
+                "max_duration": duration / 0.8,
+                "text_temp": text_temp,
+                "waveform_temp": waveform_temp,
+                "history_prompt": history_prompt,
+                "snr": 24.0,
+            },
+        )
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    vocos = Vocos.from_pretrained("charactr/vocos-encodec-24khz").to(device)
-
-    semantic_tokens = text_to_semantic(
-        sentence, history_prompt=history_prompt, temp=text_temp, silent=True
-    )
-    audio_tokens = semantic_to_audio_tokens(
-        semantic_tokens,
-        history_prompt=history_prompt,
-        temp=waveform_temp,
-        silent=True,
-        output_full=False,
+    with tracing.span("bark semantic", category="tts"):
+        semantic_tokens = text_to_semantic(
+            sentence, history_prompt=history_prompt, temp=text_temp, silent=True
+        )
+    with tracing.span("bark coarse and fine", category="tts"):
+        audio_tokens = semantic_to_audio_tokens(
+            semantic_tokens,
+            history_prompt=history_prompt,
+            temp=waveform_temp,
+            silent=True,
+            output_full=False,
+        )
+    return review_take(
+        sentence,
+        decode_speech(audio_tokens),
+        history_prompt,
+        text_temp,
+        waveform_temp,
+        speech_wpm,
     )
-    audio_tokens_torch = torch.from_numpy(audio_tokens).to(device)
-    features = vocos.codes_to_features(audio_tokens_torch)
-    vocos_output = vocos.decode(features, bandwidth_id=torch.tensor([2], device=device))
-    audio_resampled = torchaudio.functional.resample(
+
+
+def decode_speech(audio_tokens: np.ndarray) -> torch.Tensor:
+    """Decode bark's fine tokens with Vocos, at NEW_SAMPLE_RATE."""
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    with use_vocos_model() as vocos:
+        audio_tokens_torch = torch.from_numpy(audio_tokens).to(device)
+        features = vocos.codes_to_features(audio_tokens_torch)
+        vocos_output = vocos.decode(
+            features, bandwidth_id=torch.tensor([2], device=device)
+        )
+    return torchaudio.functional.resample(
         vocos_output, orig_freq=SAMPLE_RATE, new_freq=NEW_SAMPLE_RATE
     )
+
+
+def review_take(
+    sentence, audio_resampled, history_prompt, text_temp, waveform_temp, speech_wpm
+):
+    """Transcribe and measure a take, returns (audio, is_bad, results)."""
     whisper_resampled = torchaudio.functional.resample(
         audio_resampled, orig_freq=NEW_SAMPLE_RATE, new_freq=16000
     )
-    transcribed_text = get_whisper_model().transcribe(whisper_resampled[0])["text"]
+    with use_whisper_model() as model:
+        with tracing.span("whisper transcribe", category="tts"):
+            transcribed_text = model.transcribe(whisper_resampled[0])["text"]
     text_similarity = compute_similarity(sentence, transcribed_text)
     audio = audio_resampled.cpu().numpy()[0]
     snr = compute_snr(audio)
@@ -307,8 +394,127 @@ def semantic_to_audio_tokens(
     return fine_tokens
 
 
-def generate_speech_as_takes(
-    sentence,
+def semantic_budget(sentence, speech_wpm) -> int:
+    """The most semantic tokens of a take not too long for review_take."""
+    max_duration = estimate_speech_duration_with_pauses(
+        sentence, speaking_rate=speech_wpm
+    )
+    return int(max_duration * generation.SEMANTIC_RATE_HZ)
+
+
+def reject_semantic(semantic_tokens, budget) -> Optional[str]:
+    """Why a take's semantic tokens are not worth decoding, None if they are."""
+    if semantic_tokens is None:
+        return "over length"
+    if len(semantic_tokens) < MIN_DURATION_RATIO * budget:
+        return "too short"
+    # The longest run of a single token
+    changes = np.flatnonzero(np.diff(semantic_tokens)) + 1
+    runs = np.diff(np.concatenate([[0], changes, [len(semantic_tokens)]]))
+    if runs.max() > MAX_REPEAT_S * generation.SEMANTIC_RATE_HZ:
+        return "repeating a token"
+    return None
+
+
+def generate_speech_batch(
+    sentences,
+    history_prompt,
+    text_temp,
+    waveform_temp,
+    speech_wpm,
+    capped=None,
+    seeds=None,
+):
+    """A take of every sentence, each bark stage runs once for all of them.
+
+    The sentences may repeat, for several takes of one. With EARLY_REJECT the
+    takes (those `capped`, by default all) stop at their semantic_budget and
+    the rejected ones aren't decoded. A take with a seed in `seeds` is sampled
+    from its own generator, it doesn't depend on the rest of the batch.
+    Returns a list of (audio, is_bad, results), None for the rejected takes
+    and those that ended before any speech.
+    """
+    if fake_backend.is_enabled():
+        return [
+            generate_speech(
+                sentence, history_prompt, text_temp, waveform_temp, speech_wpm
+            )
+            for sentence in sentences
+        ]
+
+    print(f"Generating {len(sentences)} takes of {len(set(sentences))} sentences")
+    if capped is None:
+        capped = [True] * len(sentences)
+    budgets = [
+        semantic_budget(sentence, speech_wpm) if EARLY_REJECT and is_capped else None
+        for sentence, is_capped in zip(sentences, capped)
+    ]
+    generators = None if seeds is None else bark_batch.seeded_generators(seeds)
+    with tracing.span("bark semantic", category="tts", batch=len(sentences)) as span:
+        semantic_tokens = bark_batch.generate_semantic(
+            sentences,
+            history_prompt=history_prompt,
+            temp=text_temp,
+            max_tokens=budgets,
+            generators=generators,
+        )
+        kept = []
+        for i, (tokens, budget) in enumerate(zip(semantic_tokens, budgets)):
+            reason = None if budget is None else reject_semantic(tokens, budget)
+            if reason is not None:
+                print(f"Rejected a take of {sentences[i]!r}: {reason}")
+            # Nothing to decode in a take ending on its first token
+            elif len(tokens):
+                kept.append(i)
+        span.set(rejected=len(sentences) - len(kept))
+    takes = [None] * len(sentences)
+    if not kept:
+        return takes
+    if generators is not None:
+        generators = [generators[i] for i in kept]
+    with tracing.span("bark coarse and fine", category="tts", batch=len(kept)):
+        coarse_tokens = bark_batch.generate_coarse(
+            [semantic_tokens[i] for i in kept],
+            history_prompt=history_prompt,
+            temp=waveform_temp,
+            generators=generators,
+        )
+        audio_tokens = bark_batch.generate_fine(
+            coarse_tokens,
+            history_prompt=history_prompt,
+            temp=0.5,
+            generators=generators,
+        )
+    for i, tokens in zip(kept, audio_tokens):
+        takes[i] = review_take(
+            sentences[i],
+            decode_speech(tokens),
+            history_prompt,
+            text_temp,
+            waveform_temp,
+            speech_wpm,
+        )
+    return takes
+
+
+def _take_seed(seed, take):
+    """The seed of a sentence's take, from the sentence's seed and its number."""
+    return int(np.random.SeedSequence([seed, take]).generate_state(1)[0])
+
+
+def _take_rank(take):
+    """Good takes first, then by text_similarity, snr and shortest duration."""
+    _, is_bad, results = take
+    return (
+        not is_bad,
+        results["text_similarity"],
+        results["snr"],
+        -results["duration"],
+    )
+
+
+def generate_sentences_as_takes(
+    sentences,
     history_prompt,
     text_temp,
     waveform_temp,
@@ -316,45 +522,118 @@ def generate_speech_as_takes(
     speech_wpm=150,
     save_all_takes=False,
     output_dir=None,
-    output_file_prefix=None,
+    output_file_prefixes=None,
+    on_best_take=None,
+    seeds=None,
 ):
-    current_take = 0
-    takes = []
-    take_to_save = None
-    while max_takes > 0:
-        audio, is_bad, results = generate_speech(
-            sentence, history_prompt, text_temp, waveform_temp, speech_wpm
-        )
-        if save_all_takes:
-            take_path = os.path.join(
-                output_dir, f"{output_file_prefix}_{current_take}.wav"
-            )
-            save_audio_signal_wav(audio, NEW_SAMPLE_RATE, take_path)
-            # Save results as well
-            results_path = take_path.replace(".wav", ".json")
-            with open(results_path, "w") as f:
-                json.dump(results, f, indent=4)
-
-        takes.append((audio, is_bad, results))
-        current_take += 1
-        if not is_bad:
-            take_to_save = (audio, is_bad, results)
+    """Record sentences of the same speaker, returns the best take of each.
+
+    The takes are sampled in batches of up to MAX_BATCH_SIZE, TAKES_PER_BATCH
+    at once for every sentence without a good take yet, until they all have
+    one or max_takes were made. The takes rejected early are made again, but
+    the last ones of a sentence without any take yet aren't capped, so there
+    is always a best take to keep.
+
+    `on_best_take(index, take)` is called as soon as the best take of a
+    sentence is final, e.g. to save it before the others are done. Given
+    `seeds`, one per sentence, every take is sampled from a generator seeded
+    with its sentence's seed and its number, so it only depends on those.
+    """
+    takes = [[] for _ in sentences]
+    attempts = [0] * len(sentences)
+    best_takes = [None] * len(sentences)
+
+    def needs_takes(i):
+        has_good_take = any(not is_bad for _, is_bad, _ in takes[i])
+        return not has_good_take and attempts[i] < max_takes
+
+    while True:
+        batch = []
+        for i in range(len(sentences)):
+            if needs_takes(i):
+                room = MAX_BATCH_SIZE - len(batch)
+                batch += [i] * min(TAKES_PER_BATCH, max_takes - attempts[i], room)
+            if len(batch) >= MAX_BATCH_SIZE:
+                break
+        if not batch:
             break
-        print(f"Doing another take... {max_takes} left")
-        max_takes -= 1
-
-    if take_to_save is None:
-        # If we get here, find the best take and use that
-        # Sorted by desc text_similarity, snr, then ascending duration
-        sorted_takes = sorted(
-            takes,
-            key=lambda x: (x[2]["text_similarity"], x[2]["snr"], -x[2]["duration"]),
-            reverse=True,
+        capped = [
+            bool(takes[i]) or attempts[i] + batch.count(i) < max_takes for i in batch
+        ]
+        take_seeds = (
+            None
+            if seeds is None
+            else [
+                _take_seed(seeds[i], attempts[i] + batch[:n].count(i))
+                for n, i in enumerate(batch)
+            ]
         )
-        take_to_save = sorted_takes[0]
-        print(f"Best take: {take_to_save[2]}")
 
-    return take_to_save
+        with tracing.span("tts takes", category="tts", takes=len(batch)) as span:
+            batch_takes = generate_speech_batch(
+                [sentences[i] for i in batch],
+                history_prompt,
+                text_temp,
+                waveform_temp,
+                speech_wpm,
+                capped=capped,
+                seeds=take_seeds,
+            )
+            span.set(bad=sum(take is None or take[1] for take in batch_takes))
+        for i, take in zip(batch, batch_takes):
+            current_take = attempts[i]
+            attempts[i] += 1
+            if take is None:
+                continue
+            if save_all_takes:
+                audio, _, results = take
+                take_path = os.path.join(
+                    output_dir, f"{output_file_prefixes[i]}_{current_take}.wav"
+                )
+                save_audio_signal_wav(audio, NEW_SAMPLE_RATE, take_path)
+                # Save results as well
+                results_path = take_path.replace(".wav", ".json")
+                with open(results_path, "w") as f:
+                    json.dump(results, f, indent=4)
+            takes[i].append(take)
+
+        for i in sorted(set(batch)):
+            if needs_takes(i):
+                continue
+            if not takes[i]:
+                raise RuntimeError(
+                    f"No take of {sentences[i]!r} in {max_takes} attempts"
+                )
+            best_takes[i] = max(takes[i], key=_take_rank)
+            print(f"Best take of {len(takes[i])}: {best_takes[i][2]}")
+            if on_best_take is not None:
+                on_best_take(i, best_takes[i])
+    return best_takes
+
+
+def generate_speech_as_takes(
+    sentence,
+    history_prompt,
+    text_temp,
+    waveform_temp,
+    max_takes=100,
+    speech_wpm=150,
+    save_all_takes=False,
+    output_dir=None,
+    output_file_prefix=None,
+):
+    """Record a sentence, returns its best take, see generate_sentences_as_takes."""
+    return generate_sentences_as_takes(
+        [sentence],
+        history_prompt,
+        text_temp,
+        waveform_temp,
+        max_takes=max_takes,
+        speech_wpm=speech_wpm,
+        save_all_takes=save_all_takes,
+        output_dir=output_dir,
+        output_file_prefixes=[output_file_prefix],
+    )[0]
 
 
 def save_audio_signal_wav(audio_signal, sample_rate, output_file):
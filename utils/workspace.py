@@ -0,0 +1,94 @@
+"""The paths of the artifacts produced while making a video.
+
+Every video has its own Workspace (`video.workspace`), rooted at its output
+dir, so several videos can be made in the same process.
+"""
+import os
+from dataclasses import dataclass
+
+from utils import utils
+
+
+@dataclass(frozen=True)
+class Workspace:
+    """The artifact paths of a video, all inside its output dir."""
+
+    root: str
+
+    def path(self, *parts: str) -> str:
+        """A path inside the workspace."""
+        return os.path.join(self.root, *parts)
+
+    def create(self):
+        """Create the output dir and its sub directories."""
+        for directory in (
+            self.storyboard_path,
+            self.voiceover_path,
+            self.thumbnails_path,
+            self.music_path,
+        ):
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def research(self) -> str:
+        return self.path(utils.RESEARCH)
+
+    @property
+    def script(self) -> str:
+        return self.path(utils.SCRIPT)
+
+    @property
+    def script_summary(self) -> str:
+        return self.path(utils.SCRIPT_SUMMARY)
+
+    @property
+    def storyboard_path(self) -> str:
+        return self.path(utils.STORYBOARD_PATH)
+
+    @property
+    def voiceover_path(self) -> str:
+        return self.path(utils.VOICEOVER_PATH)
+
+    @property
+    def thumbnails_path(self) -> str:
+        return self.path(utils.THUMBNAILS_PATH)
+
+    @property
+    def voiceover_wav_file(self) -> str:
+        return self.path(utils.VOICEOVER_WAV_FILE)
+
+    @property
+    def final_audio_file(self) -> str:
+        return self.path(utils.FINAL_AUDIO_FILE)
+
+    @property
+    def voiceover_timecodes(self) -> str:
+        return self.path(utils.VOICEOVER_TIMECODES)
+
+    @property
+    def voiceover_timeline(self) -> str:
+        return self.path(utils.VOICEOVER_PATH, utils.VOICEOVER_TIMELINE)
+
+    @property
+    def voiceover_subtitles(self) -> str:
+        return self.path(utils.VOICEOVER_SUBTITLES)
+
+    @property
+    def animation_video_file(self) -> str:
+        return self.path(utils.ANIMATION_VIDEO_FILE)
+
+    @property
+    def temp_video_file(self) -> str:
+        return self.path(utils.TEMP_VIDEO_FILE)
+
+    @property
+    def final_video_file(self) -> str:
+        return self.path(utils.FINAL_VIDEO_FILE)
+
+    @property
+    def music_path(self) -> str:
+        return self.path(utils.MUSIC_PATH)
+
+    @property
+    def distribution_metadata_file(self) -> str:
+        return self.path(utils.DISTRIBUTION_METADATA_FILE)